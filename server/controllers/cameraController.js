@@ -65,7 +65,8 @@ exports.processFrame = async (req, res) => {
       const detectionResults = await opencvService.detectOccupancy(
         tempFilePath,
         slotsData,
-        parkingLot.cameraThreshold
+        parkingLot.cameraThreshold,
+        parkingLot.cameraCalibration
       );
 
       // Update slots in database
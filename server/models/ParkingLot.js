@@ -54,7 +54,7 @@ const parkingLotSchema = new mongoose.Schema({
   },
   cameraSourceType: {
     type: String,
-    enum: ['webcam', 'ip_camera', 'file', 'image'],
+    enum: ['webcam', 'ip_camera', 'file', 'image', 'replay'],
     default: 'file',
   },
   cameraEnabled: {
@@ -67,6 +67,19 @@ const parkingLotSchema = new mongoose.Schema({
     min: 0,
     max: 1,
   },
+  cameraCalibration: {
+    // Optional lens calibration sent with detection requests:
+    // { camera_matrix: [[fx, 0, cx], [0, fy, cy], [0, 0, 1]],
+    //   dist_coeffs: [k1, k2, p1, p2, k3], image_width, image_height }
+    type: Object,
+    default: null,
+  },
+  cameraResultVersion: {
+    // Version token of the last camera detection; sent back as "since" so
+    // the OpenCV service only returns slots whose status changed
+    type: String,
+    default: null,
+  },
   isActive: {
     type: Boolean,
     default: true,
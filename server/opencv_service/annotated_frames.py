@@ -0,0 +1,185 @@
+"""
+Annotated Frames - Render and cache lot images with slots colored by status
+
+Renders the frame with each slot's polygon and ID (the SlotSelector drawing
+style) colored by its detection status, encodes it once to JPEG at the
+requested size/quality, and caches the encoded bytes keyed by frame id +
+result hash. Concurrent requests for the same view wait for the single
+in-flight render instead of repeating it.
+"""
+import hashlib
+import json
+import threading
+from collections import OrderedDict
+from typing import Callable, Dict, Any, List, Optional, Tuple
+
+import cv2
+import numpy as np
+from memory_budget import accountant
+from occupancy_detector import slot_pixel_coordinates
+from utils import draw_slot_polygon
+
+# BGR colors per status
+STATUS_COLORS = {
+    'vacant': (0, 200, 0),
+    'occupied': (0, 0, 255),
+    'unknown': (0, 215, 255),
+    'error': (128, 128, 128)
+}
+
+
+def result_hash(results: List[Dict[str, Any]]) -> str:
+    """Stable hash of what an annotated view shows (slot ids and statuses)"""
+    digest = hashlib.sha1()
+    for result in results:
+        digest.update(f"{result.get('slot_id', '')}={result.get('status', '')};".encode())
+    return digest.hexdigest()[:16]
+
+
+def layout_hash(slots: List[Dict[str, Any]]) -> str:
+    """Stable hash of a slot layout"""
+    return hashlib.sha1(json.dumps(slots, sort_keys=True).encode()).hexdigest()[:16]
+
+
+def render_annotated(frame: np.ndarray, slots: List[Dict[str, Any]], results: List[Dict[str, Any]],
+                     width: Optional[int] = None, scale: int = 1) -> np.ndarray:
+    """
+    Draw slot polygons, IDs and status colors on a frame.
+
+    The frame is resized to the output width first, so drawing cost
+    depends on the output size rather than the camera resolution.
+
+    Args:
+        frame: BGR frame (not modified)
+        slots: Slot definitions
+        results: Detection results (matched to slots by slot_id)
+        width: Output width in pixels (defaults to the frame width)
+        scale: Factor by which frame is reduced relative to the slots' image size
+
+    Returns:
+        Annotated BGR image
+    """
+    height, frame_width = frame.shape[:2]
+    if width and width != frame_width:
+        out_height = max(1, int(round(height * width / frame_width)))
+        canvas = cv2.resize(frame, (width, out_height), interpolation=cv2.INTER_AREA)
+        scale = scale * frame_width / width
+    else:
+        canvas = frame.copy()
+    if canvas.ndim == 2:
+        canvas = cv2.cvtColor(canvas, cv2.COLOR_GRAY2BGR)
+
+    out_height, out_width = canvas.shape[:2]
+    thickness = max(1, int(round(out_width / 960)))
+    font_scale = max(0.35, out_width / 3840)
+    status_by_id = {r.get('slot_id'): r.get('status', 'unknown') for r in results}
+    for index, slot in enumerate(slots):
+        coords = slot_pixel_coordinates(slot, out_width, out_height, scale)
+        if len(coords) < 3:
+            continue
+        status = status_by_id.get(slot.get('slot_id'), 'unknown')
+        label = slot.get('slot_id') or f"S{index + 1}"
+        draw_slot_polygon(canvas, coords, label, STATUS_COLORS.get(status, STATUS_COLORS['unknown']),
+                          thickness, font_scale)
+    return canvas
+
+
+def encode_jpeg(image: np.ndarray, quality: int = 80) -> bytes:
+    ok, buffer = cv2.imencode('.jpg', image, [cv2.IMWRITE_JPEG_QUALITY, int(quality)])
+    if not ok:
+        raise ValueError("Could not encode annotated frame")
+    return buffer.tobytes()
+
+
+class RenderCache:
+    """Size-bounded LRU cache with single-flight creation of missing entries"""
+
+    def __init__(self, max_bytes: int = 64 * 1024 * 1024, max_entries: int = 256,
+                 component: Optional[str] = None):
+        """
+        Initialize the cache.
+
+        Args:
+            max_bytes: Size limit of the cached values
+            max_entries: Entry limit
+            component: Name under which entries are registered with the
+                memory accountant (None: not accounted)
+        """
+        self.max_bytes = max_bytes
+        self.max_entries = max_entries
+        self.component = component
+        self._entries: "OrderedDict[Any, Tuple[Any, int]]" = OrderedDict()
+        self._inflight: Dict[Any, threading.Event] = {}
+        self._lock = threading.Lock()
+        self.bytes = 0
+        self.hits = 0
+        self.misses = 0
+
+    def get_or_create(self, key: Any, create: Callable[[], Any],
+                      size: Callable[[Any], int] = len) -> Tuple[Any, bool]:
+        """
+        Return the cached value for key, creating it once if missing.
+
+        Args:
+            key: Cache key
+            create: Builds the value on a miss (called by one thread only)
+            size: Size of a value in bytes
+
+        Returns:
+            (value, hit)
+        """
+        while True:
+            with self._lock:
+                entry = self._entries.get(key)
+                if entry is not None:
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    if self.component:
+                        accountant.touch(self.component, key)
+                    return entry[0], True
+                waiter = self._inflight.get(key)
+                if waiter is None:
+                    waiter = self._inflight[key] = threading.Event()
+                    break
+            # Another thread is creating this entry; wait for it and re-check
+            waiter.wait()
+
+        try:
+            value = create()
+            with self._lock:
+                self.misses += 1
+                self._store(key, value, size(value))
+            if self.component:
+                accountant.enforce()
+            return value, False
+        finally:
+            with self._lock:
+                self._inflight.pop(key, None)
+            waiter.set()
+
+    def _store(self, key: Any, value: Any, nbytes: int):
+        """Insert an entry and evict least recently used ones (lock held)"""
+        if nbytes > self.max_bytes:
+            return
+        old = self._entries.pop(key, None)
+        if old is not None:
+            self.bytes -= old[1]
+        self._entries[key] = (value, nbytes)
+        self.bytes += nbytes
+        if self.component:
+            accountant.track(self.component, key, nbytes, lambda: self._discard(key), enforce=False)
+        while self._entries and (self.bytes > self.max_bytes or len(self._entries) > self.max_entries):
+            evicted_key, (_, evicted) = self._entries.popitem(last=False)
+            self.bytes -= evicted
+            if self.component:
+                accountant.untrack(self.component, evicted_key)
+
+    def _discard(self, key: Any):
+        """Drop an entry evicted by the memory accountant"""
+        with self._lock:
+            entry = self._entries.pop(key, None)
+            if entry is not None:
+                self.bytes -= entry[1]
+
+    def stats(self) -> Dict[str, int]:
+        return {"entries": len(self._entries), "bytes": self.bytes, "hits": self.hits, "misses": self.misses}
@@ -0,0 +1,292 @@
+"""
+Batch Detect - Offline occupancy detection over directories of images and videos
+
+Runs OccupancyDetector on every image and video matched by the inputs
+(directories, globs or files) using a process pool, and streams the results
+to CSV or JSON Lines as each file completes. Videos are sampled every
+--stride frames.
+
+Interrupted runs can be resumed: after all rows of a file are written, the
+output size and file path are appended to a progress file next to the
+output (<output>.progress). With --resume, completed files are skipped and
+failed files are retried: their error rows and the rows of a file that was
+cut off are dropped from the output, so every file appears once.
+
+Usage:
+    python batch_detect.py <slots_json> <input> [<input> ...] --output results.csv [options]
+
+Example:
+    python batch_detect.py lot_slots.json archive/2024-05/ "archive/cam2/*.mp4" \\
+        --stride 30 --output may.jsonl --workers 8 --resume
+"""
+import argparse
+import csv
+import glob
+import io
+import json
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, FIRST_COMPLETED, wait
+from typing import List, Dict, Any, Optional, Set, Tuple
+
+from occupancy_detector import OccupancyDetector
+from utils import VIDEO_EXTENSIONS, IMAGE_EXTENSIONS
+
+CSV_FIELDS = ['file', 'frame', 'timestamp_ms', 'slot_id', 'slot_number', 'status',
+              'occupancy_ratio', 'confidence', 'error']
+
+# Per-worker state, filled by _init_worker
+_detector: Optional[OccupancyDetector] = None
+_slots: List[Dict[str, Any]] = []
+
+
+def collect_files(inputs: List[str], recursive: bool = False) -> List[str]:
+    """
+    Expand directories and glob patterns into a sorted list of media files.
+
+    Args:
+        inputs: Files, directories or glob patterns
+        recursive: Descend into subdirectories of directory inputs
+
+    Returns:
+        Absolute paths of images and videos, without duplicates
+    """
+    extensions = set(VIDEO_EXTENSIONS + IMAGE_EXTENSIONS)
+    files = set()
+    for item in inputs:
+        if os.path.isdir(item):
+            if recursive:
+                paths = [os.path.join(root, name) for root, _, names in os.walk(item) for name in names]
+            else:
+                paths = [os.path.join(item, name) for name in os.listdir(item)]
+        else:
+            paths = glob.glob(item, recursive=True) or ([item] if os.path.isfile(item) else [])
+        for path in paths:
+            if os.path.isfile(path) and os.path.splitext(path.lower())[1] in extensions:
+                files.add(os.path.abspath(path))
+    return sorted(files)
+
+
+def _init_worker(slots: List[Dict[str, Any]], threshold: float, decode_scale: int):
+    global _detector, _slots
+    _detector = OccupancyDetector(threshold=threshold, decode_scale=decode_scale)
+    _slots = slots
+
+
+def process_file(path: str, stride: int = 1, max_frames: Optional[int] = None) -> List[Dict[str, Any]]:
+    """
+    Detect occupancy in one file (runs in a worker process).
+
+    Returns:
+        One entry per analyzed frame: {"frame", "timestamp_ms", "results"}
+        (images produce a single entry with frame 0)
+    """
+    if os.path.splitext(path.lower())[1] in VIDEO_EXTENSIONS:
+        return list(_detector.detect_video(path, _slots, frame_stride=stride, max_frames=max_frames))
+    return [{"frame": 0, "timestamp_ms": None, "results": _detector.detect_occupancy(path, _slots)}]
+
+
+def format_rows(path: str, frames: List[Dict[str, Any]], output_format: str,
+                error: Optional[str] = None) -> str:
+    """Serialize the results of one file as CSV rows or JSON lines"""
+    if output_format == 'jsonl':
+        if error is not None:
+            return json.dumps({"file": path, "error": error}) + "\n"
+        return "".join(json.dumps({"file": path, **frame}) + "\n" for frame in frames)
+
+    buffer = io.StringIO()
+    writer = csv.DictWriter(buffer, fieldnames=CSV_FIELDS, extrasaction='ignore', lineterminator='\n')
+    if error is not None:
+        writer.writerow({"file": path, "error": error})
+    for frame in frames:
+        for result in frame["results"]:
+            writer.writerow({
+                "file": path,
+                "frame": frame["frame"],
+                "timestamp_ms": frame["timestamp_ms"],
+                **result,
+                "error": result.get("error", "")
+            })
+    return buffer.getvalue()
+
+
+def resume_output(output_path: str, progress_path: str, header_size: int) -> Set[str]:
+    """
+    Prepare the output of a previous run for resuming.
+
+    Rows of completed files are kept. Error rows of failed files (which are
+    retried) and rows written after the last file in the progress file are
+    dropped, and the progress file is rewritten to match the output.
+
+    Args:
+        output_path: Output of the previous run
+        progress_path: Its progress file
+        header_size: Size of the output's header (CSV field names)
+
+    Returns:
+        Completed file paths
+    """
+    # (start, end, path) of every completed file's rows
+    kept: List[Tuple[int, int, str]] = []
+    start = header_size
+    if os.path.exists(progress_path):
+        with open(progress_path) as f:
+            for line in f:
+                parts = line.rstrip('\n').split('\t', 2)
+                if len(parts) != 3:
+                    continue  # torn last line
+                end = int(parts[0])
+                if parts[1] == 'ok':
+                    kept.append((start, end, parts[2]))
+                start = end
+
+    if not kept or not os.path.exists(output_path):
+        for path in (output_path, progress_path):
+            if os.path.exists(path):
+                os.remove(path)
+        return set()
+
+    if all(kept[i][1] == kept[i + 1][0] for i in range(len(kept) - 1)) and kept[0][0] == header_size:
+        # No failed files in between: drop the tail only
+        with open(output_path, 'r+b') as f:
+            f.truncate(kept[-1][1])
+        return {path for _, _, path in kept}
+
+    # Copy the header and completed files' rows, skipping error rows
+    with open(output_path, 'rb') as src, open(output_path + '.tmp', 'wb') as dst, \
+            open(progress_path + '.tmp', 'w') as progress:
+        dst.write(src.read(header_size))
+        for start, end, path in kept:
+            src.seek(start)
+            remaining = end - start
+            while remaining > 0:
+                chunk = src.read(min(remaining, 1 << 20))
+                if not chunk:
+                    break
+                dst.write(chunk)
+                remaining -= len(chunk)
+            progress.write(f"{dst.tell()}\tok\t{path}\n")
+    os.replace(output_path + '.tmp', output_path)
+    os.replace(progress_path + '.tmp', progress_path)
+    return {path for _, _, path in kept}
+
+
+def run_batch(slots: List[Dict[str, Any]], files: List[str], output_path: str,
+              output_format: str = 'csv', stride: int = 1, max_frames: Optional[int] = None,
+              threshold: float = 0.15, decode_scale: int = 1, workers: Optional[int] = None,
+              resume: bool = False) -> Dict[str, int]:
+    """
+    Process files in parallel and stream their results to output_path.
+
+    Args:
+        slots: Slot definitions
+        files: Media files to process
+        output_path: CSV or JSON Lines output
+        output_format: 'csv' or 'jsonl'
+        stride: Analyze every stride-th video frame
+        max_frames: Analyze at most this many frames per video
+        threshold: Occupancy threshold
+        decode_scale: Reduced-size decode factor (1, 2, 4 or 8)
+        workers: Process pool size (defaults to the CPU count)
+        resume: Skip files completed by a previous run with the same output
+            and retry its failed files (see resume_output)
+
+    Returns:
+        Counts of processed, failed and skipped files
+    """
+    progress_path = output_path + '.progress'
+    header = ','.join(CSV_FIELDS) + '\n' if output_format == 'csv' else ''
+    if resume:
+        completed = resume_output(output_path, progress_path, len(header.encode()))
+    else:
+        completed = set()
+        for path in (output_path, progress_path):
+            if os.path.exists(path):
+                os.remove(path)
+    pending = [path for path in files if path not in completed]
+    stats = {"processed": 0, "failed": 0, "skipped": len(files) - len(pending)}
+
+    workers = workers or os.cpu_count() or 1
+    with open(output_path, 'a', newline='') as out, open(progress_path, 'a') as progress, \
+            ProcessPoolExecutor(max_workers=workers, initializer=_init_worker,
+                                initargs=(slots, threshold, decode_scale)) as pool:
+        if out.tell() == 0 and output_format == 'csv':
+            csv.writer(out, lineterminator='\n').writerow(CSV_FIELDS)
+
+        queue = iter(pending)
+        running = {}
+        # Keep a bounded number of files in flight so huge archives don't
+        # create one future per file up front
+        while True:
+            while len(running) < workers * 2:
+                path = next(queue, None)
+                if path is None:
+                    break
+                running[pool.submit(process_file, path, stride, max_frames)] = path
+            if not running:
+                break
+
+            done, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in done:
+                path = running.pop(future)
+                try:
+                    out.write(format_rows(path, future.result(), output_format))
+                    status = 'ok'
+                    stats["processed"] += 1
+                except Exception as e:
+                    out.write(format_rows(path, [], output_format, error=str(e)))
+                    status = 'error'
+                    stats["failed"] += 1
+                    print(f"Error processing {path}: {e}")
+                out.flush()
+                progress.write(f"{out.tell()}\t{status}\t{path}\n")
+                progress.flush()
+
+                finished = stats["processed"] + stats["failed"]
+                print(f"[{finished}/{len(pending)}] {os.path.basename(path)} {status}", flush=True)
+    return stats
+
+
+def main():
+    """Main entry point for command-line usage"""
+    parser = argparse.ArgumentParser(description="Run occupancy detection over directories of images and videos")
+    parser.add_argument('slots', help="Slots JSON written by slot_selector.py")
+    parser.add_argument('inputs', nargs='+', help="Files, directories or glob patterns")
+    parser.add_argument('--output', required=True, help="Output file (.csv or .jsonl)")
+    parser.add_argument('--format', choices=['csv', 'jsonl'], help="Output format (default: from extension)")
+    parser.add_argument('--stride', type=int, default=1, help="Analyze every Nth video frame")
+    parser.add_argument('--max-frames', type=int, default=None, help="Frames analyzed per video")
+    parser.add_argument('--threshold', type=float, default=0.15)
+    parser.add_argument('--decode-scale', type=int, default=1, choices=[1, 2, 4, 8])
+    parser.add_argument('--workers', type=int, default=None, help="Process pool size (default: CPU count)")
+    parser.add_argument('--recursive', action='store_true', help="Descend into subdirectories")
+    parser.add_argument('--resume', action='store_true', help="Continue an interrupted run")
+    args = parser.parse_args()
+
+    output_format = args.format or ('jsonl' if args.output.lower().endswith(('.jsonl', '.json')) else 'csv')
+    try:
+        with open(args.slots) as f:
+            slots = json.load(f)['slots']
+        files = collect_files(args.inputs, args.recursive)
+        if not files:
+            raise ValueError("No images or videos found")
+        print(f"Processing {len(files)} files with {args.workers or os.cpu_count()} workers...")
+        started = time.time()
+        stats = run_batch(slots, files, args.output, output_format,
+                          stride=args.stride, max_frames=args.max_frames,
+                          threshold=args.threshold, decode_scale=args.decode_scale,
+                          workers=args.workers, resume=args.resume)
+    except Exception as e:
+        print(f"Error: {e}")
+        sys.exit(1)
+
+    print(f"\nDone in {time.time() - started:.1f}s: {stats['processed']} processed, "
+          f"{stats['failed']} failed, {stats['skipped']} skipped (already completed)")
+    print(f"Results saved to {args.output}")
+    if stats["failed"]:
+        sys.exit(2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,74 @@
+"""
+Benchmark detection response encodings
+
+Encodes synthetic detection results for lots of various sizes in every
+layout/encoding combination offered by encoding.py (plus Flask's jsonify
+path as the baseline) and reports encode time and bytes per slot.
+
+Usage:
+    python bench_encoding.py [--slots 100,1000,5000] [--repeat 20]
+"""
+import argparse
+import json
+import random
+import time
+from typing import Dict, Any, List, Callable
+
+from encoding import encode_results, dumps_json, orjson, msgpack
+
+
+def synthetic_results(count: int, seed: int = 0) -> List[Dict[str, Any]]:
+    """Results shaped like OccupancyDetector output"""
+    rng = random.Random(seed)
+    results = []
+    for i in range(count):
+        ratio = rng.random() * 0.5
+        results.append({
+            "slot_id": f"S{i + 1}",
+            "slot_number": i + 1,
+            "status": "occupied" if ratio > 0.15 else "vacant",
+            "occupancy_ratio": ratio,
+            "white_pixel_count": int(ratio * 30000),
+            "total_area": 30000,
+            "confidence": min(abs(ratio - 0.15) / 0.15, 1.0)
+        })
+    return results
+
+
+def time_encoder(encode: Callable[[], bytes], repeat: int) -> Dict[str, float]:
+    body = encode()
+    started = time.perf_counter()
+    for _ in range(repeat):
+        encode()
+    return {"ms": (time.perf_counter() - started) * 1000 / repeat, "bytes": len(body)}
+
+
+def main():
+    """Main entry point for command-line usage"""
+    parser = argparse.ArgumentParser(description="Benchmark detection response encodings")
+    parser.add_argument('--slots', default="100,1000,5000", help="Lot sizes to benchmark")
+    parser.add_argument('--repeat', type=int, default=20)
+    args = parser.parse_args()
+
+    print(f"orjson: {'yes' if orjson else 'no'}, msgpack: {'yes' if msgpack else 'no'}\n")
+    print(f"{'slots':>6} {'format':<22} {'encode ms':>10} {'bytes':>9} {'bytes/slot':>11}")
+    for count in [int(v) for v in args.slots.split(',')]:
+        payload = {"success": True, "results": synthetic_results(count)}
+        encoders = {
+            # What jsonify does (stdlib json, compact separators)
+            "json (stdlib)": lambda: json.dumps(payload, separators=(',', ':')).encode(),
+            "json": lambda: dumps_json(payload),
+            "json columnar": lambda: encode_results(payload, 'columnar', 'json')[0]
+        }
+        if msgpack is not None:
+            encoders["msgpack"] = lambda: encode_results(payload, 'records', 'msgpack')[0]
+            encoders["msgpack columnar"] = lambda: encode_results(payload, 'columnar', 'msgpack')[0]
+        for name, encode in encoders.items():
+            stats = time_encoder(encode, args.repeat)
+            print(f"{count:>6} {name:<22} {stats['ms']:>10.3f} {stats['bytes']:>9} "
+                  f"{stats['bytes'] / count:>11.1f}")
+        print()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,80 @@
+"""
+Benchmark detection engines against each other
+
+Learns the reference engine from empty-lot images, then runs every engine
+on the same frames and reports per-frame detection time (decode excluded)
+and how often each engine agrees with the adaptive engine.
+
+Usage:
+    python bench_engines.py <slots_json> --reference empty1.jpg [empty2.jpg ...] \\
+        --frames frame1.jpg frame2.jpg ... [--repeat 5] [--decode-scale 1]
+"""
+import argparse
+import json
+import sys
+import time
+from typing import Dict, Any, List
+
+from occupancy_detector import OccupancyDetector
+from utils import load_image
+
+
+def main():
+    """Main entry point for command-line usage"""
+    parser = argparse.ArgumentParser(description="Compare detection engines for speed and agreement")
+    parser.add_argument('slots', help="Slots JSON written by slot_selector.py")
+    parser.add_argument('--reference', nargs='+', required=True, help="Images of the empty lot")
+    parser.add_argument('--frames', nargs='+', required=True, help="Frames to evaluate")
+    parser.add_argument('--repeat', type=int, default=5, help="Timed runs per frame")
+    parser.add_argument('--decode-scale', type=int, default=1, choices=[1, 2, 4, 8])
+    parser.add_argument('--diff-threshold', type=float, default=0.08, help="Reference engine threshold")
+    parser.add_argument('--margin', type=float, default=0.5, help="Cascade engine confidence margin")
+    args = parser.parse_args()
+
+    try:
+        with open(args.slots) as f:
+            slots = json.load(f)['slots']
+        scale = args.decode_scale
+        detectors = {
+            "adaptive": OccupancyDetector(decode_scale=scale),
+            "reference": OccupancyDetector(decode_scale=scale, engine='reference',
+                                           engine_options={"diff_threshold": args.diff_threshold,
+                                                           "auto_update": False}),
+            "cascade": OccupancyDetector(decode_scale=scale, engine='cascade',
+                                         engine_options={"margin": args.margin})
+        }
+        for path in args.reference:
+            detectors["reference"].learn(path, slots)
+        frames = [load_image(path, grayscale=True, scale=scale) for path in args.frames]
+    except Exception as e:
+        print(f"Error: {e}")
+        sys.exit(1)
+
+    timings: Dict[str, float] = {}
+    statuses: Dict[str, List[List[str]]] = {}
+    refined: Dict[str, int] = {}
+    for name, detector in detectors.items():
+        detector.detect_occupancy_frame(frames[0], slots, scale=scale)  # warm-up
+        started = time.perf_counter()
+        outputs = []
+        for frame in frames:
+            for _ in range(args.repeat):
+                results = detector.detect_occupancy_frame(frame, slots, scale=scale)
+            outputs.append([r['status'] for r in results])
+            refined[name] = refined.get(name, 0) + sum(r.get('stage') == 'fine' for r in results)
+        timings[name] = (time.perf_counter() - started) * 1000 / (len(frames) * args.repeat)
+        statuses[name] = outputs
+
+    baseline = statuses["adaptive"]
+    total = sum(len(frame) for frame in baseline)
+    print(f"{len(frames)} frames x {len(slots)} slots, decode scale {scale}\n")
+    print(f"{'engine':<10} {'ms/frame':>9} {'speedup':>8} {'agreement':>10} {'unknown':>8} {'refined':>8}")
+    for name, outputs in statuses.items():
+        agree = sum(a == b for frame_a, frame_b in zip(outputs, baseline) for a, b in zip(frame_a, frame_b))
+        unknown = sum(s == 'unknown' for frame in outputs for s in frame)
+        print(f"{name:<10} {timings[name]:>9.2f} {timings['adaptive'] / timings[name]:>7.1f}x "
+              f"{agree / total:>10.2%} {unknown:>8} {refined.get(name, 0) / total:>8.1%}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,320 @@
+"""
+Calibrate - Parameter sweep for OccupancyDetector over labeled frames
+
+Evaluates a grid of detector parameters (threshold, adaptive threshold block
+size and C, median blur size, dilation size) against frames with ground-truth
+slot labels and reports accuracy and per-frame cost for every combination.
+
+Intermediate results are shared across the grid:
+    - each frame is decoded and blurred once
+    - adaptive thresholding runs once per (block size, C)
+    - median blur once per (block size, C, median size)
+    - slot pixel counts once per pipeline, and every threshold is evaluated
+      from the same counts
+(block size, C) groups run in parallel across a process pool.
+
+Usage:
+    python calibrate.py <labels_json> [options]
+
+Labels file:
+    {
+        "slots_path": "slots.json"  (or inline "slots": [...]),
+        "frames": [
+            {"image_path": "frame1.jpg", "labels": {"S1": "occupied", "S2": "vacant"}},
+            ...
+        ]
+    }
+
+Example:
+    python calibrate.py labels.json --block-sizes 15,25,35 --c 8,12,16 \\
+        --target-accuracy 0.95 --output report.json
+"""
+import argparse
+import json
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from itertools import product
+from typing import List, Dict, Any, Optional, Tuple
+
+import cv2
+import numpy as np
+from occupancy_detector import slot_pixel_coordinates, polygon_area
+from utils import load_image, build_region_mask
+
+# Per-worker state, filled by _init_worker
+_frames: List[np.ndarray] = []
+_regions: List[List[Tuple]] = []
+
+
+def load_labels(labels_path: str) -> Tuple[List[Dict[str, Any]], List[Dict[str, Any]]]:
+    """
+    Load slot definitions and labeled frames.
+
+    Args:
+        labels_path: Path to the labels JSON file
+
+    Returns:
+        (slots, frames) - frames have image_path and labels {slot_id: bool occupied}
+    """
+    with open(labels_path) as f:
+        spec = json.load(f)
+    base_dir = os.path.dirname(os.path.abspath(labels_path))
+
+    slots = spec.get('slots')
+    if slots is None:
+        slots_path = os.path.join(base_dir, spec['slots_path'])
+        with open(slots_path) as f:
+            slots = json.load(f)['slots']
+
+    frames = []
+    for frame in spec['frames']:
+        labels = {}
+        for slot_id, label in frame['labels'].items():
+            labels[slot_id] = label in ('occupied', True, 1, '1')
+        frames.append({
+            "image_path": os.path.join(base_dir, frame['image_path']),
+            "labels": labels
+        })
+    return slots, frames
+
+
+def _init_worker(image_paths: List[str], slots: List[Dict[str, Any]]):
+    """Decode and blur every frame once per worker; rasterize slot masks once"""
+    global _frames, _regions
+    _frames, _regions = [], []
+    for path in image_paths:
+        gray = load_image(path, grayscale=True)
+        _frames.append(cv2.GaussianBlur(gray, (3, 3), 1))
+        height, width = gray.shape[:2]
+        regions = []
+        for slot in slots:
+            coords = slot_pixel_coordinates(slot, width, height)
+            if len(coords) < 3:
+                regions.append(None)
+                continue
+            bbox, mask = build_region_mask(coords, gray.shape)
+            regions.append((bbox, mask, polygon_area(coords)))
+        _regions.append(regions)
+
+
+def _slot_ratios(binary: np.ndarray, regions: List[Tuple]) -> np.ndarray:
+    ratios = np.zeros(len(regions))
+    for i, region in enumerate(regions):
+        if region is None:
+            continue
+        (x0, y0, x1, y1), mask, area = region
+        if mask is None or area <= 0:
+            continue
+        ratios[i] = cv2.countNonZero(cv2.bitwise_and(binary[y0:y1, x0:x1], mask)) / area
+    return ratios
+
+
+def _evaluate_group(block_size: int, c: int, median_sizes: List[int],
+                    dilate_sizes: List[int]) -> List[Dict[str, Any]]:
+    """
+    Run every (median, dilate) pipeline for one (block size, C) on all frames.
+
+    Returns:
+        One entry per pipeline with a (frames x slots) ratio matrix and the
+        mean per-frame time of each stage in milliseconds
+    """
+    kernels = {d: np.ones((d, d), np.uint8) for d in dilate_sizes}
+    pipelines = {(m, d): {"ratios": [], "median_ms": 0.0, "dilate_ms": 0.0, "count_ms": 0.0}
+                 for m, d in product(median_sizes, dilate_sizes)}
+    thresh_ms = 0.0
+
+    for blurred, regions in zip(_frames, _regions):
+        t0 = time.perf_counter()
+        thresh = cv2.adaptiveThreshold(blurred, 255, cv2.ADAPTIVE_THRESH_GAUSSIAN_C,
+                                       cv2.THRESH_BINARY_INV, block_size, c)
+        thresh_ms += (time.perf_counter() - t0) * 1000
+        for m in median_sizes:
+            t0 = time.perf_counter()
+            median = cv2.medianBlur(thresh, m)
+            median_ms = (time.perf_counter() - t0) * 1000
+            for d in dilate_sizes:
+                entry = pipelines[(m, d)]
+                t0 = time.perf_counter()
+                dilated = cv2.dilate(median, kernels[d], iterations=1)
+                t1 = time.perf_counter()
+                entry["ratios"].append(_slot_ratios(dilated, regions))
+                t2 = time.perf_counter()
+                entry["median_ms"] += median_ms
+                entry["dilate_ms"] += (t1 - t0) * 1000
+                entry["count_ms"] += (t2 - t1) * 1000
+
+    frame_count = max(len(_frames), 1)
+    results = []
+    for (m, d), entry in pipelines.items():
+        results.append({
+            "adaptive_thresh_block_size": block_size,
+            "adaptive_thresh_c": c,
+            "median_blur_size": m,
+            "dilate_kernel_size": d,
+            "ratios": np.array(entry["ratios"]),
+            "stage_ms": {
+                "threshold": thresh_ms / frame_count,
+                "median": entry["median_ms"] / frame_count,
+                "dilate": entry["dilate_ms"] / frame_count,
+                "count": entry["count_ms"] / frame_count
+            }
+        })
+    return results
+
+
+def _odd(values: List[int]) -> List[int]:
+    return sorted({v if v % 2 == 1 else v + 1 for v in values})
+
+
+def _measure_shared_stages(image_paths: List[str]) -> Dict[str, float]:
+    """Mean per-frame decode and blur time (paid by every combination)"""
+    decode_ms = blur_ms = 0.0
+    for path in image_paths:
+        t0 = time.perf_counter()
+        gray = load_image(path, grayscale=True)
+        t1 = time.perf_counter()
+        cv2.GaussianBlur(gray, (3, 3), 1)
+        t2 = time.perf_counter()
+        decode_ms += (t1 - t0) * 1000
+        blur_ms += (t2 - t1) * 1000
+    count = max(len(image_paths), 1)
+    return {"decode": decode_ms / count, "blur": blur_ms / count}
+
+
+def run_sweep(slots: List[Dict[str, Any]], frames: List[Dict[str, Any]],
+              thresholds: List[float], block_sizes: List[int], c_values: List[int],
+              median_sizes: List[int], dilate_sizes: List[int],
+              workers: Optional[int] = None) -> List[Dict[str, Any]]:
+    """
+    Evaluate the full parameter grid.
+
+    Args:
+        slots: Slot definitions
+        frames: Labeled frames from load_labels
+        thresholds, block_sizes, c_values, median_sizes, dilate_sizes: Grid values
+        workers: Process pool size (defaults to the CPU count)
+
+    Returns:
+        One entry per combination with its parameters, accuracy, error
+        counts and mean per-frame cost in milliseconds
+    """
+    image_paths = [frame["image_path"] for frame in frames]
+    block_sizes, median_sizes = _odd(block_sizes), _odd(median_sizes)
+
+    # Ground truth as a (frames x slots) matrix; -1 marks unlabeled slots
+    slot_ids = [slot.get('slot_id', '') for slot in slots]
+    truth = np.full((len(frames), len(slots)), -1, dtype=np.int8)
+    for i, frame in enumerate(frames):
+        for j, slot_id in enumerate(slot_ids):
+            if slot_id in frame["labels"]:
+                truth[i, j] = 1 if frame["labels"][slot_id] else 0
+    labeled = truth >= 0
+    labeled_count = int(labeled.sum())
+    if labeled_count == 0:
+        raise ValueError("No labeled slots found in frames")
+
+    shared = _measure_shared_stages(image_paths)
+    groups = list(product(block_sizes, c_values))
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker,
+                             initargs=(image_paths, slots)) as pool:
+        futures = [pool.submit(_evaluate_group, b, c, median_sizes, dilate_sizes) for b, c in groups]
+        pipelines = [entry for future in futures for entry in future.result()]
+
+    report = []
+    for pipeline in pipelines:
+        ratios = pipeline.pop("ratios")
+        stage_ms = dict(shared, **pipeline.pop("stage_ms"))
+        cost_ms = sum(stage_ms.values())
+        for threshold in thresholds:
+            predicted = ratios > threshold
+            false_occupied = int((predicted & (truth == 0)).sum())
+            false_vacant = int((~predicted & (truth == 1)).sum())
+            report.append(dict(
+                pipeline,
+                threshold=threshold,
+                accuracy=1.0 - (false_occupied + false_vacant) / labeled_count,
+                false_occupied=false_occupied,
+                false_vacant=false_vacant,
+                cost_ms=cost_ms,
+                stage_ms=stage_ms
+            ))
+
+    report.sort(key=lambda r: (-r["accuracy"], r["cost_ms"]))
+    return report
+
+
+def pick_fastest(report: List[Dict[str, Any]], target_accuracy: float) -> Optional[Dict[str, Any]]:
+    """Cheapest combination that meets the accuracy target (None if none does)"""
+    candidates = [r for r in report if r["accuracy"] >= target_accuracy]
+    return min(candidates, key=lambda r: (r["cost_ms"], -r["accuracy"])) if candidates else None
+
+
+def _parse_list(value: str, cast):
+    """Parse "a,b,c" or "start:stop:step" (inclusive stop)"""
+    if ':' in value:
+        start, stop, step = (float(v) for v in value.split(':'))
+        values = np.arange(start, stop + step / 2, step)
+        return [cast(round(v, 6)) for v in values]
+    return [cast(v) for v in value.split(',') if v]
+
+
+def main():
+    """Main entry point for command-line usage"""
+    parser = argparse.ArgumentParser(description="Calibrate OccupancyDetector parameters on labeled frames")
+    parser.add_argument('labels', help="Labels JSON (slots + frames with ground truth)")
+    parser.add_argument('--thresholds', default="0.05:0.40:0.01", help="List or start:stop:step")
+    parser.add_argument('--block-sizes', default="15,25,35")
+    parser.add_argument('--c', default="8,12,16,20")
+    parser.add_argument('--median', default="3,5")
+    parser.add_argument('--dilate', default="1,3,5")
+    parser.add_argument('--workers', type=int, default=None, help="Process pool size (default: CPU count)")
+    parser.add_argument('--target-accuracy', type=float, default=None,
+                        help="Report the fastest combination at or above this accuracy")
+    parser.add_argument('--top', type=int, default=20, help="Rows to print")
+    parser.add_argument('--output', help="Write the full report as JSON")
+    args = parser.parse_args()
+
+    try:
+        slots, frames = load_labels(args.labels)
+        started = time.time()
+        report = run_sweep(
+            slots, frames,
+            thresholds=_parse_list(args.thresholds, float),
+            block_sizes=_parse_list(args.block_sizes, int),
+            c_values=_parse_list(args.c, int),
+            median_sizes=_parse_list(args.median, int),
+            dilate_sizes=_parse_list(args.dilate, int),
+            workers=args.workers
+        )
+    except Exception as e:
+        print(f"Error: {e}")
+        sys.exit(1)
+
+    print(f"Evaluated {len(report)} combinations on {len(frames)} frames in {time.time() - started:.1f}s\n")
+    print(f"{'thr':>6} {'block':>5} {'C':>4} {'med':>4} {'dil':>4} {'accuracy':>9} {'cost ms':>8}")
+    for r in report[:args.top]:
+        print(f"{r['threshold']:>6.3f} {r['adaptive_thresh_block_size']:>5} {r['adaptive_thresh_c']:>4} "
+              f"{r['median_blur_size']:>4} {r['dilate_kernel_size']:>4} {r['accuracy']:>9.4f} {r['cost_ms']:>8.2f}")
+
+    best = None
+    if args.target_accuracy is not None:
+        best = pick_fastest(report, args.target_accuracy)
+        if best:
+            params = {k: best[k] for k in ('threshold', 'adaptive_thresh_block_size', 'adaptive_thresh_c',
+                                           'median_blur_size', 'dilate_kernel_size')}
+            print(f"\nFastest setting with accuracy >= {args.target_accuracy}: "
+                  f"{best['accuracy']:.4f} at {best['cost_ms']:.2f} ms/frame")
+            print(f"  OccupancyDetector(**{json.dumps(params)})")
+        else:
+            print(f"\nNo combination reaches accuracy {args.target_accuracy}")
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump({"results": report, "fastest": best}, f, indent=2)
+        print(f"Saved report to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
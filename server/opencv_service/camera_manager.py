@@ -1,6 +1,7 @@
 """
 Camera Manager - Handles camera source detection and frame capture
-Supports webcam, USB cameras, IP cameras, and file-based sources
+Supports webcam, USB cameras, IP cameras, file-based sources and
+recordings (replay://, see frame_recording.py)
 """
 import cv2
 import numpy as np
@@ -50,6 +51,56 @@ class CameraManager:
         
         return available_cameras
     
+    @staticmethod
+    def open_capture(source: str) -> cv2.VideoCapture:
+        """
+        Open a capture for any supported source
+        
+        Args:
+            source: "camera://0", "0", RTSP/HTTP URL, video file path or
+                "replay://<recording>?speed=<factor>"
+            
+        Returns:
+            cv2.VideoCapture, or a ReplayCapture with the same interface
+            for replay:// sources (check isOpened())
+        """
+        if source.startswith("replay://"):
+            from frame_recording import ReplayCapture
+            return ReplayCapture(source)
+        if source.startswith("camera://"):
+            return cv2.VideoCapture(int(source.replace("camera://", "")))
+        if source.isdigit():
+            return cv2.VideoCapture(int(source))
+        return cv2.VideoCapture(source)
+    
+    @staticmethod
+    def probe_source(source: str) -> Optional[Dict[str, Any]]:
+        """
+        Read one frame from a source to learn its frame geometry
+        
+        Args:
+            source: Camera source, stream URL or video file path
+            
+        Returns:
+            Dictionary with width, height, channels and fps, or None if unreadable
+        """
+        cap = CameraManager.open_capture(source)
+        try:
+            if not cap.isOpened():
+                return None
+            ret, frame = cap.read()
+            if not ret or frame is None:
+                return None
+            fps = cap.get(cv2.CAP_PROP_FPS)
+            return {
+                "width": frame.shape[1],
+                "height": frame.shape[0],
+                "channels": frame.shape[2] if frame.ndim == 3 else 1,
+                "fps": fps if fps > 0 else 30
+            }
+        finally:
+            cap.release()
+    
     @staticmethod
     def capture_frame_from_camera(source: str, timeout: int = 5) -> Optional[np.ndarray]:
         """
@@ -97,6 +148,31 @@ class CameraManager:
         
         return None
     
+    @staticmethod
+    def capture_frame_from_replay(source: str, frame_number: int = 0) -> Optional[np.ndarray]:
+        """
+        Read one frame of a recording without waiting for its playback pace
+        
+        Args:
+            source: "replay://<recording>" (the speed option is ignored)
+            frame_number: Frame number to read (0 = first frame, negative counts from the end)
+            
+        Returns:
+            Frame as numpy array, or None if the recording is missing or empty
+        """
+        cap = CameraManager.open_capture(source)
+        try:
+            if not cap.isOpened():
+                return None
+            total_frames = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
+            if frame_number < 0:
+                frame_number = max(0, total_frames + frame_number)
+            cap.set(cv2.CAP_PROP_POS_FRAMES, min(frame_number, total_frames - 1))
+            ret, frame = cap.read()
+            return frame if ret else None
+        finally:
+            cap.release()
+    
     @staticmethod
     def test_camera_connection(source: str) -> Dict[str, Any]:
         """
@@ -118,6 +194,14 @@ class CameraManager:
         }
         
         try:
+            if source.startswith("replay://"):
+                probe = CameraManager.probe_source(source)
+                if probe is None:
+                    result["message"] = "Recording not found or empty"
+                    return result
+                result.update(success=True, width=probe["width"], height=probe["height"],
+                              fps=probe["fps"], message="Recording readable")
+                return result
             if source.startswith("camera://"):
                 camera_index = int(source.replace("camera://", ""))
             elif source.isdigit():
@@ -189,6 +273,13 @@ class CameraManager:
                 "format": "file path",
                 "example": "C:/videos/parking.mp4"
             },
+            {
+                "type": "replay",
+                "label": "Recording",
+                "description": "Recorded camera stream (frame_recording.py), replayed in real time or faster",
+                "format": "replay://{path}?speed={factor}",
+                "example": "replay:///data/recordings/lot1.rec?speed=0"
+            },
             {
                 "type": "image",
                 "label": "Image File",
@@ -0,0 +1,133 @@
+"""
+Detector Registry - Shared detectors keyed by their configuration
+
+Request handlers never change a detector's settings: each distinct
+parameter set (threshold, preprocessing parameters, decode scale, engine
+and engine options)
+maps to one OccupancyDetector that is created once and then only read, so
+any number of request threads can use it concurrently. Lots with different
+thresholds simply get different detectors.
+
+Stateful engines (e.g. reference) belong to a lot rather than to a
+parameter set: one engine instance per (lot_id, engine, engine options) is
+shared by all of
+that lot's detectors, so a lot keeps its learned references whatever
+threshold a request asks for. The engine is dropped together with the
+last of those detectors, so the registry stays bounded however many lots
+and engine options it sees.
+"""
+import threading
+from typing import Dict, Any, Optional, Tuple
+
+from occupancy_detector import OccupancyDetector
+from engines import ENGINES, create_engine
+
+
+class DetectorRegistry:
+    """Creates and caches immutable detectors per configuration"""
+
+    def __init__(self, max_detectors: int = 256, **defaults: Any):
+        """
+        Initialize the registry.
+
+        Args:
+            max_detectors: Detectors kept before the oldest configurations are
+                dropped (rebuilt on next use; a lot engine is dropped with
+                its last detector)
+            **defaults: OccupancyDetector arguments used when a request does
+                not override them (threshold, decode_scale, ...)
+        """
+        self.max_detectors = max_detectors
+        self.defaults = dict(defaults)
+        self._detectors: Dict[Tuple, OccupancyDetector] = {}
+        self._engines: Dict[Tuple, Any] = {}
+        # engine key -> number of cached detectors using the engine
+        self._engine_users: Dict[Tuple, int] = {}
+        self._lock = threading.Lock()
+
+    def _config(self, threshold: Optional[float], engine: Optional[str],
+                lot_id: Optional[str], engine_options: Optional[Dict[str, Any]],
+                options: Dict[str, Any]) -> Tuple:
+        """Normalized, hashable configuration (also validates it)"""
+        engine = engine or 'adaptive'
+        engine_class = ENGINES.get(engine)
+        if engine_class is None:
+            raise ValueError(f"Unknown engine: {engine}. Expected one of {sorted(ENGINES)}")
+        if getattr(engine_class, 'stateful', False):
+            if not lot_id:
+                raise ValueError(f"Engine '{engine}' requires lot_id")
+            lot_id = str(lot_id)
+        else:
+            lot_id = None  # stateless engines are shared between lots
+        params = dict(self.defaults)
+        params.update({k: v for k, v in options.items() if v is not None})
+        if threshold is not None:
+            params['threshold'] = float(threshold)
+        if 'decode_scale' in params:
+            params['decode_scale'] = int(params['decode_scale'])
+        if engine_options is not None and not isinstance(engine_options, dict):
+            raise ValueError("engine_options must be an object")
+        engine_params = tuple(sorted((engine_options or {}).items()))
+        try:
+            hash(engine_params)
+        except TypeError:
+            raise ValueError("engine_options values must be numbers, strings or booleans")
+        return engine, lot_id, engine_params, tuple(sorted(params.items()))
+
+    def lookup(self, threshold: Optional[float] = None, engine: Optional[str] = None,
+               lot_id: Optional[str] = None, engine_options: Optional[Dict[str, Any]] = None,
+               **options: Any) -> OccupancyDetector:
+        """
+        Detector for a configuration. Never modify the returned detector;
+        ask for another configuration instead.
+
+        Args:
+            threshold: Occupancy threshold (default: the registry's)
+            engine: Engine name (default: 'adaptive')
+            lot_id: Owner of a stateful engine (required for those)
+            engine_options: Engine keyword arguments (see engines.py)
+            **options: Other OccupancyDetector arguments (None = default)
+
+        Returns:
+            Shared OccupancyDetector
+
+        Raises:
+            ValueError: For unknown engines, invalid values or a stateful
+                engine without lot_id
+        """
+        key = self._config(threshold, engine, lot_id, engine_options, options)
+        found = self._detectors.get(key)  # lock-free fast path
+        if found is not None:
+            return found
+        with self._lock:
+            found = self._detectors.get(key)
+            if found is None:
+                engine_name, owner, engine_params, params = key
+                if owner is None:
+                    found = OccupancyDetector(engine=engine_name, engine_options=dict(engine_params),
+                                              **dict(params))
+                else:
+                    engine_key = (owner, engine_name, engine_params)
+                    engine_instance = self._engines.get(engine_key)
+                    if engine_instance is None:
+                        engine_instance = self._engines[engine_key] = create_engine(
+                            engine_name, **dict(engine_params))
+                    found = OccupancyDetector(engine=engine_instance, **dict(params))
+                    self._engine_users[engine_key] = self._engine_users.get(engine_key, 0) + 1
+                while len(self._detectors) >= self.max_detectors:
+                    self._evict(next(iter(self._detectors)))
+                self._detectors[key] = found
+        return found
+
+    def _evict(self, key: Tuple):
+        """Drop a detector, and its lot engine if no other detector uses it (lock held)"""
+        del self._detectors[key]
+        engine_name, owner, engine_params, _ = key
+        if owner is None:
+            return
+        engine_key = (owner, engine_name, engine_params)
+        users = self._engine_users.pop(engine_key, 1) - 1
+        if users > 0:
+            self._engine_users[engine_key] = users
+        else:
+            self._engines.pop(engine_key, None)
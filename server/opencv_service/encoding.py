@@ -0,0 +1,137 @@
+"""
+Encoding - Response layouts and serializers for detection results
+
+Large lots make the list of per-slot dicts (and its JSON serialization)
+the dominant cost of a detection response. Two independent choices are
+offered:
+
+Layout ("layout" request field or query parameter):
+    records   - list of per-slot dicts (default, unchanged)
+    columnar  - parallel arrays: {"slot_id": [...], "status": [0, 1, ...],
+                "occupancy_ratio": [...], ...} with statuses as STATUS_CODES
+
+Encoding (Accept header):
+    application/json     - default; serialized with orjson when installed
+    application/msgpack  - MessagePack (requires the msgpack package). With
+                           the columnar layout, numeric columns are sent as
+                           little-endian typed byte strings described by
+                           "dtypes" (e.g. "occupancy_ratio": "<f4")
+
+Both msgpack and orjson are optional dependencies.
+"""
+import json
+from typing import Dict, Any, List, Optional, Tuple
+
+import numpy as np
+from occupancy_detector import STATUS_CODES
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+JSON_MIMETYPE = 'application/json'
+MSGPACK_MIMETYPES = ('application/msgpack', 'application/x-msgpack')
+
+# Column name -> numpy dtype used by the binary columnar encoding
+COLUMN_DTYPES = {
+    'slot_number': '<i4',
+    'status': '<u1',
+    'occupancy_ratio': '<f4',
+    'white_pixel_count': '<u4',
+    'total_area': '<u4',
+    'confidence': '<f4'
+}
+
+
+def to_columnar(results: List[Dict[str, Any]]) -> Dict[str, List[Any]]:
+    """
+    Convert per-slot result dicts to parallel arrays.
+
+    Returns:
+        {"slot_id": [...], "slot_number": [...], "status": [codes], ...,
+         "status_codes": STATUS_CODES}
+    """
+    unknown = STATUS_CODES['unknown']
+    columns = {
+        'slot_id': [r.get('slot_id') for r in results],
+        'slot_number': [r.get('slot_number') or 0 for r in results],
+        'status': [STATUS_CODES.get(r.get('status'), unknown) for r in results],
+        'occupancy_ratio': [r.get('occupancy_ratio', 0.0) for r in results],
+        'white_pixel_count': [r.get('white_pixel_count', 0) for r in results],
+        'total_area': [r.get('total_area', 0) for r in results],
+        'confidence': [r.get('confidence', 0.0) for r in results]
+    }
+    columns['status_codes'] = STATUS_CODES
+    return columns
+
+
+def pack_columns(columns: Dict[str, Any]) -> Dict[str, Any]:
+    """Replace numeric columns with typed byte strings for binary encodings"""
+    packed = dict(columns)
+    dtypes = {}
+    for name, dtype in COLUMN_DTYPES.items():
+        if name in packed:
+            packed[name] = np.asarray(packed[name], dtype=dtype).tobytes()
+            dtypes[name] = dtype
+    packed['dtypes'] = dtypes
+    return packed
+
+
+def unpack_columns(columns: Dict[str, Any]) -> Dict[str, Any]:
+    """Inverse of pack_columns (numeric columns become numpy arrays)"""
+    unpacked = dict(columns)
+    for name, dtype in columns.get('dtypes', {}).items():
+        unpacked[name] = np.frombuffer(columns[name], dtype=dtype)
+    return unpacked
+
+
+def dumps_json(payload: Any) -> bytes:
+    """Serialize to compact JSON (orjson when available)"""
+    if orjson is not None:
+        return orjson.dumps(payload)
+    return json.dumps(payload, separators=(',', ':')).encode()
+
+
+def dumps_msgpack(payload: Any) -> bytes:
+    if msgpack is None:
+        raise ValueError("MessagePack encoding requires the msgpack package")
+    return msgpack.packb(payload, use_bin_type=True)
+
+
+def negotiate(accept: Optional[str]) -> str:
+    """Pick 'msgpack' or 'json' from an Accept header"""
+    if accept and msgpack is not None and any(m in accept for m in MSGPACK_MIMETYPES):
+        return 'msgpack'
+    return 'json'
+
+
+def encode_results(payload: Dict[str, Any], layout: str = 'records',
+                   encoding: str = 'json') -> Tuple[bytes, str]:
+    """
+    Encode a detection response.
+
+    Args:
+        payload: Response dict with a "results" list
+        layout: 'records' or 'columnar'
+        encoding: 'json' or 'msgpack'
+
+    Returns:
+        (body, mimetype)
+    """
+    if layout not in ('records', 'columnar'):
+        raise ValueError(f"Unknown layout: {layout}. Expected 'records' or 'columnar'")
+    if layout == 'columnar' and 'results' in payload:
+        columns = to_columnar(payload['results'])
+        if encoding == 'msgpack':
+            columns = pack_columns(columns)
+        payload = dict(payload, results=columns, layout='columnar')
+
+    if encoding == 'msgpack':
+        return dumps_msgpack(payload), MSGPACK_MIMETYPES[0]
+    return dumps_json(payload), JSON_MIMETYPE
@@ -0,0 +1,361 @@
+"""
+Engines - Pluggable occupancy detection methods
+
+An engine turns a decoded grayscale frame plus slot definitions into the
+per-slot result dicts returned by OccupancyDetector. Built-in engines:
+
+    adaptive   - the classical pipeline (blur, adaptive threshold, median,
+                 dilation) over the whole frame, then white-pixel ratio
+                 per slot (the original OccupancyDetector algorithm)
+    reference  - compares each slot's crop with a learned empty-lot
+                 reference and classifies by mean absolute difference.
+                 Only the slot crops are touched, so it is much cheaper
+                 than full-frame adaptive thresholding. References are
+                 learned from frames marked vacant and kept up to date
+                 with a running average.
+    cascade    - a coarse adaptive pass over a downscaled frame classifies
+                 every slot; only slots whose ratio is within a margin of
+                 the threshold are re-run through the full-resolution pipeline on their
+                 own (padded) crop. Each result records the deciding stage.
+
+Engines hold state (references, buffers), so use one engine instance per
+lot/camera. Register additional engines with register_engine().
+"""
+import itertools
+import threading
+import weakref
+from typing import Dict, Any, List, Optional, Tuple, Iterable
+
+import cv2
+import numpy as np
+from occupancy_detector import slot_pixel_coordinates, polygon_area, classify_ratio
+from preprocess_pipeline import checkout_pipeline, get_slot_region
+from utils import preprocess_image
+from memory_budget import accountant
+
+_engine_tokens = itertools.count()
+
+
+def slot_result(slot: Dict[str, Any], status: str, occupancy_ratio: float = 0.0,
+                white_pixel_count: int = 0, total_area: int = 0,
+                confidence: float = 0.0) -> Dict[str, Any]:
+    """Result dict in the format returned by OccupancyDetector"""
+    return {
+        'slot_id': slot.get('slot_id', ''),
+        'slot_number': slot.get('slot_number', 0),
+        'status': status,
+        'occupancy_ratio': float(occupancy_ratio),
+        'white_pixel_count': int(white_pixel_count),
+        'total_area': int(total_area),
+        'confidence': float(confidence)
+    }
+
+
+class DetectionEngine:
+    """Base class of detection engines"""
+
+    name = ''
+    # Engines keeping per-lot state get one instance per lot (see detector_registry.py)
+    stateful = False
+
+    def detect(self, img: np.ndarray, slots: List[Dict[str, Any]], scale: int,
+               threshold: float) -> List[Dict[str, Any]]:
+        """
+        Detect occupancy on a decoded frame.
+
+        Args:
+            img: Grayscale (or BGR) frame
+            slots: Slot definitions
+            scale: Factor by which img is reduced relative to the slots' image size
+            threshold: Detector occupancy threshold
+
+        Returns:
+            One result dict per slot (see slot_result)
+        """
+        raise NotImplementedError
+
+    def learn(self, img: np.ndarray, slots: List[Dict[str, Any]], scale: int = 1,
+              vacant_slot_ids: Optional[Iterable[str]] = None) -> int:
+        """
+        Learn from a frame in which the given slots are known to be vacant.
+
+        Returns:
+            Number of slots updated
+        """
+        raise ValueError(f"Engine '{self.name}' does not learn from labeled frames")
+
+    def info(self) -> Dict[str, Any]:
+        return {"engine": self.name}
+
+
+class AdaptiveThresholdEngine(DetectionEngine):
+    """The classical adaptive-threshold pipeline"""
+
+    name = 'adaptive'
+
+    def __init__(self, adaptive_thresh_block_size: int = 25, adaptive_thresh_c: int = 16,
+                 median_blur_size: int = 5, dilate_kernel_size: int = 3):
+        self.params = {
+            "adaptive_thresh_block_size": adaptive_thresh_block_size,
+            "adaptive_thresh_c": adaptive_thresh_c,
+            "median_blur_size": median_blur_size,
+            "dilate_kernel_size": dilate_kernel_size
+        }
+
+    def detect(self, img: np.ndarray, slots: List[Dict[str, Any]], scale: int,
+               threshold: float) -> List[Dict[str, Any]]:
+        img_height, img_width = img.shape[:2]
+
+        # Preprocess image into a pooled pipeline's preallocated buffers
+        with checkout_pipeline(img.shape, **self.params) as pipeline:
+            img_processed = pipeline.run(img)
+
+            results = []
+            for slot in slots:
+                try:
+                    # Skip slots without valid coordinates
+                    if len(slot.get('coordinates', [])) < 3:
+                        results.append(slot_result(slot, 'unknown'))
+                        continue
+
+                    # Denormalize coordinates (into the possibly reduced frame)
+                    pixel_coords = slot_pixel_coordinates(slot, img_width, img_height, scale)
+
+                    # Count white pixels in the region (cached slot mask,
+                    # cv2.countNonZero like the reference code)
+                    white_pixel_count = pipeline.count_pixels(img_processed, pixel_coords)
+                    total_area = polygon_area(pixel_coords)
+                    occupancy_ratio = white_pixel_count / total_area if total_area > 0 else 0.0
+
+                    status, confidence = classify_ratio(occupancy_ratio, threshold)
+                    results.append(slot_result(slot, status, occupancy_ratio, white_pixel_count,
+                                               total_area, confidence))
+                except Exception as e:
+                    print(f"Error processing slot {slot.get('slot_id', 'unknown')}: {e}")
+                    results.append(slot_result(slot, 'error'))
+        return results
+
+    def info(self) -> Dict[str, Any]:
+        return {"engine": self.name, **self.params}
+
+
+class ReferenceDifferenceEngine(DetectionEngine):
+    """Mean absolute difference of each slot crop from an empty-lot reference"""
+
+    name = 'reference'
+    stateful = True
+
+    def __init__(self, diff_threshold: float = 0.08, alpha: float = 0.2,
+                 auto_update: bool = True, auto_update_alpha: float = 0.02,
+                 pixel_diff: int = 25):
+        """
+        Initialize the engine.
+
+        Args:
+            diff_threshold: Mean absolute difference (fraction of 255) above
+                which a slot is occupied
+            alpha: Running-average weight of a learned vacant frame
+            auto_update: Blend slots detected as vacant into their reference
+                (follows slow lighting changes)
+            auto_update_alpha: Running-average weight of auto updates
+            pixel_diff: Gray levels a pixel must differ by to be counted in
+                white_pixel_count (reported only)
+        """
+        self.diff_threshold = diff_threshold
+        self.alpha = alpha
+        self.auto_update = auto_update
+        self.auto_update_alpha = auto_update_alpha
+        self.pixel_diff = pixel_diff
+        # (slot_id, frame shape, pixel coordinates) -> float32 reference crop
+        self._references: Dict[Tuple, np.ndarray] = {}
+        self._lock = threading.Lock()
+        # Learned references are pinned in the memory budget (not re-creatable)
+        self._token = next(_engine_tokens)
+        weakref.finalize(self, accountant.untrack, 'engine_references', self._token)
+
+    @property
+    def reference_bytes(self) -> int:
+        return sum(r.nbytes for r in list(self._references.values()))
+
+    @staticmethod
+    def _slot_key(slot: Dict[str, Any], shape: Tuple[int, ...],
+                  pixel_coords: List[Tuple[int, int]]) -> Tuple:
+        return slot.get('slot_id', ''), tuple(shape[:2]), tuple(pixel_coords)
+
+    @staticmethod
+    def _crop(gray: np.ndarray, pixel_coords: List[Tuple[int, int]]):
+        """Slot crop, its mask and polygon area (None if outside the frame)"""
+        (x0, y0, x1, y1), mask = get_slot_region(pixel_coords, gray.shape)
+        if mask is None:
+            return None
+        return gray[y0:y1, x0:x1], mask, polygon_area(pixel_coords)
+
+    def _update(self, key: Tuple, crop: np.ndarray, mask: np.ndarray, alpha: float):
+        reference = self._references.get(key)
+        if reference is None or reference.shape != crop.shape:
+            self._references[key] = crop.astype(np.float32)
+        else:
+            cv2.accumulateWeighted(crop, reference, alpha, mask)
+
+    def learn(self, img: np.ndarray, slots: List[Dict[str, Any]], scale: int = 1,
+              vacant_slot_ids: Optional[Iterable[str]] = None) -> int:
+        gray = img if img.ndim == 2 else cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
+        height, width = gray.shape[:2]
+        vacant = None if vacant_slot_ids is None else set(vacant_slot_ids)
+        updated = 0
+        with self._lock:
+            for slot in slots:
+                if vacant is not None and slot.get('slot_id') not in vacant:
+                    continue
+                if len(slot.get('coordinates', [])) < 3:
+                    continue
+                pixel_coords = slot_pixel_coordinates(slot, width, height, scale)
+                region = self._crop(gray, pixel_coords)
+                if region is None:
+                    continue
+                crop, mask, _ = region
+                self._update(self._slot_key(slot, gray.shape, pixel_coords), crop, mask, self.alpha)
+                updated += 1
+        accountant.track('engine_references', self._token, self.reference_bytes, pinned=True)
+        return updated
+
+    def detect(self, img: np.ndarray, slots: List[Dict[str, Any]], scale: int,
+               threshold: float) -> List[Dict[str, Any]]:
+        gray = img if img.ndim == 2 else cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
+        height, width = gray.shape[:2]
+        results = []
+        for slot in slots:
+            try:
+                if len(slot.get('coordinates', [])) < 3:
+                    results.append(slot_result(slot, 'unknown'))
+                    continue
+                pixel_coords = slot_pixel_coordinates(slot, width, height, scale)
+                key = self._slot_key(slot, gray.shape, pixel_coords)
+                region = self._crop(gray, pixel_coords)
+                reference = self._references.get(key)
+                if region is None or reference is None:
+                    # Nothing learned for this slot at this resolution yet
+                    results.append(slot_result(slot, 'unknown'))
+                    continue
+
+                crop, mask, total_area = region
+                diff = cv2.absdiff(crop.astype(np.float32), reference)
+                mean_diff = cv2.mean(diff, mask)[0] / 255.0
+                changed = cv2.countNonZero(cv2.bitwise_and(
+                    cv2.compare(diff, float(self.pixel_diff), cv2.CMP_GT), mask))
+                status, confidence = classify_ratio(mean_diff, self.diff_threshold)
+                if status == 'vacant' and self.auto_update:
+                    with self._lock:
+                        self._update(key, crop, mask, self.auto_update_alpha)
+                results.append(slot_result(slot, status, mean_diff, changed, total_area, confidence))
+            except Exception as e:
+                print(f"Error processing slot {slot.get('slot_id', 'unknown')}: {e}")
+                results.append(slot_result(slot, 'error'))
+        return results
+
+    def info(self) -> Dict[str, Any]:
+        return {
+            "engine": self.name,
+            "diff_threshold": self.diff_threshold,
+            "alpha": self.alpha,
+            "auto_update": self.auto_update,
+            "learned_slots": len(self._references),
+            "reference_bytes": self.reference_bytes
+        }
+
+
+class CascadeEngine(AdaptiveThresholdEngine):
+    """Coarse adaptive pass on a downscaled frame, full resolution for ambiguous slots"""
+
+    name = 'cascade'
+
+    def __init__(self, coarse_scale: int = 4, margin: float = 0.5, **params: Any):
+        """
+        Initialize the engine.
+
+        Args:
+            coarse_scale: Downscale factor of the first pass
+            margin: Slots whose coarse occupancy ratio is within this
+                fraction of the threshold (|ratio - threshold| < margin *
+                threshold) are re-evaluated at full resolution; 0 disables
+                the fine stage. The reported confidence saturates at 1 for
+                every occupied slot, so the distance is used instead.
+            **params: Adaptive pipeline parameters (see AdaptiveThresholdEngine)
+        """
+        super().__init__(**params)
+        self.coarse_scale = max(int(coarse_scale), 1)
+        self.margin = margin
+        # Pixels around a slot that influence its pipeline output (blur,
+        # adaptive threshold, median and dilation radii): a crop padded by
+        # this much gives the same pixels as the full-frame pipeline
+        self.pad = 1 + self.params["adaptive_thresh_block_size"] // 2 + \
+            self.params["median_blur_size"] // 2 + self.params["dilate_kernel_size"] // 2
+
+    def detect(self, img: np.ndarray, slots: List[Dict[str, Any]], scale: int,
+               threshold: float) -> List[Dict[str, Any]]:
+        gray = img if img.ndim == 2 else cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
+        height, width = gray.shape[:2]
+
+        # Stage 1: every slot on the downscaled frame
+        coarse = gray
+        if self.coarse_scale > 1:
+            coarse = cv2.resize(gray, (max(width // self.coarse_scale, 1), max(height // self.coarse_scale, 1)),
+                                interpolation=cv2.INTER_AREA)
+        results = super().detect(coarse, slots, scale * self.coarse_scale, threshold)
+        for result in results:
+            result['stage'] = 'coarse'
+
+        # Stage 2: ambiguous slots through the full pipeline on their crop
+        for i, (slot, result) in enumerate(zip(slots, results)):
+            if result['status'] not in ('occupied', 'vacant') or \
+                    abs(result['occupancy_ratio'] - threshold) >= self.margin * threshold:
+                continue
+            try:
+                pixel_coords = slot_pixel_coordinates(slot, width, height, scale)
+                (x0, y0, x1, y1), mask = get_slot_region(pixel_coords, gray.shape)
+                if mask is None:
+                    continue
+                px0, py0 = max(x0 - self.pad, 0), max(y0 - self.pad, 0)
+                px1, py1 = min(x1 + self.pad, width), min(y1 + self.pad, height)
+                processed = preprocess_image(gray[py0:py1, px0:px1], **self.params)
+                region = processed[y0 - py0:y1 - py0, x0 - px0:x1 - px0]
+                white_pixel_count = int(cv2.countNonZero(cv2.bitwise_and(region, mask)))
+                total_area = polygon_area(pixel_coords)
+                occupancy_ratio = white_pixel_count / total_area if total_area > 0 else 0.0
+                status, confidence = classify_ratio(occupancy_ratio, threshold)
+                results[i] = slot_result(slot, status, occupancy_ratio, white_pixel_count,
+                                         total_area, confidence)
+                results[i]['stage'] = 'fine'
+            except Exception as e:
+                print(f"Error refining slot {slot.get('slot_id', 'unknown')}: {e}")
+        return results
+
+    def info(self) -> Dict[str, Any]:
+        return {"engine": self.name, "coarse_scale": self.coarse_scale, "margin": self.margin, **self.params}
+
+
+ENGINES = {
+    AdaptiveThresholdEngine.name: AdaptiveThresholdEngine,
+    ReferenceDifferenceEngine.name: ReferenceDifferenceEngine,
+    CascadeEngine.name: CascadeEngine
+}
+
+
+def register_engine(engine_class: type):
+    """Make an engine class selectable by its name"""
+    ENGINES[engine_class.name] = engine_class
+
+
+def create_engine(name: str, **options: Any) -> DetectionEngine:
+    """
+    Create an engine by name.
+
+    Raises:
+        ValueError: If the engine is unknown
+    """
+    if name not in ENGINES:
+        raise ValueError(f"Unknown engine: {name}. Expected one of {sorted(ENGINES)}")
+    try:
+        return ENGINES[name](**options)
+    except TypeError as e:
+        raise ValueError(f"Invalid options for engine '{name}': {e}")
@@ -0,0 +1,280 @@
+"""
+Frame Archive - Evidence frames of slot status changes
+
+Frames are archived only when at least one slot of a lot changes status
+(occupied <-> vacant), so storage grows with activity rather than with the
+polling rate. Each lot is a directory holding two append-only files:
+
+    data.bin   - JPEG blobs, back to back
+    index.bin  - one fixed-width record per (change, slot), see INDEX_DTYPE
+
+Two modes:
+    crops  - only the changed slots' crops (bounding box plus a margin)
+    frame  - one downscaled full frame per change, shared by the index
+             records of every slot that changed in it
+
+The index is memory-mapped for reads: records are appended in time order
+(a change older than the last record is stamped with its time), so a time range is a binary search on "ts", and every record holds the
+offset and length of its blob, so fetching evidence is a single seek.
+"""
+import os
+import threading
+import time
+from typing import Callable, Dict, Any, List, Optional, Union
+
+import cv2
+import numpy as np
+from occupancy_detector import STATUS_CODES, slot_pixel_coordinates
+from history_store import _LOT_ID_PATTERN
+
+INDEX_DTYPE = np.dtype([
+    ('ts', '<f8'),        # detection time (Unix seconds)
+    ('slot', '<u4'),      # slot number
+    ('status', 'u1'),     # new status code (occupancy_detector.STATUS_CODES)
+    ('previous', 'u1'),   # status code before the change
+    ('kind', 'u1'),       # KIND_CROP or KIND_FRAME
+    ('offset', '<u8'),    # blob position in data.bin
+    ('length', '<u4'),    # blob size in bytes
+    ('x', '<u4'),         # crop position in the detection frame (0 for frames)
+    ('y', '<u4'),
+])
+
+KIND_CROP = 0
+KIND_FRAME = 1
+KIND_NAMES = {KIND_CROP: 'crop', KIND_FRAME: 'frame'}
+MODES = ('crops', 'frame')
+
+_CHANGE_STATUSES = ('occupied', 'vacant')
+_STATUS_NAMES = {code: name for name, code in STATUS_CODES.items()}
+
+
+class FrameArchive:
+    """Change-triggered per-lot archive of slot crops or downscaled frames"""
+
+    def __init__(self, root_dir: str, mode: str = 'crops', width: int = 640,
+                 quality: int = 80, crop_margin: float = 0.1):
+        """
+        Initialize the archive.
+
+        Args:
+            root_dir: Directory holding one sub-directory per lot
+            mode: 'crops' (changed slots only) or 'frame' (downscaled frame)
+            width: Maximum width of archived frames ('frame' mode)
+            quality: JPEG quality
+            crop_margin: Margin around a slot's bounding box, as a fraction of its size
+        """
+        if mode not in MODES:
+            raise ValueError(f"Unknown archive mode: {mode}. Expected one of {MODES}")
+        self.root_dir = root_dir
+        self.mode = mode
+        self.width = width
+        self.quality = quality
+        self.crop_margin = crop_margin
+        # lot_id -> {slot_id: last known status}
+        self._statuses: Dict[str, Dict[str, str]] = {}
+        self._locks: Dict[str, threading.Lock] = {}
+        self._locks_guard = threading.Lock()
+        # lot_id -> (record count, memmap)
+        self._maps: Dict[str, Any] = {}
+
+    def _lot_dir(self, lot_id: str) -> str:
+        if not _LOT_ID_PATTERN.match(str(lot_id)):
+            raise ValueError(f"Invalid lot_id: {lot_id!r}")
+        return os.path.join(self.root_dir, str(lot_id))
+
+    def _lock(self, lot_id: str) -> threading.Lock:
+        with self._locks_guard:
+            return self._locks.setdefault(lot_id, threading.Lock())
+
+    def _encode(self, image: np.ndarray) -> bytes:
+        ok, buffer = cv2.imencode('.jpg', image, [cv2.IMWRITE_JPEG_QUALITY, self.quality])
+        if not ok:
+            raise ValueError("Could not encode archive image")
+        return buffer.tobytes()
+
+    def record(self, lot_id: str, slots: List[Dict[str, Any]], results: List[Dict[str, Any]],
+               frame: Union[np.ndarray, Callable[[], Optional[np.ndarray]]], scale: int = 1,
+               timestamp: Optional[float] = None) -> int:
+        """
+        Archive the frame behind a detection if any slot changed status.
+
+        The first detection of a lot (since start) only sets the baseline.
+
+        Args:
+            lot_id: Parking lot identifier
+            slots: Slot definitions the results were computed for
+            results: Detection results (same order as slots)
+            frame: The analyzed frame, or a callable returning it (only
+                called when something changed)
+            scale: Factor by which the frame is reduced relative to the slots' image size
+            timestamp: Detection time (defaults to now); clamped to the last
+                record's time so the index stays sorted
+
+        Returns:
+            Number of index records written
+        """
+        lot_id = str(lot_id)
+        lot_dir = self._lot_dir(lot_id)
+        with self._lock(lot_id):
+            known = self._statuses.get(lot_id)
+            current = {r.get('slot_id'): r.get('status') for r in results
+                       if r.get('status') in _CHANGE_STATUSES}
+            self._statuses[lot_id] = {**(known or {}), **current}
+            if known is None:
+                return 0
+            changed = [(slot, result) for slot, result in zip(slots, results)
+                       if result.get('status') in _CHANGE_STATUSES
+                       and known.get(result.get('slot_id'), result.get('status')) != result.get('status')]
+            if not changed:
+                return 0
+
+            image = frame() if callable(frame) else frame
+            if image is None:
+                return 0
+            records = np.zeros(len(changed), dtype=INDEX_DTYPE)
+            blobs: List[bytes] = []
+
+            if self.mode == 'frame':
+                height, width = image.shape[:2]
+                small = image
+                if width > self.width:
+                    small = cv2.resize(image, (self.width, max(int(height * self.width / width), 1)),
+                                       interpolation=cv2.INTER_AREA)
+                blobs.append(self._encode(small))
+
+            os.makedirs(lot_dir, exist_ok=True)
+            index_path = os.path.join(lot_dir, 'index.bin')
+            data_path = os.path.join(lot_dir, 'data.bin')
+            rows = self._record_count(lot_dir)
+            offset = os.path.getsize(data_path) if os.path.exists(data_path) else 0
+            ts = time.time() if timestamp is None else float(timestamp)
+            if rows:
+                ts = max(ts, self._last_timestamp(index_path, rows))
+            height, width = image.shape[:2]
+            for i, (slot, result) in enumerate(changed):
+                record = records[i]
+                record['ts'] = ts
+                record['slot'] = result.get('slot_number') or 0
+                record['status'] = STATUS_CODES[result['status']]
+                record['previous'] = STATUS_CODES[known[result.get('slot_id')]]
+                if self.mode == 'frame':
+                    record['kind'] = KIND_FRAME
+                    record['offset'], record['length'] = offset, len(blobs[0])
+                    continue
+                pixel_coords = slot_pixel_coordinates(slot, width, height, scale)
+                x, y, w, h = cv2.boundingRect(np.array(pixel_coords, dtype=np.int32))
+                mx, my = int(w * self.crop_margin), int(h * self.crop_margin)
+                x0, y0 = max(x - mx, 0), max(y - my, 0)
+                x1, y1 = min(x + w + mx, width), min(y + h + my, height)
+                if x1 <= x0 or y1 <= y0:
+                    continue
+                blob = self._encode(image[y0:y1, x0:x1])
+                record['kind'] = KIND_CROP
+                record['offset'], record['length'] = offset + sum(len(b) for b in blobs), len(blob)
+                record['x'], record['y'] = x0, y0
+                blobs.append(blob)
+            records = records[records['length'] > 0]
+
+            # Blobs first: an index record never points past the data file
+            with open(data_path, 'ab') as f:
+                for blob in blobs:
+                    f.write(blob)
+            with open(index_path, 'r+b' if os.path.exists(index_path) else 'wb') as f:
+                # Drop any partial tail left by an interrupted append
+                f.truncate(rows * INDEX_DTYPE.itemsize)
+                f.seek(0, os.SEEK_END)
+                f.write(records.tobytes())
+            return len(records)
+
+    @staticmethod
+    def _record_count(lot_dir: str) -> int:
+        path = os.path.join(lot_dir, 'index.bin')
+        return (os.path.getsize(path) if os.path.exists(path) else 0) // INDEX_DTYPE.itemsize
+
+    @staticmethod
+    def _last_timestamp(index_path: str, rows: int) -> float:
+        """Time of the last complete index record"""
+        with open(index_path, 'rb') as f:
+            f.seek((rows - 1) * INDEX_DTYPE.itemsize)
+            return float(np.frombuffer(f.read(INDEX_DTYPE.itemsize), INDEX_DTYPE)['ts'][0])
+
+    def _index(self, lot_id: str) -> np.ndarray:
+        """Memory-mapped index of a lot (re-mapped when the file grew)"""
+        lot_dir = self._lot_dir(lot_id)
+        rows = self._record_count(lot_dir)
+        cached = self._maps.get(lot_id)
+        if cached is not None and cached[0] == rows:
+            return cached[1]
+        if rows == 0:
+            return np.zeros(0, dtype=INDEX_DTYPE)
+        index = np.memmap(os.path.join(lot_dir, 'index.bin'), dtype=INDEX_DTYPE, mode='r', shape=(rows,))
+        self._maps[lot_id] = (rows, index)
+        return index
+
+    def query(self, lot_id: str, start: Optional[float] = None, end: Optional[float] = None,
+              slot: Optional[int] = None) -> List[Dict[str, Any]]:
+        """
+        Archived status changes of a time range.
+
+        Args:
+            lot_id: Parking lot identifier
+            start: Inclusive start time (Unix seconds)
+            end: Exclusive end time (Unix seconds)
+            slot: Restrict to one slot number
+
+        Returns:
+            List of {"ts", "slot_number", "status", "previous", "kind",
+            "offset", "length", "x", "y"}
+        """
+        index = self._index(lot_id)
+        ts = index['ts']
+        lo = 0 if start is None else int(np.searchsorted(ts, start, side='left'))
+        hi = len(ts) if end is None else int(np.searchsorted(ts, end, side='left'))
+        selected = index[lo:hi]
+        if slot is not None:
+            selected = selected[selected['slot'] == slot]
+        return [{
+            "ts": float(r['ts']),
+            "slot_number": int(r['slot']),
+            "status": _STATUS_NAMES.get(int(r['status']), 'unknown'),
+            "previous": _STATUS_NAMES.get(int(r['previous']), 'unknown'),
+            "kind": KIND_NAMES.get(int(r['kind']), 'crop'),
+            "offset": int(r['offset']),
+            "length": int(r['length']),
+            "x": int(r['x']),
+            "y": int(r['y'])
+        } for r in selected]
+
+    def read(self, lot_id: str, offset: int) -> Optional[bytes]:
+        """
+        JPEG blob stored at an offset (from query), or None if no record
+        points there.
+        """
+        index = self._index(lot_id)
+        offsets = index['offset']
+        # Offsets only grow with the record number
+        i = int(np.searchsorted(offsets, offset, side='left'))
+        if i >= len(offsets) or int(offsets[i]) != offset:
+            return None
+        with open(os.path.join(self._lot_dir(lot_id), 'data.bin'), 'rb') as f:
+            f.seek(offset)
+            return f.read(int(index['length'][i]))
+
+
+def create_archive(root_dir: str, environ: Optional[Dict[str, str]] = None) -> Optional[FrameArchive]:
+    """
+    Archive configured from OPENCV_ARCHIVE* variables (None when disabled).
+
+    OPENCV_ARCHIVE=crops|frame enables it (default: off);
+    OPENCV_ARCHIVE_WIDTH and OPENCV_ARCHIVE_QUALITY tune the images.
+    """
+    environ = os.environ if environ is None else environ
+    mode = environ.get('OPENCV_ARCHIVE', 'off')
+    if mode in ('', '0', 'off'):
+        return None
+    return FrameArchive(
+        root_dir,
+        mode=mode,
+        width=int(environ.get('OPENCV_ARCHIVE_WIDTH', 640)),
+        quality=int(environ.get('OPENCV_ARCHIVE_QUALITY', 80))
+    )
@@ -0,0 +1,165 @@
+"""
+Frame Quality - Cheap checks that keep unusable frames out of detection
+
+Black (night, IR switchover), overexposed, washed-out, blurred (rain, fog,
+focus) and frozen (stalled stream) frames produce garbage statuses. Before
+a frame is analyzed, a small downsampled copy is measured:
+
+    brightness  - mean gray level (too dark / overexposed)
+    contrast    - gray level standard deviation (fog, glare, lens cap)
+    sharpness   - variance of the Laplacian (blur)
+    frame_diff  - mean absolute difference from the previous frame of the
+                  same source; live sources whose frames stop changing at
+                  all for several checks in a row are frozen
+
+A failing frame is not analyzed; callers serve the last good result of the
+source marked stale instead.
+"""
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, Any, List, Optional
+
+import cv2
+import numpy as np
+
+THUMBNAIL_WIDTH = 320
+
+
+class QualityGate:
+    """Per-source frame quality checks and last good results"""
+
+    def __init__(self, min_brightness: float = 20.0, max_brightness: float = 235.0,
+                 min_contrast: float = 5.0, min_sharpness: float = 20.0,
+                 frozen_diff: float = 0.05, frozen_frames: int = 3,
+                 max_sources: int = 1024):
+        """
+        Initialize the gate.
+
+        Args:
+            min_brightness, max_brightness: Accepted mean gray level range
+            min_contrast: Minimum gray level standard deviation
+            min_sharpness: Minimum Laplacian variance (0 disables the check)
+            frozen_diff: Mean absolute difference (gray levels) below which a
+                live frame counts as identical to the previous one
+            frozen_frames: Identical checks in a row before a source is frozen
+            max_sources: Sources whose state is kept (least recent dropped)
+        """
+        self.min_brightness = min_brightness
+        self.max_brightness = max_brightness
+        self.min_contrast = min_contrast
+        self.min_sharpness = min_sharpness
+        self.frozen_diff = frozen_diff
+        self.frozen_frames = frozen_frames
+        self.max_sources = max_sources
+        # source -> {"thumbnail", "identical", "results", "timestamp"}
+        self._sources: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _state(self, key: str) -> Dict[str, Any]:
+        """Source state (lock held)"""
+        state = self._sources.get(key)
+        if state is None:
+            state = self._sources[key] = {"thumbnail": None, "identical": 0,
+                                          "results": None, "timestamp": None}
+            while len(self._sources) > self.max_sources:
+                self._sources.popitem(last=False)
+        else:
+            self._sources.move_to_end(key)
+        return state
+
+    def check(self, key: str, frame: np.ndarray, live: bool = True) -> Dict[str, Any]:
+        """
+        Measure a frame and decide whether it is worth analyzing.
+
+        Args:
+            key: Source identifier (lot_id)
+            frame: Grayscale or BGR frame
+            live: Frame comes from a live source (enables the frozen check)
+
+        Returns:
+            {"ok": bool, "reasons": [...], "brightness", "contrast",
+             "sharpness", "frame_diff"}
+        """
+        gray = frame if frame.ndim == 2 else cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+        height, width = gray.shape[:2]
+        if width > THUMBNAIL_WIDTH:
+            size = (THUMBNAIL_WIDTH, max(int(height * THUMBNAIL_WIDTH / width), 1))
+            gray = cv2.resize(gray, size, interpolation=cv2.INTER_AREA)
+
+        mean, stddev = cv2.meanStdDev(gray)
+        brightness, contrast = float(mean[0][0]), float(stddev[0][0])
+        sharpness = float(cv2.Laplacian(gray, cv2.CV_32F).var()) if self.min_sharpness else None
+
+        reasons: List[str] = []
+        if brightness < self.min_brightness:
+            reasons.append("dark")
+        elif brightness > self.max_brightness:
+            reasons.append("overexposed")
+        if contrast < self.min_contrast:
+            reasons.append("low_contrast")
+        if sharpness is not None and sharpness < self.min_sharpness:
+            reasons.append("blurred")
+
+        frame_diff = None
+        with self._lock:
+            state = self._state(key)
+            previous = state["thumbnail"]
+            if live and previous is not None and previous.shape == gray.shape:
+                frame_diff = float(cv2.mean(cv2.absdiff(previous, gray))[0])
+                state["identical"] = state["identical"] + 1 if frame_diff < self.frozen_diff else 0
+                if state["identical"] >= self.frozen_frames:
+                    reasons.append("frozen")
+            else:
+                state["identical"] = 0
+            state["thumbnail"] = gray.copy() if gray is frame else gray
+
+        return {
+            "ok": not reasons,
+            "reasons": reasons,
+            "brightness": round(brightness, 2),
+            "contrast": round(contrast, 2),
+            "sharpness": None if sharpness is None else round(sharpness, 2),
+            "frame_diff": None if frame_diff is None else round(frame_diff, 3)
+        }
+
+    def remember(self, key: str, results: List[Dict[str, Any]], timestamp: Optional[float] = None):
+        """Store the results of a frame that passed the checks"""
+        with self._lock:
+            state = self._state(key)
+            state["results"] = results
+            state["timestamp"] = time.time() if timestamp is None else timestamp
+
+    def last_good(self, key: str) -> Optional[Dict[str, Any]]:
+        """
+        Last good results of a source.
+
+        Returns:
+            {"results": [...], "timestamp": float}, or None
+        """
+        with self._lock:
+            state = self._sources.get(key)
+            if state is None or state["results"] is None:
+                return None
+            return {"results": state["results"], "timestamp": state["timestamp"]}
+
+
+def create_gate(environ: Optional[Dict[str, str]] = None) -> Optional[QualityGate]:
+    """
+    Gate configured from OPENCV_QUALITY_* variables (None if disabled).
+
+    OPENCV_QUALITY_GATE=0 disables it; OPENCV_QUALITY_MIN_BRIGHTNESS,
+    _MAX_BRIGHTNESS, _MIN_CONTRAST, _MIN_SHARPNESS and _FROZEN_FRAMES
+    override the defaults.
+    """
+    environ = os.environ if environ is None else environ
+    if environ.get('OPENCV_QUALITY_GATE', '1') == '0':
+        return None
+    return QualityGate(
+        min_brightness=float(environ.get('OPENCV_QUALITY_MIN_BRIGHTNESS', 20)),
+        max_brightness=float(environ.get('OPENCV_QUALITY_MAX_BRIGHTNESS', 235)),
+        min_contrast=float(environ.get('OPENCV_QUALITY_MIN_CONTRAST', 5)),
+        min_sharpness=float(environ.get('OPENCV_QUALITY_MIN_SHARPNESS', 20)),
+        frozen_frames=int(environ.get('OPENCV_QUALITY_FROZEN_FRAMES', 3))
+    )
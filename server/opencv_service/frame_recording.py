@@ -0,0 +1,418 @@
+"""
+Frame Recording - Record camera streams and replay them deterministically
+
+Incidents and performance problems on live cameras cannot be reproduced
+from a single file. A recording keeps the exact decoded frames of a source
+in a raw, memory-mappable file:
+
+    header      64 bytes, see HEADER_DTYPE (magic, geometry, frame count, fps)
+    frames      frame_count * height * width * channels bytes, back to back
+    timestamps  frame_count little-endian float64 capture times (Unix seconds)
+
+The frame count and timestamps are written when the recording is closed;
+an interrupted recording is still readable (frames up to the last complete
+one, timestamps derived from the fps).
+
+Recordings play back through the normal detection path as a source:
+
+    replay:///path/to/lot.rec            real time (original frame spacing)
+    replay:///path/to/lot.rec?speed=4    4x faster
+    replay:///path/to/lot.rec?speed=0    as fast as frames are read
+
+e.g. POST /captures {"source": "replay:///data/lot.rec"} or a scheduled lot.
+Replay reads frames straight from the memory map (no decoding), so it also
+benchmarks the pipeline without camera hardware.
+
+Usage:
+    python frame_recording.py record camera://0 lot.rec --duration 60
+    python frame_recording.py info lot.rec
+    python frame_recording.py bench lot.rec --slots lot_slots.json
+"""
+import argparse
+import json
+import os
+import sys
+import time
+from typing import Callable, Dict, Any, Optional
+from urllib.parse import urlsplit, parse_qs, unquote
+
+import cv2
+import numpy as np
+
+MAGIC = b'PKREC001'
+HEADER_SIZE = 64
+HEADER_DTYPE = np.dtype([
+    ('magic', 'S8'),
+    ('width', '<u4'),
+    ('height', '<u4'),
+    ('channels', '<u4'),
+    ('reserved', '<u4'),
+    ('frame_count', '<u8'),  # 0 while recording
+    ('fps', '<f8'),          # nominal or measured rate (timestamps of interrupted recordings)
+    ('created', '<f8'),
+    ('padding', 'V16'),
+])
+assert HEADER_DTYPE.itemsize == HEADER_SIZE
+
+
+class FrameRecorder:
+    """Appends frames of a fixed geometry to a recording file"""
+
+    def __init__(self, path: str, width: int, height: int, channels: int = 3,
+                 fps: Optional[float] = 30.0):
+        """
+        Create the recording (an existing file is replaced).
+
+        Args:
+            path: Output file
+            width, height, channels: Frame geometry (frames are fitted to it)
+            fps: Nominal frame rate of the source, or None to measure it from
+                the frame timestamps when the recording is closed
+        """
+        if width <= 0 or height <= 0 or channels not in (1, 3):
+            raise ValueError("Expected positive width/height and 1 or 3 channels")
+        self.path = path
+        self.shape = (height, width, channels) if channels == 3 else (height, width)
+        self.frame_bytes = width * height * channels
+        self.measure_fps = fps is None
+        self.fps = 0.0 if fps is None else float(fps)
+        self.timestamps = []
+        self._buffer = np.empty(self.shape, dtype=np.uint8)
+        header = np.zeros(1, dtype=HEADER_DTYPE)
+        header['magic'], header['width'], header['height'] = MAGIC, width, height
+        header['channels'], header['fps'], header['created'] = channels, self.fps, time.time()
+        self._header = header
+        self._file = open(path, 'wb')
+        self._file.write(header.tobytes())
+
+    def write(self, frame: np.ndarray, timestamp: Optional[float] = None):
+        """Append a frame (converted/resized to the recording's geometry)"""
+        from frame_ring import fit_frame
+        if frame.shape != self.shape or frame.dtype != np.uint8:
+            fit_frame(frame, self._buffer)
+            frame = self._buffer
+        self._file.write(np.ascontiguousarray(frame).data)
+        self.timestamps.append(time.time() if timestamp is None else float(timestamp))
+
+    @property
+    def frame_count(self) -> int:
+        return len(self.timestamps)
+
+    def measured_fps(self) -> float:
+        """Average frame rate of the recorded timestamps (0 with fewer than two frames)"""
+        if len(self.timestamps) < 2:
+            return 0.0
+        span = self.timestamps[-1] - self.timestamps[0]
+        return (len(self.timestamps) - 1) / span if span > 0 else 0.0
+
+    def close(self):
+        """Write the timestamps, the final frame count and a measured fps"""
+        if self._file is None:
+            return
+        self._file.write(np.asarray(self.timestamps, dtype='<f8').tobytes())
+        self._header['frame_count'] = len(self.timestamps)
+        if self.measure_fps:
+            self.fps = self.measured_fps()
+            self._header['fps'] = self.fps
+        self._file.seek(0)
+        self._file.write(self._header.tobytes())
+        self._file.close()
+        self._file = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class Recording:
+    """Read-only, memory-mapped view of a recording"""
+
+    def __init__(self, path: str):
+        """
+        Raises:
+            ValueError: If the file is not a recording
+        """
+        if not os.path.exists(path):
+            raise ValueError(f"Recording not found: {path}")
+        header = np.fromfile(path, dtype=HEADER_DTYPE, count=1)
+        if len(header) != 1 or header['magic'][0] != MAGIC:
+            raise ValueError(f"Not a frame recording: {path}")
+        header = header[0]
+        self.path = path
+        self.width, self.height = int(header['width']), int(header['height'])
+        self.channels = int(header['channels'])
+        self.fps = float(header['fps']) or 30.0
+        self.created = float(header['created'])
+        self.shape = (self.height, self.width, self.channels) if self.channels == 3 else (self.height, self.width)
+        frame_bytes = self.width * self.height * self.channels
+        count = int(header['frame_count'])
+        size = os.path.getsize(path)
+        complete = count > 0
+        if not complete:
+            # Interrupted recording: whole frames only, no timestamps
+            count = (size - HEADER_SIZE) // frame_bytes
+        self.complete = complete
+        self.frame_count = count
+        self.frames = np.memmap(path, dtype=np.uint8, mode='r', offset=HEADER_SIZE,
+                                shape=(count,) + self.shape) if count else np.zeros((0,) + self.shape, np.uint8)
+        timestamps_offset = HEADER_SIZE + count * frame_bytes
+        if complete and size >= timestamps_offset + count * 8:
+            self.timestamps = np.memmap(path, dtype='<f8', mode='r', offset=timestamps_offset, shape=(count,))
+        else:
+            self.timestamps = self.created + np.arange(count) / self.fps
+
+    def __len__(self) -> int:
+        return self.frame_count
+
+    def info(self) -> Dict[str, Any]:
+        duration = float(self.timestamps[-1] - self.timestamps[0]) if self.frame_count > 1 else 0.0
+        return {
+            "path": self.path,
+            "width": self.width,
+            "height": self.height,
+            "channels": self.channels,
+            "frames": self.frame_count,
+            "fps": self.fps,
+            "duration": round(duration, 3),
+            "complete": self.complete,
+            "bytes": os.path.getsize(self.path)
+        }
+
+
+def parse_replay_source(source: str) -> Dict[str, Any]:
+    """
+    Split "replay://<path>?speed=<factor>" into {"path", "speed"}.
+    speed 0 (or "max") replays as fast as possible.
+    """
+    parts = urlsplit(source)
+    path = unquote(parts.netloc + parts.path)
+    speed = parse_qs(parts.query).get('speed', ['1'])[0]
+    return {"path": path, "speed": 0.0 if speed == 'max' else max(float(speed), 0.0)}
+
+
+class ReplayCapture:
+    """cv2.VideoCapture look-alike playing a recording (see CameraManager.open_capture)"""
+
+    def __init__(self, source: str):
+        options = parse_replay_source(source)
+        self.speed = options["speed"]
+        try:
+            self.recording = Recording(options["path"])
+        except ValueError as e:
+            print(f"Cannot replay {source}: {e}")
+            self.recording = None
+        self.position = 0
+        self._started: Optional[float] = None  # wall clock of the first frame played
+
+    def isOpened(self) -> bool:
+        return self.recording is not None and len(self.recording) > 0
+
+    def _pace(self):
+        """Wait until the current frame is due (real time / speed)"""
+        if not self.speed:
+            return
+        recording = self.recording
+        offset = float(recording.timestamps[self.position] - recording.timestamps[0]) / self.speed
+        if self._started is None or self.position == 0:
+            self._started = time.monotonic() - offset
+        delay = self._started + offset - time.monotonic()
+        if delay > 0:
+            time.sleep(delay)
+
+    def grab(self) -> bool:
+        if not self.isOpened() or self.position >= len(self.recording):
+            return False
+        self._pace()
+        self.position += 1
+        return True
+
+    def retrieve(self, image: Optional[np.ndarray] = None):
+        if not self.isOpened() or self.position == 0:
+            return False, None
+        frame = self.recording.frames[self.position - 1]
+        if image is not None and image.shape == frame.shape and image.dtype == frame.dtype:
+            np.copyto(image, frame)
+            return True, image
+        return True, np.array(frame)
+
+    def read(self, image: Optional[np.ndarray] = None):
+        if not self.grab():
+            return False, None
+        return self.retrieve(image)
+
+    def get(self, prop: int) -> float:
+        if not self.isOpened():
+            return 0.0
+        recording = self.recording
+        if prop == cv2.CAP_PROP_FRAME_COUNT:
+            return float(len(recording))
+        if prop == cv2.CAP_PROP_POS_FRAMES:
+            return float(self.position)
+        if prop == cv2.CAP_PROP_POS_MSEC:
+            index = min(max(self.position - 1, 0), len(recording) - 1)
+            return float(recording.timestamps[index] - recording.timestamps[0]) * 1000.0
+        if prop == cv2.CAP_PROP_FPS:
+            return recording.fps
+        if prop == cv2.CAP_PROP_FRAME_WIDTH:
+            return float(recording.width)
+        if prop == cv2.CAP_PROP_FRAME_HEIGHT:
+            return float(recording.height)
+        return 0.0
+
+    def set(self, prop: int, value: float) -> bool:
+        if prop == cv2.CAP_PROP_POS_FRAMES and self.isOpened():
+            self.position = min(max(int(value), 0), len(self.recording))
+            self._started = None
+            return True
+        return False
+
+    def getBackendName(self) -> str:
+        return "REPLAY"
+
+    def release(self):
+        self.recording = None
+
+
+def record_source(source: str, path: str, duration: Optional[float] = None,
+                  max_frames: Optional[int] = None, ring=None,
+                  progress: Optional[Callable[[int, Optional[int]], None]] = None,
+                  should_stop: Optional[Callable[[], bool]] = None) -> Dict[str, Any]:
+    """
+    Record a source until duration, max_frames or should_stop.
+
+    Args:
+        source: Camera source, stream URL or video file path
+        path: Output recording
+        duration: Seconds to record
+        max_frames: Frames to record
+        ring: FrameRing of a running capture of the source; its frames are
+            recorded instead of opening the source a second time (with their
+            capture timestamps and the measured frame rate)
+        progress: Called as progress(frames_recorded, max_frames)
+        should_stop: Polled between frames; returning True ends the recording
+
+    Returns:
+        Recording info (see Recording.info)
+    """
+    from camera_manager import CameraManager
+
+    if duration is None and max_frames is None and should_stop is None:
+        raise ValueError("duration, max_frames or should_stop is required")
+    cap = None
+    if ring is None:
+        cap = CameraManager.open_capture(source)
+        if not cap.isOpened():
+            raise ValueError(f"Could not open source: {source}")
+    deadline = None if duration is None else time.monotonic() + float(duration)
+    started = time.time()
+    # Video files keep their own frame times, not how fast they were decoded
+    is_file = cap is not None and cap.get(cv2.CAP_PROP_FRAME_COUNT) > 0
+    recorder = None
+    last_seq = -1
+    try:
+        while max_frames is None or recorder is None or recorder.frame_count < max_frames:
+            if should_stop is not None and should_stop():
+                break
+            if deadline is not None and time.monotonic() >= deadline:
+                break
+            if ring is not None:
+                latest = ring.read_latest(copy=True)
+                if latest is None or latest[0] == last_seq:
+                    time.sleep(0.005)
+                    continue
+                last_seq, timestamp, frame = latest
+            else:
+                ret, frame = cap.read()
+                if not ret or frame is None:
+                    break
+                timestamp = started + cap.get(cv2.CAP_PROP_POS_MSEC) / 1000.0 if is_file else time.time()
+            if recorder is None:
+                # A ring has no nominal rate (its capture may be throttled by
+                # max_fps): measure it from the frame timestamps instead
+                fps = (cap.get(cv2.CAP_PROP_FPS) or 30.0) if cap is not None else None
+                recorder = FrameRecorder(path, frame.shape[1], frame.shape[0],
+                                         frame.shape[2] if frame.ndim == 3 else 1, fps)
+            recorder.write(frame, timestamp)
+            if progress is not None:
+                progress(recorder.frame_count, max_frames)
+    finally:
+        if cap is not None:
+            cap.release()
+        if recorder is not None:
+            recorder.close()
+    if recorder is None:
+        raise ValueError(f"No frame recorded from {source}")
+    return Recording(path).info()
+
+
+def bench(path: str, slots_path: str, decode_scale: int = 1, threshold: float = 0.15,
+          engine: str = 'adaptive') -> Dict[str, Any]:
+    """Detection over every frame of a recording as fast as possible"""
+    from occupancy_detector import OccupancyDetector
+    from utils import to_grayscale
+
+    with open(slots_path) as f:
+        slots = json.load(f)
+    slots = slots.get('slots', slots) if isinstance(slots, dict) else slots
+    detector = OccupancyDetector(threshold=threshold, engine=engine)
+    cap = ReplayCapture(f"replay://{os.path.abspath(path)}?speed=0")
+    if not cap.isOpened():
+        raise ValueError(f"Empty or unreadable recording: {path}")
+    latencies = []
+    started = time.perf_counter()
+    while True:
+        ret, frame = cap.read()
+        if not ret:
+            break
+        t = time.perf_counter()
+        detector.detect_occupancy_frame(to_grayscale(frame, decode_scale), slots, scale=decode_scale)
+        latencies.append(time.perf_counter() - t)
+    elapsed = time.perf_counter() - started
+    latencies.sort()
+    return {
+        "frames": len(latencies),
+        "seconds": round(elapsed, 3),
+        "fps": round(len(latencies) / elapsed, 1) if elapsed else None,
+        "p50_ms": round(latencies[len(latencies) // 2] * 1000, 2),
+        "p95_ms": round(latencies[int(len(latencies) * 0.95)] * 1000, 2)
+    }
+
+
+def main():
+    """Command-line entry point"""
+    parser = argparse.ArgumentParser(description="Record camera streams and replay them for testing")
+    commands = parser.add_subparsers(dest='command', required=True)
+    record = commands.add_parser('record', help="Record a source into a file")
+    record.add_argument('source', help="camera://N, stream URL or video file")
+    record.add_argument('output', help="Recording file to write")
+    record.add_argument('--duration', type=float, default=None, help="Seconds to record")
+    record.add_argument('--max-frames', type=int, default=None, help="Frames to record")
+    info = commands.add_parser('info', help="Describe a recording")
+    info.add_argument('recording')
+    bench_parser = commands.add_parser('bench', help="Run detection over every frame at full speed")
+    bench_parser.add_argument('recording')
+    bench_parser.add_argument('--slots', required=True, help="Slots JSON written by slot_selector.py")
+    bench_parser.add_argument('--decode-scale', type=int, default=1, choices=[1, 2, 4, 8])
+    bench_parser.add_argument('--threshold', type=float, default=0.15)
+    bench_parser.add_argument('--engine', default='adaptive')
+    args = parser.parse_args()
+
+    try:
+        if args.command == 'record':
+            if args.duration is None and args.max_frames is None:
+                parser.error("record needs --duration or --max-frames")
+            result = record_source(args.source, args.output, args.duration, args.max_frames)
+        elif args.command == 'info':
+            result = Recording(args.recording).info()
+        else:
+            result = bench(args.recording, args.slots, args.decode_scale, args.threshold, args.engine)
+    except ValueError as e:
+        print(f"Error: {e}", file=sys.stderr)
+        sys.exit(1)
+    print(json.dumps(result, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,525 @@
+"""
+Frame Ring - Shared-memory frame ring buffer between capture and detection
+
+Each capture source gets its own capture process that decodes frames
+straight into a multiprocessing.shared_memory ring. Detection code (Flask
+request threads or separate worker processes) attaches to the ring by name
+and reads frames as NumPy views, so megabyte frames are never pickled or
+copied between processes.
+
+Shared memory layout:
+    header   - magic, capacity, frame geometry, latest sequence number
+    slots    - per-slot stamp (seqlock) and capture timestamp
+    frames   - capacity contiguous frames of height x width x channels
+
+A slot's stamp is 2*seq+1 while the writer fills it and 2*seq+2 once the
+frame is complete. Readers check the stamp before and after using a frame
+(see FrameRing.is_current) because the writer only overwrites a slot
+after capacity-1 newer frames have been captured.
+
+Stopping a capture closes its ring while request, scheduler or preview
+threads may still hold it: reads on a closed ring return None (latest_seq
+is -1), frame views already handed out stay mapped until they are released,
+and the segment is unlinked once the last reference to the ring is dropped.
+"""
+import ctypes
+import multiprocessing
+import sys
+import threading
+import time
+import uuid
+import weakref
+from multiprocessing import shared_memory
+from typing import Dict, Any, List, Optional, Tuple
+
+import cv2
+import numpy as np
+from memory_budget import accountant, MemoryBudgetExceeded
+
+RING_MAGIC = 0x464E4752  # "RGNF"
+
+HEADER_DTYPE = np.dtype([
+    ('magic', '<u4'),
+    ('capacity', '<u4'),
+    ('height', '<u4'),
+    ('width', '<u4'),
+    ('channels', '<u4'),
+    ('reserved', '<u4'),
+    ('latest', '<i8'),
+])
+
+SLOT_DTYPE = np.dtype([
+    ('stamp', '<i8'),
+    ('timestamp', '<f8'),
+])
+
+# Frame data starts on a 64-byte boundary
+_ALIGN = 64
+
+_tracker_lock = threading.Lock()
+
+
+def _frames_offset(capacity: int) -> int:
+    offset = HEADER_DTYPE.itemsize + capacity * SLOT_DTYPE.itemsize
+    return (offset + _ALIGN - 1) // _ALIGN * _ALIGN
+
+
+def _attach_shared_memory(name: str) -> shared_memory.SharedMemory:
+    """
+    Attach to an existing segment without handing it to this process's
+    resource tracker (the creating process owns and unlinks it).
+    """
+    if sys.version_info >= (3, 13):
+        return shared_memory.SharedMemory(name=name, track=False)
+    from multiprocessing import resource_tracker
+    with _tracker_lock:
+        register = resource_tracker.register
+        resource_tracker.register = lambda *args, **kwargs: None
+        try:
+            return shared_memory.SharedMemory(name=name)
+        finally:
+            resource_tracker.register = register
+
+
+class _Mapping:
+    """
+    Array interface over a shared memory segment that keeps it mapped.
+
+    NumPy arrays created on a buffer do not hold a buffer export, so closing
+    the segment while views exist would leave them dangling. Arrays built on
+    this object reference it (and through it the segment), so the segment is
+    only closed, by SharedMemory's finalizer, once every view is gone.
+    """
+
+    def __init__(self, shm: shared_memory.SharedMemory):
+        self.shm = shm
+        first = ctypes.c_char.from_buffer(shm.buf)
+        address = ctypes.addressof(first)
+        del first  # release the export again
+        self.__array_interface__ = {"shape": (shm.size,), "typestr": "|u1",
+                                    "data": (address, False), "version": 3}
+
+
+class FrameRing:
+    """Fixed-size ring of frames in shared memory (single writer, many readers)"""
+
+    def __init__(self, shm: shared_memory.SharedMemory, owner: bool):
+        """
+        Wrap a shared memory segment. Use FrameRing.create or FrameRing.attach.
+
+        Args:
+            shm: Shared memory segment holding the ring
+            owner: True for the creating process (responsible for unlink)
+        """
+        self._shm = shm
+        self.owner = owner
+        self.closed = False
+
+        memory = np.asarray(_Mapping(shm))
+        self._header = np.ndarray((1,), dtype=HEADER_DTYPE, buffer=memory)
+        if int(self._header['magic'][0]) != RING_MAGIC:
+            raise ValueError(f"Shared memory {shm.name} is not a frame ring")
+
+        self.capacity = int(self._header['capacity'][0])
+        height = int(self._header['height'][0])
+        width = int(self._header['width'][0])
+        channels = int(self._header['channels'][0])
+        self.frame_shape = (height, width, channels) if channels > 1 else (height, width)
+
+        self._slots = np.ndarray((self.capacity,), dtype=SLOT_DTYPE, buffer=memory,
+                                 offset=HEADER_DTYPE.itemsize)
+        self._frames = np.ndarray((self.capacity,) + self.frame_shape, dtype=np.uint8,
+                                  buffer=memory, offset=_frames_offset(self.capacity))
+        self._next_seq = int(self._header['latest'][0]) + 1
+
+    @classmethod
+    def create(cls, width: int, height: int, channels: int = 3,
+               capacity: int = 4, name: Optional[str] = None) -> 'FrameRing':
+        """
+        Allocate a new ring.
+
+        Args:
+            width: Frame width
+            height: Frame height
+            channels: 3 for BGR, 1 for grayscale
+            capacity: Number of frames kept in the ring (>= 2)
+            name: Shared memory name (random if omitted)
+
+        Returns:
+            Owning FrameRing
+        """
+        if capacity < 2:
+            raise ValueError("Frame ring capacity must be at least 2")
+        if channels not in (1, 3):
+            raise ValueError("Frame ring channels must be 1 or 3")
+
+        size = _frames_offset(capacity) + capacity * width * height * channels
+        shm = shared_memory.SharedMemory(name=name or f"ring_{uuid.uuid4().hex[:12]}",
+                                         create=True, size=size)
+        header = np.ndarray((1,), dtype=HEADER_DTYPE, buffer=shm.buf)
+        header[0] = (RING_MAGIC, capacity, height, width, channels, 0, -1)
+        slots = np.ndarray((capacity,), dtype=SLOT_DTYPE, buffer=shm.buf,
+                           offset=HEADER_DTYPE.itemsize)
+        slots[:] = (0, 0.0)
+        del header, slots
+        return cls(shm, owner=True)
+
+    @classmethod
+    def attach(cls, name: str) -> 'FrameRing':
+        """
+        Attach to a ring created by another process.
+
+        Args:
+            name: Shared memory name (FrameRing.name)
+
+        Returns:
+            Non-owning FrameRing
+        """
+        return cls(_attach_shared_memory(name), owner=False)
+
+    @property
+    def name(self) -> str:
+        return self._shm.name
+
+    @property
+    def nbytes(self) -> int:
+        return self._shm.size
+
+    @property
+    def latest_seq(self) -> int:
+        """Sequence number of the newest complete frame (-1 if none yet or closed)"""
+        header = self._header
+        return int(header['latest'][0]) if header is not None else -1
+
+    # ---- writer side -------------------------------------------------
+
+    def begin_write(self) -> Tuple[int, np.ndarray]:
+        """
+        Claim the next slot for writing.
+
+        Returns:
+            (seq, view) - fill the view in place, then call commit(seq)
+        """
+        seq = self._next_seq
+        index = seq % self.capacity
+        self._slots['stamp'][index] = 2 * seq + 1
+        return seq, self._frames[index]
+
+    def commit(self, seq: int, timestamp: Optional[float] = None):
+        """Publish a slot filled after begin_write"""
+        index = seq % self.capacity
+        self._slots['timestamp'][index] = time.time() if timestamp is None else timestamp
+        self._slots['stamp'][index] = 2 * seq + 2
+        self._header['latest'][0] = seq
+        self._next_seq = seq + 1
+
+    def abort(self, seq: int):
+        """Give up on a slot claimed with begin_write (marks it empty)"""
+        self._slots['stamp'][seq % self.capacity] = 0
+
+    def write(self, frame: np.ndarray, timestamp: Optional[float] = None) -> int:
+        """
+        Copy a frame into the ring, resizing/converting it to the ring's geometry.
+
+        Args:
+            frame: BGR or grayscale frame
+            timestamp: Capture time (defaults to now)
+
+        Returns:
+            Sequence number of the written frame
+        """
+        seq, view = self.begin_write()
+        fit_frame(frame, view)
+        self.commit(seq, timestamp)
+        return seq
+
+    # ---- reader side -------------------------------------------------
+
+    def read(self, seq: int, copy: bool = False) -> Optional[Tuple[int, float, np.ndarray]]:
+        """
+        Read a specific frame.
+
+        Args:
+            seq: Sequence number
+            copy: Return a private copy instead of a shared-memory view
+
+        Returns:
+            (seq, timestamp, frame) or None if the frame is gone or
+            incomplete, or the ring is closed
+        """
+        # Local references: close() may run concurrently in another thread
+        slots, frames = self._slots, self._frames
+        if seq < 0 or slots is None or frames is None:
+            return None
+        index = seq % self.capacity
+        if int(slots['stamp'][index]) != 2 * seq + 2:
+            return None
+        timestamp = float(slots['timestamp'][index])
+        frame = frames[index]
+        if copy:
+            frame = frame.copy()
+            if not self.is_current(seq):
+                return None
+        return seq, timestamp, frame
+
+    def read_latest(self, copy: bool = False) -> Optional[Tuple[int, float, np.ndarray]]:
+        """
+        Read the newest complete frame.
+
+        A view stays valid for capacity-1 further captures; check
+        is_current(seq) after using it when that matters.
+
+        Args:
+            copy: Return a private copy instead of a shared-memory view
+
+        Returns:
+            (seq, timestamp, frame) or None if nothing has been captured yet
+        """
+        for _ in range(3):
+            result = self.read(self.latest_seq, copy=copy)
+            if result is not None:
+                return result
+        return None
+
+    def is_current(self, seq: int) -> bool:
+        """True if frame seq has not been overwritten since it was read (False once closed)"""
+        slots = self._slots
+        return slots is not None and int(slots['stamp'][seq % self.capacity]) == 2 * seq + 2
+
+    def latest_timestamp(self) -> Optional[float]:
+        slots, seq = self._slots, self.latest_seq
+        if slots is None or seq < 0:
+            return None
+        return float(slots['timestamp'][seq % self.capacity])
+
+    def close(self):
+        """
+        Stop using the ring. Threads still holding it read None from then
+        on; this process's mapping is released once the ring and every frame
+        view taken from it are gone (see _Mapping).
+        """
+        self.closed = True
+        self._header = self._slots = self._frames = None
+
+    def unlink(self):
+        """
+        Destroy the segment (owner only). Deferred until the last reference
+        to this ring is dropped, so threads still holding it are not cut off.
+        """
+        if self.owner:
+            weakref.finalize(self, self._shm.unlink)
+
+
+def fit_frame(frame: np.ndarray, dst: np.ndarray):
+    """Copy a frame into dst, converting channels and resizing as needed"""
+    if frame.ndim == 3 and dst.ndim == 2:
+        frame = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+    elif frame.ndim == 2 and dst.ndim == 3:
+        frame = cv2.cvtColor(frame, cv2.COLOR_GRAY2BGR)
+    if frame.shape[:2] != dst.shape[:2]:
+        cv2.resize(frame, (dst.shape[1], dst.shape[0]), dst=dst, interpolation=cv2.INTER_AREA)
+    else:
+        np.copyto(dst, frame)
+
+
+def capture_loop(source: str, ring_name: str, stop_event, max_fps: Optional[float] = None):
+    """
+    Capture process body: decode frames from a source into a ring until stopped.
+
+    Video files loop back to the start; live sources are reopened after a
+    read failure.
+
+    Args:
+        source: Camera source, stream URL or video file path
+        ring_name: Name of the FrameRing to write to
+        stop_event: multiprocessing.Event that ends the loop
+        max_fps: Optional cap on the capture rate
+    """
+    from camera_manager import CameraManager
+
+    ring = FrameRing.attach(ring_name)
+    min_interval = 1.0 / max_fps if max_fps else 0.0
+    cap = None
+    try:
+        while not stop_event.is_set():
+            if cap is None or not cap.isOpened():
+                cap = CameraManager.open_capture(source)
+                if not cap.isOpened():
+                    stop_event.wait(1.0)
+                    continue
+                cap.set(cv2.CAP_PROP_BUFFERSIZE, 1)
+
+            started = time.time()
+            seq, view = ring.begin_write()
+            # Decode straight into shared memory when the geometry matches
+            target = view if view.ndim == 3 else None
+            ret, frame = cap.read(target) if target is not None else cap.read()
+            if not ret or frame is None:
+                ring.abort(seq)
+                if cap.get(cv2.CAP_PROP_FRAME_COUNT) > 0:
+                    cap.set(cv2.CAP_PROP_POS_FRAMES, 0)  # video file: loop
+                else:
+                    cap.release()
+                    cap = None
+                    stop_event.wait(0.5)
+                continue
+            if frame is not view:
+                fit_frame(frame, view)
+            ring.commit(seq, started)
+
+            if min_interval:
+                remaining = min_interval - (time.time() - started)
+                if remaining > 0:
+                    stop_event.wait(remaining)
+    finally:
+        if cap is not None:
+            cap.release()
+        ring.close()
+
+
+class CaptureRegistry:
+    """Starts, tracks and stops one capture process + ring per source"""
+
+    def __init__(self):
+        # source_id -> entry (None while the capture is being started)
+        self._captures: Dict[str, Optional[Dict[str, Any]]] = {}
+        self._lock = threading.Lock()
+        # spawn: never fork the multi-threaded Flask process
+        self._context = multiprocessing.get_context('spawn')
+
+    def start(self, source_id: str, source: str,
+              width: Optional[int] = None, height: Optional[int] = None,
+              grayscale: bool = False, capacity: int = 4,
+              max_fps: Optional[float] = None, calibration=None) -> Dict[str, Any]:
+        """
+        Start capturing a source into a new ring.
+
+        Args:
+            source_id: Name used to refer to the capture (ring://<source_id>)
+            source: Camera source, stream URL or video file path
+            width, height: Ring frame size (probed from the source if omitted)
+            grayscale: Store single-channel frames (3x less memory)
+            capacity: Frames kept in the ring
+            max_fps: Optional cap on the capture rate
+            calibration: Optional undistort.Calibration of the camera; readers
+                of the ring undistort its frames with it
+
+        Returns:
+            Capture description (see describe)
+
+        Raises:
+            MemoryBudgetExceeded: If the ring does not fit in the memory budget
+        """
+        from camera_manager import CameraManager
+
+        # Reserve the id (None until the capture is running) so concurrent
+        # starts of the same source_id cannot both create a ring
+        with self._lock:
+            if source_id in self._captures:
+                raise ValueError(f"Capture already running: {source_id}")
+            self._captures[source_id] = None
+
+        try:
+            if not width or not height:
+                probe = CameraManager.probe_source(source)
+                if probe is None:
+                    raise ValueError(f"Could not read from source: {source}")
+                width, height = probe["width"], probe["height"]
+
+            ring = FrameRing.create(int(width), int(height), 1 if grayscale else 3, int(capacity))
+            try:
+                # Rings are pinned: counted against the memory budget, never evicted
+                accountant.track('capture_rings', source_id, ring.nbytes, pinned=True)
+            except MemoryBudgetExceeded:
+                ring.close()
+                ring.unlink()
+                raise
+            stop_event = self._context.Event()
+            process = self._context.Process(
+                target=capture_loop,
+                args=(source, ring.name, stop_event, max_fps),
+                name=f"capture-{source_id}",
+                daemon=True
+            )
+            try:
+                process.start()
+            except BaseException:
+                ring.close()
+                ring.unlink()
+                accountant.untrack('capture_rings', source_id)
+                raise
+        except BaseException:
+            with self._lock:
+                self._captures.pop(source_id, None)
+            raise
+
+        entry = {
+            "source_id": source_id,
+            "source": source,
+            "ring": ring,
+            "process": process,
+            "stop_event": stop_event,
+            "max_fps": max_fps,
+            "calibration": calibration,
+            "started_at": time.time()
+        }
+        with self._lock:
+            self._captures[source_id] = entry
+        return self.describe(entry)
+
+    def stop(self, source_id: str) -> bool:
+        """Stop a capture and free its ring. Returns False if it was not running."""
+        with self._lock:
+            if self._captures.get(source_id) is None:
+                return False  # not running, or still starting
+            entry = self._captures.pop(source_id)
+        entry["stop_event"].set()
+        entry["process"].join(timeout=5)
+        if entry["process"].is_alive():
+            entry["process"].terminate()
+            entry["process"].join(timeout=1)
+        entry["ring"].close()
+        entry["ring"].unlink()
+        accountant.untrack('capture_rings', source_id)
+        return True
+
+    def stop_all(self):
+        for source_id in list(self._captures):
+            self.stop(source_id)
+
+    def get_ring(self, source_id: str) -> Optional[FrameRing]:
+        entry = self._captures.get(source_id)
+        return entry["ring"] if entry else None
+
+    def get_calibration(self, source_id: str):
+        """Calibration the capture was started with, if any"""
+        entry = self._captures.get(source_id)
+        return entry["calibration"] if entry else None
+
+    def find_by_source(self, source: str) -> Optional[FrameRing]:
+        """Ring of a running capture for the given source string, if any"""
+        for entry in list(self._captures.values()):
+            if entry is not None and entry["source"] == source:
+                return entry["ring"]
+        return None
+
+    def list(self) -> List[Dict[str, Any]]:
+        return [self.describe(entry) for entry in list(self._captures.values()) if entry is not None]
+
+    @staticmethod
+    def describe(entry: Dict[str, Any]) -> Dict[str, Any]:
+        ring = entry["ring"]
+        return {
+            "source_id": entry["source_id"],
+            "source": entry["source"],
+            "ring_name": ring.name,
+            "frame_shape": list(ring.frame_shape),
+            "capacity": ring.capacity,
+            "bytes": ring.nbytes,
+            "alive": entry["process"].is_alive(),
+            "latest_seq": ring.latest_seq,
+            "latest_timestamp": ring.latest_timestamp(),
+            "max_fps": entry["max_fps"],
+            "calibrated": entry["calibration"] is not None,
+            "started_at": entry["started_at"]
+        }
@@ -0,0 +1,348 @@
+"""
+History Store - Append-only, memory-mapped occupancy history per parking lot
+
+Every detection result is appended as one fixed-width record per slot. Each
+lot is a directory holding one file per column:
+
+    ts.f8      - detection time (Unix seconds, float64)
+    slot.u4    - slot number (uint32)
+    ratio.f4   - occupancy ratio (float32)
+    status.u1  - status code (see occupancy_detector.STATUS_CODES)
+
+Columns are memory-mapped for reads, so range queries are a binary search on
+the timestamp column and aggregates (occupancy %, dwell times, hourly
+histograms) are vectorized NumPy over the selected slice. Timestamps are
+non-decreasing per lot: an append whose time is older than the last record
+(a detection that finished after a later one) is stamped with the last
+record's time instead.
+"""
+import os
+import re
+import threading
+import time
+from typing import Dict, Any, List, Optional
+
+import numpy as np
+from occupancy_detector import STATUS_CODES
+
+COLUMNS = {
+    "ts": np.dtype('<f8'),
+    "slot": np.dtype('<u4'),
+    "ratio": np.dtype('<f4'),
+    "status": np.dtype('u1'),
+}
+
+_LOT_ID_PATTERN = re.compile(r'^[A-Za-z0-9_-]{1,128}$')
+
+OCCUPIED = STATUS_CODES['occupied']
+VACANT = STATUS_CODES['vacant']
+
+
+def _column_file(name: str, dtype: np.dtype) -> str:
+    return f"{name}.{dtype.kind}{dtype.itemsize}"
+
+
+class HistoryStore:
+    """Per-lot columnar occupancy history"""
+
+    def __init__(self, root_dir: str):
+        """
+        Initialize the store.
+
+        Args:
+            root_dir: Directory holding one sub-directory per lot
+        """
+        self.root_dir = root_dir
+        self._locks: Dict[str, threading.Lock] = {}
+        self._locks_guard = threading.Lock()
+        # lot_id -> (row count, {column: memmap})
+        self._maps: Dict[str, Any] = {}
+
+    def _lot_dir(self, lot_id: str) -> str:
+        if not _LOT_ID_PATTERN.match(str(lot_id)):
+            raise ValueError(f"Invalid lot_id: {lot_id!r}")
+        return os.path.join(self.root_dir, str(lot_id))
+
+    def _lock(self, lot_id: str) -> threading.Lock:
+        with self._locks_guard:
+            return self._locks.setdefault(lot_id, threading.Lock())
+
+    def append(self, lot_id: str, results: List[Dict[str, Any]],
+               timestamp: Optional[float] = None) -> int:
+        """
+        Append one detection (all slots) to a lot's history.
+
+        Args:
+            lot_id: Parking lot identifier
+            results: Detection results from OccupancyDetector.detect_occupancy
+            timestamp: Detection time (defaults to now); clamped to the last
+                record's time so the timestamp column stays sorted
+
+        Returns:
+            Number of records written
+        """
+        if not results:
+            return 0
+        lot_dir = self._lot_dir(lot_id)
+        count = len(results)
+        columns = {
+            "slot": np.fromiter((r.get('slot_number', 0) for r in results), COLUMNS["slot"], count),
+            "ratio": np.fromiter((r.get('occupancy_ratio', 0.0) for r in results), COLUMNS["ratio"], count),
+            "status": np.fromiter((STATUS_CODES.get(r.get('status'), STATUS_CODES['unknown']) for r in results),
+                                  COLUMNS["status"], count),
+        }
+
+        with self._lock(lot_id):
+            os.makedirs(lot_dir, exist_ok=True)
+            rows = self._row_count(lot_dir)
+            ts = time.time() if timestamp is None else float(timestamp)
+            if rows:
+                ts = max(ts, self._last_timestamp(lot_dir, rows))
+            columns["ts"] = np.full(count, ts, dtype=COLUMNS["ts"])
+            for name, dtype in COLUMNS.items():
+                path = os.path.join(lot_dir, _column_file(name, dtype))
+                with open(path, 'r+b' if os.path.exists(path) else 'wb') as f:
+                    # Drop any partial tail left by an interrupted append
+                    f.truncate(rows * dtype.itemsize)
+                    f.seek(0, os.SEEK_END)
+                    f.write(columns[name].tobytes())
+        return count
+
+    @staticmethod
+    def _row_count(lot_dir: str) -> int:
+        """Rows present in every column (shortest column wins)"""
+        rows = None
+        for name, dtype in COLUMNS.items():
+            path = os.path.join(lot_dir, _column_file(name, dtype))
+            size = os.path.getsize(path) if os.path.exists(path) else 0
+            count = size // dtype.itemsize
+            rows = count if rows is None else min(rows, count)
+        return rows or 0
+
+    @staticmethod
+    def _last_timestamp(lot_dir: str, rows: int) -> float:
+        """Time of the last complete record"""
+        dtype = COLUMNS["ts"]
+        with open(os.path.join(lot_dir, _column_file("ts", dtype)), 'rb') as f:
+            f.seek((rows - 1) * dtype.itemsize)
+            return float(np.frombuffer(f.read(dtype.itemsize), dtype)[0])
+
+    def _columns(self, lot_id: str) -> Dict[str, np.ndarray]:
+        """Memory-mapped columns of a lot (re-mapped when the files grew)"""
+        lot_dir = self._lot_dir(lot_id)
+        rows = self._row_count(lot_dir)
+        cached = self._maps.get(lot_id)
+        if cached is not None and cached[0] == rows:
+            return cached[1]
+        if rows == 0:
+            return {name: np.empty(0, dtype) for name, dtype in COLUMNS.items()}
+        maps = {
+            name: np.memmap(os.path.join(lot_dir, _column_file(name, dtype)), dtype=dtype, mode='r', shape=(rows,))
+            for name, dtype in COLUMNS.items()
+        }
+        self._maps[lot_id] = (rows, maps)
+        return maps
+
+    def query(self, lot_id: str, start: Optional[float] = None, end: Optional[float] = None,
+              slot: Optional[int] = None) -> Dict[str, np.ndarray]:
+        """
+        Select the records of a time range.
+
+        Args:
+            lot_id: Parking lot identifier
+            start: Inclusive start time (Unix seconds)
+            end: Exclusive end time (Unix seconds)
+            slot: Restrict to one slot number
+
+        Returns:
+            Dictionary of column arrays (views into the mapped files unless
+            filtered by slot)
+        """
+        columns = self._columns(lot_id)
+        ts = columns["ts"]
+        lo = 0 if start is None else int(np.searchsorted(ts, start, side='left'))
+        hi = len(ts) if end is None else int(np.searchsorted(ts, end, side='left'))
+        selected = {name: column[lo:hi] for name, column in columns.items()}
+        if slot is not None:
+            keep = selected["slot"] == slot
+            selected = {name: column[keep] for name, column in selected.items()}
+        return selected
+
+    def aggregate(self, lot_id: str, start: Optional[float] = None, end: Optional[float] = None,
+                  slot: Optional[int] = None, tz_offset_minutes: int = 0) -> Dict[str, Any]:
+        """
+        Compute occupancy aggregates over a time range.
+
+        Args:
+            lot_id: Parking lot identifier
+            start: Inclusive start time (Unix seconds)
+            end: Exclusive end time (Unix seconds)
+            slot: Restrict to one slot number
+            tz_offset_minutes: Offset from UTC used for the hourly histogram
+
+        Returns:
+            Dictionary with record counts, occupancy %, per-slot occupancy,
+            dwell time statistics and a 24-bin hourly occupancy histogram
+        """
+        records = self.query(lot_id, start, end, slot)
+        ts = np.asarray(records["ts"])
+        slots = np.asarray(records["slot"])
+        status = np.asarray(records["status"])
+
+        summary: Dict[str, Any] = {
+            "lot_id": lot_id,
+            "records": int(len(ts)),
+            "start": float(ts[0]) if len(ts) else None,
+            "end": float(ts[-1]) if len(ts) else None,
+            "occupancy_percent": None,
+            "slots": [],
+            "dwell": {"count": 0, "open": 0, "mean": None, "median": None, "p90": None, "max": None},
+            "hourly_occupancy_percent": [None] * 24
+        }
+        if not len(ts):
+            return summary
+
+        grid = _as_grid(ts, slots, status)
+        if grid is not None:
+            stats = _grid_stats(*grid, tz_offset_minutes)
+        else:
+            stats = _sorted_stats(ts, slots, status, tz_offset_minutes)
+        slot_ids, occupied_time, known_time, dwell, open_runs, hourly_hits, hourly_samples = stats
+
+        if known_time.sum() > 0:
+            summary["occupancy_percent"] = float(100.0 * occupied_time.sum() / known_time.sum())
+        summary["slots"] = [
+            {"slot_number": int(s), "occupancy_percent": float(100.0 * o / k) if k > 0 else None}
+            for s, o, k in zip(slot_ids, occupied_time, known_time)
+        ]
+        summary["dwell"]["count"] = int(len(dwell))
+        summary["dwell"]["open"] = int(open_runs)
+        if len(dwell):
+            summary["dwell"].update({
+                "mean": float(dwell.mean()),
+                "median": float(np.median(dwell)),
+                "p90": float(np.percentile(dwell, 90)),
+                "max": float(dwell.max())
+            })
+        summary["hourly_occupancy_percent"] = [
+            float(100.0 * h / n) if n else None for h, n in zip(hourly_hits, hourly_samples)
+        ]
+        return summary
+
+    def lots(self) -> List[str]:
+        """Lot ids that have history"""
+        if not os.path.isdir(self.root_dir):
+            return []
+        return sorted(d for d in os.listdir(self.root_dir) if _LOT_ID_PATTERN.match(d))
+
+
+# ---- aggregation helpers ----------------------------------------------
+#
+# Both helpers return (slot_ids, occupied_time, known_time, dwell, open_runs,
+# hourly_hits, hourly_samples). Occupancy is time-weighted: a sample holds
+# until the slot's next sample. A dwell is the time from the first occupied
+# sample of a run to the first vacant sample after it; runs still occupied at
+# the end of the range are counted as open.
+
+
+def _as_grid(ts: np.ndarray, slots: np.ndarray, status: np.ndarray):
+    """
+    View records as a (detections x slots) grid when every detection wrote
+    the same slots in the same order with a known status (the normal case).
+    Returns None otherwise.
+
+    Detections can share a timestamp (appends are clamped to the last
+    record's time), so the records at the first timestamp are only taken as
+    one row when their slot numbers are unique.
+    """
+    width = int(np.searchsorted(ts, ts[0], side='right'))
+    if width == 0 or len(ts) % width:
+        return None
+    if len(np.unique(slots[:width])) != width:
+        return None
+    ts2 = ts.reshape(-1, width)
+    slots2 = slots.reshape(-1, width)
+    if not np.array_equal(ts2[:, 0], ts2[:, -1]):
+        return None
+    if not (slots2 == slots2[0]).all():
+        return None
+    if not ((status == OCCUPIED) | (status == VACANT)).all():
+        return None
+    return ts2[:, 0], slots2[0], status.reshape(-1, width) == OCCUPIED
+
+
+def _hourly(ts: np.ndarray, tz_offset_minutes: int) -> np.ndarray:
+    return ((ts + tz_offset_minutes * 60) // 3600 % 24).astype(np.intp)
+
+
+def _grid_stats(row_ts: np.ndarray, slot_ids: np.ndarray, occupied: np.ndarray, tz_offset_minutes: int):
+    rows = len(row_ts)
+    duration = np.zeros(rows)
+    duration[:-1] = np.diff(row_ts)
+    if duration.sum() <= 0:
+        duration[:] = 1.0  # single detection: plain mean
+    occupied_time = duration @ occupied
+    known_time = np.full(len(slot_ids), duration.sum())
+
+    # Run boundaries along the time axis (few compared to samples)
+    change = np.diff(occupied.view(np.int8), axis=0)
+    start_rows, start_cols = np.nonzero(change == 1)
+    end_rows, end_cols = np.nonzero(change == -1)
+    first_rows = np.zeros(np.count_nonzero(occupied[0]), dtype=np.intp)
+    start_rows = np.concatenate([first_rows, start_rows + 1])
+    start_cols = np.concatenate([np.flatnonzero(occupied[0]), start_cols])
+    end_rows += 1
+    # Order by slot, then time; the k-th end of a slot closes its k-th run
+    start_order = np.lexsort((start_rows, start_cols))
+    end_order = np.lexsort((end_rows, end_cols))
+    start_rows, start_cols = start_rows[start_order], start_cols[start_order]
+    end_rows = end_rows[end_order]
+    open_cols = occupied[-1]
+    closed = np.ones(len(start_rows), dtype=bool)
+    if open_cols.any():
+        last_start = np.cumsum(np.bincount(start_cols, minlength=len(slot_ids))) - 1
+        closed[last_start[open_cols]] = False
+    dwell = row_ts[end_rows] - row_ts[start_rows[closed]]
+
+    hours = _hourly(row_ts, tz_offset_minutes)
+    hourly_hits = np.bincount(hours, weights=occupied.sum(axis=1), minlength=24)
+    hourly_samples = np.bincount(hours, minlength=24) * len(slot_ids)
+    return slot_ids, occupied_time, known_time, dwell, int(open_cols.sum()), hourly_hits, hourly_samples
+
+
+def _sorted_stats(ts: np.ndarray, slots: np.ndarray, status: np.ndarray, tz_offset_minutes: int):
+    known = (status == OCCUPIED) | (status == VACANT)
+    ts, slots, occupied = ts[known], slots[known], status[known] == OCCUPIED
+    if not len(ts):
+        empty = np.zeros(0)
+        return empty, empty, empty, empty, 0, np.zeros(24), np.zeros(24)
+
+    # Group by slot, keeping time order inside each slot
+    order = np.argsort(slots, kind='stable')
+    slots_sorted, ts_sorted, occ_sorted = slots[order], ts[order], occupied[order]
+    same_as_prev = np.zeros(len(order), dtype=bool)
+    same_as_prev[1:] = slots_sorted[1:] == slots_sorted[:-1]
+
+    duration = np.zeros(len(order))
+    duration[:-1] = np.where(same_as_prev[1:], ts_sorted[1:] - ts_sorted[:-1], 0.0)
+    if duration.sum() <= 0:
+        duration[:] = 1.0
+    slot_ids, group_start = np.unique(slots_sorted, return_index=True)
+    known_time = np.add.reduceat(duration, group_start)
+    occupied_time = np.add.reduceat(duration * occ_sorted, group_start)
+
+    prev_occ = np.zeros(len(order), dtype=bool)
+    prev_occ[1:] = occ_sorted[:-1]
+    prev_occ &= same_as_prev
+    run_starts = np.flatnonzero(occ_sorted & ~prev_occ)
+    run_ends = np.flatnonzero(~occ_sorted & prev_occ)
+    end_pos = np.searchsorted(run_ends, run_starts)
+    has_end = end_pos < len(run_ends)
+    matched = np.zeros(len(run_starts), dtype=bool)
+    matched[has_end] = slots_sorted[run_ends[end_pos[has_end]]] == slots_sorted[run_starts[has_end]]
+    dwell = ts_sorted[run_ends[end_pos[matched]]] - ts_sorted[run_starts[matched]]
+
+    hours = _hourly(ts, tz_offset_minutes)
+    hourly_hits = np.bincount(hours, weights=occupied, minlength=24)
+    hourly_samples = np.bincount(hours, minlength=24)
+    return slot_ids, occupied_time, known_time, dwell, int(len(run_starts) - matched.sum()), hourly_hits, hourly_samples
@@ -0,0 +1,208 @@
+"""
+Jobs - Asynchronous execution of long-running operations
+
+Long operations (interactive slot definition, whole-video detection, ...)
+are submitted as jobs and run on a dedicated, bounded thread pool so they
+never occupy the request workers that serve real-time detection. Submitting
+returns a job id immediately; clients poll the job, stream its progress and
+fetch the result when it finishes.
+
+Job functions receive the Job as their first argument and may call
+job.report(progress, message) and check job.cancel_requested.
+"""
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, Any, List, Optional
+
+QUEUED = 'queued'
+RUNNING = 'running'
+SUCCEEDED = 'succeeded'
+FAILED = 'failed'
+CANCELLED = 'cancelled'
+
+FINISHED_STATES = (SUCCEEDED, FAILED, CANCELLED)
+
+
+class JobQueueFull(Exception):
+    """Raised when the job queue has no room for another job"""
+
+
+class Job:
+    """State of one submitted operation"""
+
+    def __init__(self, kind: str, params: Optional[Dict[str, Any]] = None):
+        self.id = uuid.uuid4().hex
+        self.kind = kind
+        self.params = params or {}
+        self.status = QUEUED
+        self.progress = 0.0
+        self.message = ''
+        self.result: Any = None
+        self.error: Optional[str] = None
+        self.created_at = time.time()
+        self.started_at: Optional[float] = None
+        self.finished_at: Optional[float] = None
+        self.cancel_requested = False
+        self.future = None
+        # Incremented on every change; used to stream updates
+        self.version = 0
+        self._changed = threading.Condition()
+
+    def report(self, progress: Optional[float] = None, message: Optional[str] = None):
+        """
+        Publish progress from inside the job function.
+
+        Args:
+            progress: Fraction complete (0-1)
+            message: Short human-readable status
+        """
+        with self._changed:
+            if progress is not None:
+                self.progress = min(max(float(progress), 0.0), 1.0)
+            if message is not None:
+                self.message = message
+            self.version += 1
+            self._changed.notify_all()
+
+    def _set_status(self, status: str, **fields):
+        with self._changed:
+            self.status = status
+            for name, value in fields.items():
+                setattr(self, name, value)
+            self.version += 1
+            self._changed.notify_all()
+
+    def wait_for_change(self, version: int, timeout: float) -> int:
+        """
+        Block until the job changes past version (or timeout).
+
+        Returns:
+            Current version
+        """
+        with self._changed:
+            self._changed.wait_for(lambda: self.version != version or self.finished, timeout)
+            return self.version
+
+    @property
+    def finished(self) -> bool:
+        return self.status in FINISHED_STATES
+
+    def to_dict(self, include_result: bool = False) -> Dict[str, Any]:
+        data = {
+            "job_id": self.id,
+            "type": self.kind,
+            "status": self.status,
+            "progress": self.progress,
+            "message": self.message,
+            "error": self.error,
+            "created_at": self.created_at,
+            "started_at": self.started_at,
+            "finished_at": self.finished_at
+        }
+        if include_result:
+            data["result"] = self.result
+        return data
+
+
+class JobManager:
+    """Bounded executor plus registry of submitted jobs"""
+
+    def __init__(self, max_workers: int = 2, max_queued: int = 100, max_finished: int = 200):
+        """
+        Initialize the job manager.
+
+        Args:
+            max_workers: Jobs running concurrently
+            max_queued: Jobs waiting to run before submissions are refused
+            max_finished: Finished jobs kept for status/result queries
+        """
+        self.max_workers = max_workers
+        self.max_queued = max_queued
+        self.max_finished = max_finished
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='job')
+        self._jobs: "OrderedDict[str, Job]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def submit(self, kind: str, fn: Callable[..., Any], params: Optional[Dict[str, Any]] = None) -> Job:
+        """
+        Queue a job.
+
+        Args:
+            kind: Job type name
+            fn: Callable run as fn(job, **params)
+            params: Keyword arguments for fn
+
+        Returns:
+            The queued Job
+
+        Raises:
+            JobQueueFull: If max_queued jobs are already waiting
+        """
+        job = Job(kind, params)
+        with self._lock:
+            queued = sum(1 for j in self._jobs.values() if j.status == QUEUED)
+            if queued >= self.max_queued:
+                raise JobQueueFull(f"Job queue is full ({queued} jobs waiting)")
+            self._jobs[job.id] = job
+            self._prune()
+        job.future = self._executor.submit(self._run, job, fn)
+        return job
+
+    def _run(self, job: Job, fn: Callable[..., Any]):
+        if job.cancel_requested:
+            job._set_status(CANCELLED, finished_at=time.time())
+            return
+        job._set_status(RUNNING, started_at=time.time())
+        try:
+            result = fn(job, **job.params)
+        except Exception as e:
+            job._set_status(FAILED, error=str(e), finished_at=time.time())
+            return
+        if job.cancel_requested:
+            job._set_status(CANCELLED, finished_at=time.time())
+        else:
+            job._set_status(SUCCEEDED, result=result, progress=1.0, finished_at=time.time())
+
+    def _prune(self):
+        """Forget the oldest finished jobs beyond max_finished (lock held)"""
+        finished = [job_id for job_id, job in self._jobs.items() if job.finished]
+        for job_id in finished[:max(len(finished) - self.max_finished, 0)]:
+            del self._jobs[job_id]
+
+    def get(self, job_id: str) -> Optional[Job]:
+        return self._jobs.get(job_id)
+
+    def list(self) -> List[Job]:
+        with self._lock:
+            return list(self._jobs.values())
+
+    def cancel(self, job_id: str) -> Optional[Job]:
+        """
+        Cancel a job: queued jobs never start, running jobs are asked to stop
+        (job functions check job.cancel_requested).
+
+        Returns:
+            The job, or None if unknown
+        """
+        job = self.get(job_id)
+        if job is None:
+            return None
+        job.cancel_requested = True
+        if job.status == QUEUED and job.future is not None and job.future.cancel():
+            job._set_status(CANCELLED, finished_at=time.time())
+        return job
+
+    def stats(self) -> Dict[str, Any]:
+        jobs = self.list()
+        counts = {state: 0 for state in (QUEUED, RUNNING) + FINISHED_STATES}
+        for job in jobs:
+            counts[job.status] += 1
+        return {"max_workers": self.max_workers, "max_queued": self.max_queued, **counts}
+
+    def shutdown(self):
+        for job in self.list():
+            job.cancel_requested = True
+        self._executor.shutdown(wait=False, cancel_futures=True)
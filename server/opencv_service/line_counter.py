@@ -0,0 +1,307 @@
+"""
+Line Counter - Lot occupancy from vehicles crossing the entrance
+
+For lots whose camera only sees the gate, per-slot analysis is wasted work.
+A counter watches a thin band across a configured line instead:
+
+    - the band (two strips, one on each side of the line) is sampled with a
+      cached remap table, so each frame costs only the band's pixels
+      (a few thousand instead of millions)
+    - each strip keeps a running-average background; a lane of a strip is
+      active when enough of its pixels differ from it
+    - a vehicle crossing activates one strip, then both, then only the
+      other; once the lane is quiet again the crossing is counted in the
+      direction of the strip that fired first. Vehicles that back out clear
+      through the strip they came in by and are not counted
+    - the lot's count is initial_count + entries - exits, clamped to
+      [0, capacity]
+
+The line is given like slot coordinates: two normalized points plus the
+size of the image they were drawn on. Walking from the first point to the
+second, entering vehicles move towards entry_side ("right" or "left" as
+seen on the image).
+"""
+import time
+from typing import Callable, Dict, Any, Iterator, List, Optional, Tuple
+
+import cv2
+import numpy as np
+from utils import to_grayscale
+
+ENTRY_SIDES = ('right', 'left')
+
+
+class LineCounter:
+    """Two-strip tripwire counting crossings of a line in both directions"""
+
+    def __init__(self, line: List[List[float]], image_width: int, image_height: int,
+                 band: int = 16, lanes: int = 1, entry_side: str = 'right',
+                 capacity: Optional[int] = None, initial_count: int = 0,
+                 pixel_threshold: int = 25, min_fraction: float = 0.25,
+                 clear_frames: int = 2, learning_rate: float = 0.05):
+        """
+        Initialize the counter.
+
+        Args:
+            line: [[x1, y1], [x2, y2]] normalized (0-1) line across the entrance
+            image_width, image_height: Size of the image the line was drawn on
+            band: Width of each strip in pixels of that image
+            lanes: Number of equal segments of the line counted independently
+                (each should be about one vehicle wide: a strip is active
+                when min_fraction of its lane is covered)
+            entry_side: Side of the line (walking from the first point to the
+                second) that entering vehicles move towards
+            capacity: Lot capacity (the count is clamped to it)
+            initial_count: Vehicles in the lot when counting starts
+            pixel_threshold: Gray level difference from the background that
+                makes a pixel foreground
+            min_fraction: Foreground fraction that makes a lane's strip active
+            clear_frames: Quiet frames that end a crossing
+            learning_rate: Background adaptation rate (foreground pixels adapt
+                20 times slower, so stopped vehicles are absorbed eventually)
+        """
+        try:
+            (x1, y1), (x2, y2) = line
+        except (TypeError, ValueError):
+            raise ValueError("line must be [[x1, y1], [x2, y2]]")
+        if entry_side not in ENTRY_SIDES:
+            raise ValueError(f"entry_side must be one of {ENTRY_SIDES}")
+        if int(image_width) <= 0 or int(image_height) <= 0:
+            raise ValueError("image_width and image_height must be positive")
+        if int(band) < 1 or int(lanes) < 1:
+            raise ValueError("band and lanes must be at least 1")
+        if capacity is not None and int(capacity) < 0:
+            raise ValueError("capacity must not be negative")
+        self.line = [[float(x1), float(y1)], [float(x2), float(y2)]]
+        self.image_width = int(image_width)
+        self.image_height = int(image_height)
+        if (x1 - x2) * self.image_width == 0 and (y1 - y2) * self.image_height == 0:
+            raise ValueError("line endpoints must differ")
+        self.band = int(band)
+        self.lanes = int(lanes)
+        self.entry_side = entry_side
+        self.capacity = None if capacity is None else int(capacity)
+        self.initial_count = int(initial_count)
+        self.pixel_threshold = pixel_threshold
+        self.min_fraction = min_fraction
+        self.clear_frames = max(int(clear_frames), 1)
+        self.learning_rate = learning_rate
+
+        self.entries = 0
+        self.exits = 0
+        self.frames = 0
+        self.events: List[Dict[str, Any]] = []  # most recent crossings
+        self._maps: Dict[Tuple[int, int], Tuple[np.ndarray, np.ndarray]] = {}
+        self._lane_bounds: List[int] = []
+        self._background: Optional[np.ndarray] = None
+        # Per lane: strip that fired first / last during the current event
+        # (0: first strip, 1: second strip) and quiet frames since
+        self._first: List[Optional[int]] = [None] * self.lanes
+        self._last: List[Optional[int]] = [None] * self.lanes
+        self._quiet = [0] * self.lanes
+
+    # Sampling
+
+    def _band_maps(self, width: int, height: int) -> Tuple[np.ndarray, np.ndarray]:
+        """Remap tables sampling the band from frames of a given size (cached)"""
+        maps = self._maps.get((width, height))
+        if maps is not None:
+            return maps
+        sx, sy = width / self.image_width, height / self.image_height
+        (x1, y1), (x2, y2) = self.line
+        p1 = np.array([x1 * width, y1 * height], dtype=np.float32)
+        p2 = np.array([x2 * width, y2 * height], dtype=np.float32)
+        direction = p2 - p1
+        length = float(np.hypot(*direction))
+        # Right-hand side of p1 -> p2 on the image (y points down)
+        normal = np.array([-direction[1], direction[0]], dtype=np.float32) / length
+        strip = max(int(round(self.band * (sx + sy) / 2)), 1)
+        samples = max(int(round(length)), self.lanes)
+        along = np.linspace(0.0, 1.0, samples, dtype=np.float32)
+        # Rows 0..strip-1 are left of the line, strip..2*strip-1 right of it
+        across = np.arange(-strip, strip, dtype=np.float32) + 0.5
+        points = p1 + along[None, :, None] * direction + across[:, None, None] * normal
+        map_x = np.ascontiguousarray(points[..., 0])
+        map_y = np.ascontiguousarray(points[..., 1])
+        self._maps[(width, height)] = maps = (map_x, map_y)
+        self._lane_bounds = np.linspace(0, samples, self.lanes + 1).astype(int).tolist()
+        self._background = None  # a new frame size restarts the background
+        return maps
+
+    def extract(self, frame: np.ndarray) -> np.ndarray:
+        """
+        Sample the band from a frame (only the band's pixels are read).
+
+        Returns:
+            Grayscale band, 2*strip rows by one column per line pixel
+        """
+        height, width = frame.shape[:2]
+        map_x, map_y = self._band_maps(width, height)
+        band = cv2.remap(frame, map_x, map_y, cv2.INTER_NEAREST, borderMode=cv2.BORDER_REPLICATE)
+        return to_grayscale(band) if band.ndim == 3 else band
+
+    # Counting
+
+    @property
+    def count(self) -> int:
+        count = self.initial_count + self.entries - self.exits
+        count = max(count, 0)
+        return count if self.capacity is None else min(count, self.capacity)
+
+    def update(self, frame: np.ndarray, timestamp: Optional[float] = None) -> List[Dict[str, Any]]:
+        """Process one frame (see update_band)"""
+        return self.update_band(self.extract(frame), timestamp)
+
+    def update_band(self, band: np.ndarray, timestamp: Optional[float] = None) -> List[Dict[str, Any]]:
+        """
+        Process the band of one frame.
+
+        Args:
+            band: Output of extract
+            timestamp: Frame time (defaults to now)
+
+        Returns:
+            Crossings completed by this frame: [{"lane", "direction", "timestamp"}]
+        """
+        self.frames += 1
+        band = band.astype(np.float32)
+        if self._background is None or self._background.shape != band.shape:
+            self._background = band.copy()
+            return []
+
+        foreground = cv2.absdiff(band, self._background) > self.pixel_threshold
+        still = (~foreground).astype(np.uint8)
+        cv2.accumulateWeighted(band, self._background, self.learning_rate, mask=still)
+        cv2.accumulateWeighted(band, self._background, self.learning_rate / 20, mask=1 - still)
+
+        strip = band.shape[0] // 2
+        # Foreground fraction per (strip, lane)
+        bounds = self._lane_bounds
+        if len(bounds) != self.lanes + 1 or bounds[-1] != band.shape[1]:
+            bounds = np.linspace(0, band.shape[1], self.lanes + 1).astype(int).tolist()
+        fractions = np.array([[foreground[rows, bounds[lane]:bounds[lane + 1]].mean()
+                               for lane in range(self.lanes)]
+                              for rows in (slice(0, strip), slice(strip, None))])
+        active = fractions >= self.min_fraction
+
+        crossings = []
+        for lane in range(self.lanes):
+            first_strip, second_strip = bool(active[0, lane]), bool(active[1, lane])
+            if first_strip or second_strip:
+                self._quiet[lane] = 0
+                if first_strip != second_strip:
+                    side = 0 if first_strip else 1
+                    if self._first[lane] is None:
+                        self._first[lane] = side
+                    self._last[lane] = side
+                continue
+            if self._first[lane] is None and self._last[lane] is None:
+                continue
+            self._quiet[lane] += 1
+            if self._quiet[lane] < self.clear_frames:
+                continue
+            first, last = self._first[lane], self._last[lane]
+            self._first[lane] = self._last[lane] = None
+            if first is None or first == last:
+                continue  # backed out, or never seen on one side only
+            towards_right = first == 0
+            direction = 'in' if towards_right == (self.entry_side == 'right') else 'out'
+            if direction == 'in':
+                self.entries += 1
+            else:
+                self.exits += 1
+            crossings.append({
+                "lane": lane,
+                "direction": direction,
+                "timestamp": time.time() if timestamp is None else timestamp
+            })
+        if crossings:
+            self.events = (self.events + crossings)[-20:]
+        return crossings
+
+    def reset(self, count: int = 0):
+        """Restart counting from a known number of vehicles in the lot"""
+        self.initial_count = int(count)
+        self.entries = self.exits = 0
+
+    def snapshot(self) -> Dict[str, Any]:
+        """Running totals of the counter"""
+        return {
+            "count": self.count,
+            "capacity": self.capacity,
+            "available": None if self.capacity is None else self.capacity - self.count,
+            "entries": self.entries,
+            "exits": self.exits,
+            "frames": self.frames,
+            "recent": list(self.events)
+        }
+
+    def lot_result(self) -> Dict[str, Any]:
+        """
+        Lot-level result in the slot result format ("gate" entry): occupied
+        when the lot is full, with the running count.
+        """
+        count = self.count
+        full = self.capacity is not None and count >= self.capacity
+        return {
+            'slot_id': 'gate',
+            'slot_number': 0,
+            'status': 'occupied' if full else 'vacant',
+            'occupancy_ratio': float(count / self.capacity) if self.capacity else 0.0,
+            'count': count,
+            'capacity': self.capacity,
+            'available': None if self.capacity is None else self.capacity - count,
+            'confidence': 1.0
+        }
+
+
+def create_counter(options: Dict[str, Any]) -> LineCounter:
+    """
+    Counter from request options: line, image_width, image_height and the
+    optional band, lanes, entry_side, capacity, initial_count,
+    pixel_threshold, min_fraction, clear_frames and learning_rate.
+
+    Raises:
+        ValueError: If the options are missing or invalid
+    """
+    required = ('line', 'image_width', 'image_height')
+    missing = [name for name in required if options.get(name) is None]
+    if missing:
+        raise ValueError(f"Gate counting requires {', '.join(missing)}")
+    optional = ('band', 'lanes', 'entry_side', 'capacity', 'initial_count',
+                'pixel_threshold', 'min_fraction', 'clear_frames', 'learning_rate')
+    return LineCounter(options['line'], options['image_width'], options['image_height'],
+                       **{name: options[name] for name in optional if options.get(name) is not None})
+
+
+def count_video(video_path: str, counter: LineCounter, max_frames: Optional[int] = None,
+                progress: Optional[Callable[[int, int], None]] = None,
+                should_stop: Optional[Callable[[], bool]] = None) -> Iterator[Dict[str, Any]]:
+    """
+    Count the crossings of a video file (every frame is needed to follow
+    vehicles through the band).
+
+    Yields:
+        {"frame": index, "timestamp_ms": position, "lane", "direction"} per crossing
+    """
+    cap = cv2.VideoCapture(video_path)
+    if not cap.isOpened():
+        raise ValueError(f"Could not open video file: {video_path}")
+    try:
+        total_frames = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
+        index = 0
+        while max_frames is None or index < max_frames:
+            if should_stop is not None and should_stop():
+                break
+            ret, frame = cap.read()
+            if not ret or frame is None:
+                break
+            timestamp_ms = cap.get(cv2.CAP_PROP_POS_MSEC)
+            for crossing in counter.update(frame, timestamp_ms / 1000.0):
+                yield {"frame": index, "timestamp_ms": timestamp_ms,
+                       "lane": crossing["lane"], "direction": crossing["direction"]}
+            index += 1
+            if progress is not None and index % 25 == 0:
+                progress(index, total_frames)
+    finally:
+        cap.release()
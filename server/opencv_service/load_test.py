@@ -0,0 +1,442 @@
+"""
+Load test - Measure how many lots a detection host can serve
+
+Starts the service locally (or targets a running one), generates synthetic
+lots and drives /detect-occupancy, then reports per configuration:
+throughput, p50/p95/p99 latency, errors, and the service's CPU (cores) and
+peak resident memory.
+
+Every lot is a slot grid drawn at the requested resolution; occupied slots
+hold a textured "car". A sequence of frames per lot is written up front,
+each flipping a --churn fraction of the previous frame's slots, so requests
+see realistic status changes without the generator costing CPU during the
+run.
+
+Load is closed-loop (each of --concurrency clients sends its next request
+as soon as the previous one returns) or, with --rate, open-loop Poisson
+arrivals at that many requests per second across all clients.
+
+Each configuration runs once per transport (--transports):
+    http         - POST /detect-occupancy
+    http-health  - GET /health, then POST /detect-occupancy (the Node
+                   backend's sequence)
+    socket       - the Unix socket protocol (socket_server.py), all clients
+                   pipelining over one connection, slot layouts sent once
+Small frames and few slots (e.g. --resolutions 640x360 --slots 10) make
+the transports' own overhead visible.
+
+Usage:
+    python load_test.py --resolutions 1280x720,1920x1080 --slots 20,100 \\
+        --concurrency 1,4,8 [--lots 8] [--duration 10] [--rate 0] \\
+        [--churn 0.1] [--transports http,socket] \\
+        [--url http://localhost:5001 --pid 1234 --socket /tmp/detect.sock] [--json out.json]
+"""
+import argparse
+import http.client
+import itertools
+import json
+import os
+import random
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+from typing import Callable, Dict, Any, List, Optional
+
+import cv2
+import numpy as np
+from startup import parse_resolutions
+
+
+# ---- synthetic lots ---------------------------------------------------------
+
+def make_slots(count: int, width: int, height: int) -> List[Dict[str, Any]]:
+    """Slot grid covering the frame, in slot_selector.py format"""
+    cols = max(int(round((count * width / height) ** 0.5)), 1)
+    rows = -(-count // cols)
+    slots = []
+    for i in range(count):
+        r, c = divmod(i, cols)
+        x0, y0 = (c + 0.1) / cols, (r + 0.1) / rows
+        x1, y1 = (c + 0.9) / cols, (r + 0.9) / rows
+        slots.append({
+            "slot_id": f"S{i + 1}",
+            "slot_number": i + 1,
+            "coordinates": [[x0, y0], [x1, y0], [x1, y1], [x0, y1]],
+            "image_width": width,
+            "image_height": height
+        })
+    return slots
+
+
+def draw_lot(slots: List[Dict[str, Any]], occupied: np.ndarray, width: int, height: int,
+             rng: np.random.Generator) -> np.ndarray:
+    """Asphalt-like background, slot markings and a car in every occupied slot"""
+    frame = rng.normal(110, 6, (height, width)).clip(0, 255).astype(np.uint8)
+    frame = cv2.cvtColor(frame, cv2.COLOR_GRAY2BGR)
+    for slot, taken in zip(slots, occupied):
+        pts = (np.array(slot["coordinates"]) * [width, height]).astype(np.int32)
+        cv2.polylines(frame, [pts], True, (235, 235, 235), 2)
+        if taken:
+            x0, y0 = pts.min(axis=0)
+            x1, y1 = pts.max(axis=0)
+            mx, my = (x1 - x0) // 6, (y1 - y0) // 8
+            color = tuple(int(v) for v in rng.integers(20, 220, 3))
+            cv2.rectangle(frame, (x0 + mx, y0 + my), (x1 - mx, y1 - my), color, -1)
+            cv2.rectangle(frame, (x0 + 2 * mx, y0 + 2 * my), (x1 - 2 * mx, y0 + 4 * my), (40, 40, 40), -1)
+    return frame
+
+
+def generate_lots(directory: str, lots: int, frames: int, slot_count: int,
+                  width: int, height: int, churn: float, seed: int = 0) -> List[Dict[str, Any]]:
+    """
+    Write each lot's frame sequence as JPEG files.
+
+    Returns:
+        [{"lot_id", "slots", "frames": [paths]}]
+    """
+    rng = np.random.default_rng(seed)
+    generated = []
+    for lot in range(lots):
+        slots = make_slots(slot_count, width, height)
+        occupied = rng.random(slot_count) < 0.5
+        paths = []
+        for index in range(frames):
+            if index:
+                flip = rng.random(slot_count) < churn
+                occupied = occupied ^ flip
+            path = os.path.join(directory, f"lot{lot}_{width}x{height}_{slot_count}_{index}.jpg")
+            cv2.imwrite(path, draw_lot(slots, occupied, width, height, rng), [cv2.IMWRITE_JPEG_QUALITY, 85])
+            paths.append(path)
+        generated.append({"lot_id": f"load-{lot}-{slot_count}", "slots": slots, "frames": paths})
+    return generated
+
+
+# ---- service process --------------------------------------------------------
+
+def start_service(port: int, environ: Dict[str, str]) -> subprocess.Popen:
+    """Run service.py without the debug reloader and wait until it is ready"""
+    env = dict(os.environ, OPENCV_SERVICE_PORT=str(port), OPENCV_SERVICE_DEBUG='0', **environ)
+    process = subprocess.Popen([sys.executable, os.path.join(os.path.dirname(os.path.abspath(__file__)), 'service.py')],
+                               env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    url = f"http://127.0.0.1:{port}/ready"
+    deadline = time.time() + 60
+    while time.time() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f"Service exited with code {process.returncode}")
+        try:
+            with urllib.request.urlopen(url, timeout=1) as response:
+                if response.status == 200:
+                    return process
+        except (urllib.error.URLError, ConnectionError, OSError):
+            pass
+        time.sleep(0.2)
+    process.terminate()
+    raise RuntimeError("Service did not become ready within 60 s")
+
+
+class ProcessMonitor:
+    """Samples CPU time and resident memory of a process (psutil or /proc)"""
+
+    def __init__(self, pid: Optional[int]):
+        self.pid = pid
+        self.peak_rss = 0
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        try:
+            import psutil
+            self._process = psutil.Process(pid) if pid else None
+        except ImportError:
+            self._process = None
+
+    def cpu_seconds(self) -> Optional[float]:
+        if not self.pid:
+            return None
+        if self._process is not None:
+            times = self._process.cpu_times()
+            return times.user + times.system
+        try:
+            with open(f"/proc/{self.pid}/stat") as f:
+                fields = f.read().rsplit(')', 1)[1].split()
+            return (int(fields[11]) + int(fields[12])) / os.sysconf('SC_CLK_TCK')
+        except (OSError, ValueError, IndexError):
+            return None
+
+    def rss(self) -> Optional[int]:
+        if not self.pid:
+            return None
+        if self._process is not None:
+            return self._process.memory_info().rss
+        try:
+            with open(f"/proc/{self.pid}/status") as f:
+                for line in f:
+                    if line.startswith('VmRSS:'):
+                        return int(line.split()[1]) * 1024
+        except (OSError, ValueError):
+            pass
+        return None
+
+    def _sample(self):
+        while not self._stop.wait(0.2):
+            self.peak_rss = max(self.peak_rss, self.rss() or 0)
+
+    def start(self):
+        self.peak_rss = self.rss() or 0
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._sample, daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+
+
+# ---- load generation --------------------------------------------------------
+
+def http_transport(url: str, health_check: bool = False) -> Callable[[Dict[str, Any]], int]:
+    """
+    Request sender over HTTP keep-alive connections (one per client thread),
+    optionally preceded by GET /health.
+    """
+    target = urllib.parse.urlsplit(url)
+    base = target.path.rstrip('/')
+    local = threading.local()
+
+    def request(method: str, path: str, body: Optional[bytes] = None) -> int:
+        connection = getattr(local, 'connection', None)
+        if connection is None:
+            connection = local.connection = http.client.HTTPConnection(target.hostname, target.port or 80,
+                                                                       timeout=60)
+        try:
+            connection.request(method, base + path, body,
+                               {"Content-Type": "application/json"} if body is not None else {})
+            response = connection.getresponse()
+            response.read()
+            return response.status
+        except (http.client.HTTPException, OSError):
+            connection.close()
+            local.connection = None
+            raise
+
+    def send(payload: Dict[str, Any]) -> int:
+        if health_check:
+            request('GET', '/health')
+        return request('POST', '/detect-occupancy', json.dumps(payload).encode())
+    return send
+
+
+def socket_transport(path: str) -> Callable[[Dict[str, Any]], int]:
+    """Request sender over the Unix socket (one shared, pipelined connection)"""
+    from socket_server import SocketClient
+    client = SocketClient(path)
+
+    def send(payload: Dict[str, Any]) -> int:
+        return client.detect(payload, layout=payload["lot_id"])[0]
+    return send
+
+
+def run_load(send: Callable[[Dict[str, Any]], int], lots: List[Dict[str, Any]], concurrency: int,
+             duration: float, rate: float = 0.0, extra: Optional[Dict[str, Any]] = None,
+             seed: int = 0) -> Dict[str, Any]:
+    """
+    Drive /detect-occupancy for a fixed duration.
+
+    Args:
+        send: Sends a request body and returns the status (see http_transport)
+        lots: Output of generate_lots
+        concurrency: Client threads
+        duration: Seconds of load
+        rate: Requests per second (Poisson arrivals); 0 for closed loop
+        extra: Additional request fields (e.g. {"engine": "cascade"})
+
+    Returns:
+        {"requests", "errors", "latencies_ms": [...], "elapsed", "lateness_ms"}
+    """
+    latencies: List[float] = []
+    errors: Dict[str, int] = {}
+    lateness: List[float] = []
+    lock = threading.Lock()
+    # Each lot walks through its frame sequence in order
+    cursors = {lot["lot_id"]: itertools.cycle(lot["frames"]) for lot in lots}
+    lot_cycle = itertools.cycle(lots)
+    arrivals = random.Random(seed)
+    started = time.perf_counter()
+    deadline = started + duration
+    next_arrival = [started]
+
+    def next_request():
+        with lock:
+            lot = next(lot_cycle)
+            path = next(cursors[lot["lot_id"]])
+            due = None
+            if rate > 0:
+                due = next_arrival[0]
+                next_arrival[0] += arrivals.expovariate(rate)
+        payload = {"image_path": path, "slots": lot["slots"], "lot_id": lot["lot_id"], **(extra or {})}
+        return payload, due
+
+    def client():
+        while True:
+            payload, due = next_request()
+            if due is not None:
+                if due >= deadline:
+                    return
+                wait = due - time.perf_counter()
+                if wait > 0:
+                    time.sleep(wait)
+            elif time.perf_counter() >= deadline:
+                return
+            sent = time.perf_counter()
+            try:
+                status = send(payload)
+                error = None if status == 200 else f"HTTP {status}"
+            except Exception as e:
+                error = type(e).__name__
+            finished = time.perf_counter()
+            with lock:
+                if error is None:
+                    latencies.append((finished - sent) * 1000)
+                    if due is not None:
+                        lateness.append(max(sent - due, 0.0) * 1000)
+                else:
+                    errors[error] = errors.get(error, 0) + 1
+
+    threads = [threading.Thread(target=client, daemon=True) for _ in range(concurrency)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return {
+        "requests": len(latencies),
+        "errors": errors,
+        "latencies_ms": latencies,
+        "lateness_ms": lateness,
+        "elapsed": time.perf_counter() - started
+    }
+
+
+def summarize(run: Dict[str, Any]) -> Dict[str, Any]:
+    """Throughput and latency percentiles of a run"""
+    latencies = np.array(run["latencies_ms"]) if run["latencies_ms"] else np.zeros(1)
+    summary = {
+        "requests": run["requests"],
+        "errors": sum(run["errors"].values()),
+        "error_kinds": run["errors"],
+        "throughput_rps": round(run["requests"] / run["elapsed"], 2) if run["elapsed"] else 0.0,
+        "p50_ms": round(float(np.percentile(latencies, 50)), 2),
+        "p95_ms": round(float(np.percentile(latencies, 95)), 2),
+        "p99_ms": round(float(np.percentile(latencies, 99)), 2),
+        "max_ms": round(float(latencies.max()), 2)
+    }
+    if run["lateness_ms"]:
+        # Open loop: how far behind schedule requests were sent (client saturation)
+        summary["p95_send_lag_ms"] = round(float(np.percentile(run["lateness_ms"], 95)), 2)
+    return summary
+
+
+def main():
+    """Main entry point for command-line usage"""
+    parser = argparse.ArgumentParser(description="Load-test /detect-occupancy with synthetic lots")
+    parser.add_argument('--resolutions', default="1920x1080", help="Frame sizes, comma-separated")
+    parser.add_argument('--slots', default="40", help="Slots per lot, comma-separated")
+    parser.add_argument('--concurrency', default="1,4", help="Client threads, comma-separated")
+    parser.add_argument('--lots', type=int, default=4, help="Lots per configuration")
+    parser.add_argument('--frames', type=int, default=8, help="Frames generated per lot")
+    parser.add_argument('--churn', type=float, default=0.1, help="Fraction of slots flipping between frames")
+    parser.add_argument('--duration', type=float, default=10.0, help="Seconds per configuration")
+    parser.add_argument('--warmup', type=float, default=2.0, help="Unmeasured seconds before each configuration")
+    parser.add_argument('--rate', type=float, default=0.0, help="Requests/s (Poisson); 0 = closed loop")
+    parser.add_argument('--engine', default=None, help="Detection engine sent with every request")
+    parser.add_argument('--transports', default="http", help="http, http-health and/or socket, comma-separated")
+    parser.add_argument('--url', default=None, help="Target a running service instead of starting one")
+    parser.add_argument('--pid', type=int, default=None, help="Process id of --url's service (CPU/memory)")
+    parser.add_argument('--socket', default=None, help="Socket path of --url's service (OPENCV_SOCKET_PATH)")
+    parser.add_argument('--port', type=int, default=5099, help="Port of the started service")
+    parser.add_argument('--json', default=None, help="Write the results to this file")
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix="opencv-load-")
+    process = None
+    try:
+        transports = [t.strip() for t in args.transports.split(',') if t.strip()]
+        unknown = set(transports) - {'http', 'http-health', 'socket'}
+        if unknown:
+            raise ValueError(f"Unknown transports: {', '.join(sorted(unknown))}")
+        if args.url:
+            url, pid, socket_path = args.url, args.pid, args.socket
+        else:
+            # Keep the test's history and archive out of the real data directory
+            socket_path = os.path.join(workdir, 'detect.sock')
+            process = start_service(args.port, {"OPENCV_DATA_DIR": os.path.join(workdir, 'data'),
+                                                "OPENCV_SOCKET_PATH": socket_path})
+            url, pid = f"http://127.0.0.1:{args.port}", process.pid
+        if 'socket' in transports and not socket_path:
+            raise ValueError("The socket transport needs --socket with --url")
+        senders = {
+            'http': lambda: http_transport(url),
+            'http-health': lambda: http_transport(url, health_check=True),
+            'socket': lambda: socket_transport(socket_path)
+        }
+        monitor = ProcessMonitor(pid)
+        extra = {"engine": args.engine} if args.engine else None
+
+        results = []
+        print(f"{'transport':>11} {'resolution':>10} {'slots':>5} {'conc':>4} {'req/s':>8} {'p50 ms':>8} "
+              f"{'p95 ms':>8} {'p99 ms':>8} {'errors':>6} {'cpu':>6} {'rss MB':>7}")
+        for (width, height), slot_count in itertools.product(parse_resolutions(args.resolutions),
+                                                              [int(v) for v in args.slots.split(',')]):
+            lots = generate_lots(workdir, args.lots, args.frames, slot_count, width, height, args.churn)
+            for concurrency, transport in itertools.product([int(v) for v in args.concurrency.split(',')],
+                                                            transports):
+                send = senders[transport]()
+                if args.warmup > 0:
+                    run_load(send, lots, concurrency, args.warmup, extra=extra)
+                cpu_before = monitor.cpu_seconds()
+                monitor.start()
+                run = run_load(send, lots, concurrency, args.duration, args.rate, extra)
+                monitor.stop()
+                cpu_after = monitor.cpu_seconds()
+
+                summary = summarize(run)
+                summary.update({
+                    "transport": transport,
+                    "resolution": f"{width}x{height}",
+                    "slots": slot_count,
+                    "lots": args.lots,
+                    "concurrency": concurrency,
+                    "rate": args.rate or None,
+                    "cpu_cores": round((cpu_after - cpu_before) / run["elapsed"], 2)
+                    if cpu_before is not None and cpu_after is not None else None,
+                    "peak_rss_mb": round(monitor.peak_rss / 2**20, 1) if monitor.peak_rss else None
+                })
+                results.append(summary)
+                cpu = f"{summary['cpu_cores']:.2f}" if summary['cpu_cores'] is not None else '-'
+                rss = f"{summary['peak_rss_mb']:.0f}" if summary['peak_rss_mb'] is not None else '-'
+                print(f"{transport:>11} {summary['resolution']:>10} {slot_count:>5} {concurrency:>4} "
+                      f"{summary['throughput_rps']:>8.1f} {summary['p50_ms']:>8.1f} {summary['p95_ms']:>8.1f} "
+                      f"{summary['p99_ms']:>8.1f} {summary['errors']:>6} {cpu:>6} {rss:>7}")
+
+        if args.json:
+            with open(args.json, 'w') as f:
+                json.dump({"config": vars(args), "results": results}, f, indent=2)
+    except Exception as e:
+        print(f"Error: {e}")
+        sys.exit(1)
+    finally:
+        if process is not None:
+            process.terminate()
+            try:
+                process.wait(timeout=10)
+            except subprocess.TimeoutExpired:
+                process.kill()
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,150 @@
+"""
+Memory Budget - Central accounting of frame buffers, caches and capture rings
+
+Every component that holds sizable memory (preprocessing buffers, slot
+masks, encoded/annotated frame caches, capture rings, engine references)
+registers its allocations here. When the total exceeds the configured
+budget, the least recently used evictable entries are evicted through
+their owners' callbacks until usage fits again. Pinned entries (capture
+rings, learned references) are counted but never evicted; new pinned
+allocations are refused when they cannot fit.
+
+The process-wide accountant is configured with OPENCV_MEMORY_BUDGET_MB
+(0 or unset: no limit, accounting only).
+"""
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Callable, Dict, Any, Hashable, Optional, Tuple
+
+
+class MemoryBudgetExceeded(Exception):
+    """Raised when a pinned allocation does not fit in the budget"""
+
+
+class MemoryAccountant:
+    """Tracks allocations by component and evicts LRU entries over budget"""
+
+    def __init__(self, budget_bytes: int = 0):
+        """
+        Initialize the accountant.
+
+        Args:
+            budget_bytes: Total budget (0 for no limit)
+        """
+        self.budget_bytes = budget_bytes
+        # (component, key) -> (nbytes, evict callback or None, pinned)
+        self._entries: "OrderedDict[Tuple[str, Hashable], Tuple[int, Optional[Callable[[], None]], bool]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.total_bytes = 0
+        self.pinned_bytes = 0
+        self.evictions: Dict[str, int] = {}
+        self.evicted_bytes = 0
+        self.peak_bytes = 0
+
+    def track(self, component: str, key: Hashable, nbytes: int,
+              evict: Optional[Callable[[], None]] = None, pinned: bool = False,
+              enforce: bool = True):
+        """
+        Register (or resize) an allocation and enforce the budget.
+
+        Args:
+            component: Owner name used in the report ("render_cache", ...)
+            key: Identifies the allocation within the component
+            nbytes: Size in bytes
+            evict: Frees the allocation; called without locks held. The
+                owner must not call untrack from it (the entry is already gone).
+            pinned: Count the allocation but never evict it
+            enforce: Evict right away if over budget. Owners that call
+                track while holding a lock their evict callback needs pass
+                False and call enforce() after releasing it.
+
+        Raises:
+            MemoryBudgetExceeded: If a pinned allocation cannot fit even
+                after evicting every evictable entry
+        """
+        with self._lock:
+            # A rejected resize keeps the existing entry
+            previous = self._entries.get((component, key))
+            pinned_bytes = self.pinned_bytes - (previous[0] if previous and previous[2] else 0)
+            if pinned and self.budget_bytes and \
+                    pinned_bytes + nbytes > self.budget_bytes:
+                raise MemoryBudgetExceeded(
+                    f"{component} needs {nbytes / 2**20:.1f} MB but only "
+                    f"{(self.budget_bytes - pinned_bytes) / 2**20:.1f} MB of the "
+                    f"{self.budget_bytes / 2**20:.0f} MB memory budget can be freed")
+            self._remove((component, key))
+            self._entries[(component, key)] = (int(nbytes), evict, pinned)
+            self.total_bytes += int(nbytes)
+            if pinned:
+                self.pinned_bytes += int(nbytes)
+            self.peak_bytes = max(self.peak_bytes, self.total_bytes)
+        if enforce:
+            self.enforce()
+
+    def touch(self, component: str, key: Hashable):
+        """Mark an allocation as recently used"""
+        with self._lock:
+            if (component, key) in self._entries:
+                self._entries.move_to_end((component, key))
+
+    def untrack(self, component: str, key: Hashable):
+        """Forget an allocation freed by its owner"""
+        with self._lock:
+            self._remove((component, key))
+
+    def _remove(self, entry_key: Tuple[str, Hashable]):
+        """Drop an entry (lock held)"""
+        entry = self._entries.pop(entry_key, None)
+        if entry is not None:
+            self.total_bytes -= entry[0]
+            if entry[2]:
+                self.pinned_bytes -= entry[0]
+        return entry
+
+    def enforce(self):
+        """Evict least recently used evictable entries until usage fits the budget"""
+        while True:
+            with self._lock:
+                if not self.budget_bytes or self.total_bytes <= self.budget_bytes:
+                    return
+                victim = next(((k, e) for k, e in self._entries.items() if not e[2] and e[1] is not None), None)
+                if victim is None:
+                    return
+                entry_key, (nbytes, evict, _) = victim
+                self._remove(entry_key)
+                component = entry_key[0]
+                self.evictions[component] = self.evictions.get(component, 0) + 1
+                self.evicted_bytes += nbytes
+            try:
+                evict()
+            except Exception as e:
+                print(f"Error evicting {component} entry: {e}")
+
+    def report(self) -> Dict[str, Any]:
+        """Current usage by component"""
+        with self._lock:
+            components: Dict[str, Dict[str, Any]] = {}
+            for (component, _), (nbytes, _, pinned) in self._entries.items():
+                stats = components.setdefault(component, {"entries": 0, "bytes": 0, "pinned_bytes": 0})
+                stats["entries"] += 1
+                stats["bytes"] += nbytes
+                if pinned:
+                    stats["pinned_bytes"] += nbytes
+            for component, count in self.evictions.items():
+                components.setdefault(component, {"entries": 0, "bytes": 0, "pinned_bytes": 0})["evictions"] = count
+            return {
+                "budget_bytes": self.budget_bytes or None,
+                "total_bytes": self.total_bytes,
+                "pinned_bytes": self.pinned_bytes,
+                "peak_bytes": self.peak_bytes,
+                "evicted_bytes": self.evicted_bytes,
+                "utilization": round(self.total_bytes / self.budget_bytes, 4) if self.budget_bytes else None,
+                "components": components,
+                "timestamp": time.time()
+            }
+
+
+# Process-wide accountant shared by all components
+accountant = MemoryAccountant(int(float(os.environ.get('OPENCV_MEMORY_BUDGET_MB', 0)) * 1024 * 1024))
@@ -3,7 +3,7 @@ Occupancy Detector - Classical OpenCV-based parking slot occupancy detection
 Uses image processing techniques (no ML) for deterministic, explainable detection.
 
 Algorithm matches reference implementation:
-1. Grayscale conversion
+1. Grayscale conversion (images are decoded straight to grayscale)
 2. Gaussian blur (3x3, sigma=1)
 3. Adaptive thresholding (block size 25, C=16)
 4. Median blur (size 5)
@@ -13,8 +13,67 @@ Algorithm matches reference implementation:
 """
 import cv2
 import numpy as np
-from typing import List, Dict, Any
-from utils import count_pixels_in_region
+from typing import List, Dict, Any, Optional, Tuple, Callable, Iterator
+from utils import load_image, load_image_bytes, get_decode_flags, to_grayscale
+
+# Compact status codes used for storage and binary encodings
+STATUS_CODES = {
+    'vacant': 0,
+    'occupied': 1,
+    'unknown': 2,
+    'error': 3
+}
+
+
+def slot_pixel_coordinates(slot: Dict[str, Any], img_width: int, img_height: int,
+                           scale: int = 1) -> List[Tuple[int, int]]:
+    """
+    Convert a slot's normalized coordinates to pixel coordinates.
+    
+    Args:
+        slot: Slot definition (coordinates, image_width, image_height)
+        img_width, img_height: Size of the frame being analyzed
+        scale: Factor by which that frame is reduced relative to the slot's image size
+        
+    Returns:
+        List of (x, y) pixel tuples
+    """
+    slot_image_width = slot.get('image_width', img_width * scale) / scale
+    slot_image_height = slot.get('image_height', img_height * scale) / scale
+    
+    pixel_coords = []
+    for coord in slot.get('coordinates', []):
+        if isinstance(coord, (list, tuple)) and len(coord) >= 2:
+            pixel_coords.append((int(coord[0] * slot_image_width), int(coord[1] * slot_image_height)))
+        else:
+            pixel_coords.append((0, 0))
+    return pixel_coords
+
+
+def polygon_area(pixel_coords: List[Tuple[int, int]]) -> int:
+    """Pixel area of a slot polygon (bounding box area for degenerate polygons)"""
+    pts = np.array(pixel_coords, dtype=np.int32)
+    total_area = cv2.contourArea(pts)
+    if total_area == 0:
+        # Fallback: calculate area from bounding box
+        x, y, w, h = cv2.boundingRect(pts)
+        total_area = w * h
+    return total_area
+
+
+def classify_ratio(occupancy_ratio: float, threshold: float) -> Tuple[str, float]:
+    """
+    Apply the occupancy threshold.
+    
+    Returns:
+        (status, confidence) - confidence grows with the distance from the threshold
+    """
+    # Lower occupancy ratio = more empty = vacant
+    if occupancy_ratio > threshold:
+        # For occupied: confidence increases with occupancy ratio
+        return 'occupied', min(occupancy_ratio / threshold, 1.0)
+    # For vacant: confidence increases as occupancy ratio decreases
+    return 'vacant', min((threshold - occupancy_ratio) / threshold, 1.0)
 
 
 class OccupancyDetector:
@@ -29,13 +88,22 @@ class OccupancyDetector:
     5. Morphological dilation
     6. Pixel counting per slot region
     7. Threshold comparison
+    
+    This is the default 'adaptive' engine; see engines.py for the others.
+    
+    A detector's settings are fixed after construction so one instance can
+    serve concurrent requests; use DetectorRegistry (detector_registry.py)
+    to get a detector per threshold/parameter set.
     """
     
     def __init__(self, threshold: float = 0.15, 
                  adaptive_thresh_block_size: int = 25,
                  adaptive_thresh_c: int = 16,
                  median_blur_size: int = 5,
-                 dilate_kernel_size: int = 3):
+                 dilate_kernel_size: int = 3,
+                 decode_scale: int = 1,
+                 engine: Any = 'adaptive',
+                 engine_options: Optional[Dict[str, Any]] = None):
         """
         Initialize the occupancy detector.
         
@@ -45,12 +113,44 @@ class OccupancyDetector:
             adaptive_thresh_c: Constant subtracted from mean for adaptive thresholding
             median_blur_size: Kernel size for median blur (must be odd)
             dilate_kernel_size: Kernel size for dilation
+            decode_scale: Default reduction factor (1, 2, 4 or 8) used when
+                decoding images. The pipeline only needs grayscale, so images
+                are always decoded straight to a single channel; a factor > 1
+                additionally uses the JPEG scaled decode modes.
+            engine: Detection method - an engine name from engines.ENGINES
+                ('adaptive', 'reference', 'cascade') or a DetectionEngine instance
+            engine_options: Keyword arguments for a named engine (adaptive
+                pipeline parameters default to the ones above). 'cascade'
+                also takes coarse_scale (downscale factor of its first pass,
+                default 4) and margin (relative distance from the threshold
+                that sends a slot to the full-resolution pass, default 0.5;
+                0 disables that pass)
         """
+        get_decode_flags(True, decode_scale)  # validate scale
+        self.decode_scale = decode_scale
         self.threshold = threshold
         self.adaptive_thresh_block_size = adaptive_thresh_block_size if adaptive_thresh_block_size % 2 == 1 else adaptive_thresh_block_size + 1
         self.adaptive_thresh_c = adaptive_thresh_c
         self.median_blur_size = median_blur_size if median_blur_size % 2 == 1 else median_blur_size + 1
         self.dilate_kernel_size = dilate_kernel_size
+        
+        from engines import create_engine, ENGINES, AdaptiveThresholdEngine
+        if isinstance(engine, str):
+            options = dict(engine_options or {})
+            engine_class = ENGINES.get(engine)
+            if engine_class is not None and issubclass(engine_class, AdaptiveThresholdEngine):
+                options = {**self.pipeline_params(), **options}
+            engine = create_engine(engine, **options)
+        self.engine = engine
+    
+    def pipeline_params(self) -> Dict[str, int]:
+        """Preprocessing parameters as keyword arguments for PreprocessPipeline"""
+        return {
+            "adaptive_thresh_block_size": self.adaptive_thresh_block_size,
+            "adaptive_thresh_c": self.adaptive_thresh_c,
+            "median_blur_size": self.median_blur_size,
+            "dilate_kernel_size": self.dilate_kernel_size
+        }
     
     def preprocess_image(self, image: np.ndarray) -> np.ndarray:
         """
@@ -64,7 +164,7 @@ class OccupancyDetector:
         5. Morphological dilation (3x3 kernel)
         
         Args:
-            image: Input BGR image
+            image: Input BGR or grayscale image
             
         Returns:
             Preprocessed binary image
@@ -78,10 +178,33 @@ class OccupancyDetector:
             dilate_kernel_size=self.dilate_kernel_size
         )
     
-    def detect_occupancy(self, image_path: str, slots: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    def decode_info(self, decode_scale: Optional[int] = None, source: str = "file") -> Dict[str, Any]:
+        """
+        Describe how a frame is decoded for detection (reported in responses).
+        
+        Args:
+            decode_scale: Reduction factor, defaults to the detector's
+            source: 'file'/'buffer' (decoded directly) or 'frame' (converted)
+            
+        Returns:
+            Dictionary with source, color mode and scale
+        """
+        scale = self.decode_scale if decode_scale is None else decode_scale
+        return {
+            "source": source,
+            "color": "grayscale",
+            "scale": scale,
+            "direct": source in ("file", "buffer")
+        }
+    
+    def detect_occupancy(self, image_path: str, slots: List[Dict[str, Any]],
+                         decode_scale: Optional[int] = None) -> List[Dict[str, Any]]:
         """
         Detect occupancy for multiple parking slots.
         
+        The image is decoded directly to grayscale (and optionally at a
+        reduced size) since nothing in the pipeline uses color.
+        
         Args:
             image_path: Path to current parking lot image
             slots: List of slot definitions with:
@@ -101,100 +224,141 @@ class OccupancyDetector:
                 - total_area: Total pixel area of the slot
                 - confidence: Confidence score (1 - occupancy_ratio for vacant, occupancy_ratio for occupied)
         """
-        # Load image
-        img = cv2.imread(image_path)
-        if img is None:
-            raise ValueError(f"Could not load image from {image_path}")
+        scale = self.decode_scale if decode_scale is None else decode_scale
+        img = load_image(image_path, grayscale=True, scale=scale)
+        return self.detect_occupancy_frame(img, slots, scale=scale)
+    
+    def detect_occupancy_bytes(self, data: bytes, slots: List[Dict[str, Any]],
+                               decode_scale: Optional[int] = None) -> List[Dict[str, Any]]:
+        """
+        Detect occupancy from an encoded image held in memory.
+        
+        Args:
+            data: Encoded image bytes (JPEG, PNG, ...)
+            slots: List of slot definitions (see detect_occupancy)
+            decode_scale: Reduction factor, defaults to the detector's
+            
+        Returns:
+            List of detection results (see detect_occupancy)
+        """
+        scale = self.decode_scale if decode_scale is None else decode_scale
+        img = load_image_bytes(data, grayscale=True, scale=scale)
+        return self.detect_occupancy_frame(img, slots, scale=scale)
+    
+    def detect_video(self, video_path: str, slots: List[Dict[str, Any]],
+                     frame_stride: int = 1, start_frame: int = 0,
+                     max_frames: Optional[int] = None,
+                     decode_scale: Optional[int] = None,
+                     progress: Optional[Callable[[int, int], None]] = None,
+                     should_stop: Optional[Callable[[], bool]] = None) -> Iterator[Dict[str, Any]]:
+        """
+        Detect occupancy on every frame_stride-th frame of a video.
         
-        img_height, img_width = img.shape[:2]
+        Skipped frames are only grabbed (not decoded).
         
-        # Preprocess image
-        img_processed = self.preprocess_image(img)
+        Args:
+            video_path: Path to video file
+            slots: List of slot definitions (see detect_occupancy)
+            frame_stride: Analyze one frame out of every frame_stride
+            start_frame: First frame to analyze
+            max_frames: Stop after analyzing this many frames
+            decode_scale: Reduction factor, defaults to the detector's
+            progress: Called as progress(frames_read, total_frames)
+            should_stop: Polled between frames; returning True ends the scan
+            
+        Yields:
+            {"frame": index, "timestamp_ms": position, "results": [...]}
+        """
+        scale = self.decode_scale if decode_scale is None else decode_scale
+        frame_stride = max(int(frame_stride), 1)
+        cap = cv2.VideoCapture(video_path)
+        if not cap.isOpened():
+            raise ValueError(f"Could not open video file: {video_path}")
         
-        results = []
+        try:
+            total_frames = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
+            if start_frame > 0:
+                cap.set(cv2.CAP_PROP_POS_FRAMES, start_frame)
+            index = start_frame
+            analyzed = 0
+            while max_frames is None or analyzed < max_frames:
+                if should_stop is not None and should_stop():
+                    break
+                if not cap.grab():
+                    break
+                if (index - start_frame) % frame_stride == 0:
+                    timestamp_ms = cap.get(cv2.CAP_PROP_POS_MSEC)
+                    ret, frame = cap.retrieve()
+                    if ret and frame is not None:
+                        results = self.detect_occupancy_frame(to_grayscale(frame, scale), slots, scale=scale)
+                        analyzed += 1
+                        yield {"frame": index, "timestamp_ms": timestamp_ms, "results": results}
+                    if progress is not None:
+                        progress(index + 1, total_frames)
+                index += 1
+        finally:
+            cap.release()
+    
+    def detect_occupancy_frame(self, img: np.ndarray, slots: List[Dict[str, Any]],
+                               scale: int = 1) -> List[Dict[str, Any]]:
+        """
+        Detect occupancy on an already decoded frame.
         
-        for slot in slots:
-            try:
-                # Extract slot region coordinates
-                coordinates = slot.get('coordinates', [])
-                if not coordinates or len(coordinates) < 3:
-                    # Skip slots without valid coordinates
-                    results.append({
-                        'slot_id': slot.get('slot_id', ''),
-                        'slot_number': slot.get('slot_number', 0),
-                        'status': 'unknown',
-                        'occupancy_ratio': 0.0,
-                        'white_pixel_count': 0,
-                        'total_area': 0,
-                        'confidence': 0.0
-                    })
-                    continue
-                
-                # Denormalize coordinates
-                slot_image_width = slot.get('image_width', img_width)
-                slot_image_height = slot.get('image_height', img_height)
-                
-                # Convert normalized coordinates to pixel coordinates
-                pixel_coords = []
-                for coord in coordinates:
-                    if isinstance(coord, (list, tuple)) and len(coord) >= 2:
-                        x = int(coord[0] * slot_image_width)
-                        y = int(coord[1] * slot_image_height)
-                        pixel_coords.append([x, y])
-                    else:
-                        pixel_coords.append([0, 0])
-                
-                # Count white pixels in the region using utility function
-                # (which uses cv2.countNonZero like the reference code)
-                pixel_coords_tuples = [(int(p[0]), int(p[1])) for p in pixel_coords]
-                white_pixel_count = count_pixels_in_region(img_processed, pixel_coords_tuples)
-                total_area = cv2.contourArea(np.array(pixel_coords, dtype=np.int32))
-                
-                if total_area == 0:
-                    # Fallback: calculate area from bounding box
-                    pixel_coords_array = np.array(pixel_coords, dtype=np.int32)
-                    x, y, w, h = cv2.boundingRect(pixel_coords_array)
-                    total_area = w * h
-                
-                # Calculate occupancy ratio
-                if total_area > 0:
-                    occupancy_ratio = white_pixel_count / total_area
-                else:
-                    occupancy_ratio = 0.0
-                
-                # Determine status based on threshold
-                # Lower occupancy ratio = more empty = vacant
-                is_occupied = occupancy_ratio > self.threshold
-                status = 'occupied' if is_occupied else 'vacant'
-                
-                # Calculate confidence (higher is better)
-                if is_occupied:
-                    # For occupied: confidence increases with occupancy ratio
-                    confidence = min(occupancy_ratio / self.threshold, 1.0)
-                else:
-                    # For vacant: confidence increases as occupancy ratio decreases
-                    confidence = min((self.threshold - occupancy_ratio) / self.threshold, 1.0)
-                
-                results.append({
-                    'slot_id': slot.get('slot_id', ''),
-                    'slot_number': slot.get('slot_number', 0),
-                    'status': status,
-                    'occupancy_ratio': float(occupancy_ratio),
-                    'white_pixel_count': int(white_pixel_count),
-                    'total_area': int(total_area),
-                    'confidence': float(confidence)
-                })
-                
-            except Exception as e:
-                print(f"Error processing slot {slot.get('slot_id', 'unknown')}: {e}")
-                results.append({
-                    'slot_id': slot.get('slot_id', ''),
-                    'slot_number': slot.get('slot_number', 0),
-                    'status': 'error',
-                    'occupancy_ratio': 0.0,
-                    'white_pixel_count': 0,
-                    'total_area': 0,
-                    'confidence': 0.0
-                })
+        Args:
+            img: BGR or grayscale frame
+            slots: List of slot definitions (see detect_occupancy)
+            scale: Factor by which the frame is reduced relative to the
+                slots' image_width/image_height
+            
+        Returns:
+            List of detection results (see detect_occupancy)
+        """
+        return self.engine.detect(img, slots, scale, self.threshold)
+    
+    def detect_single_slot(self, image_path: str, slot_coordinates: List[List[float]],
+                           image_width: int, image_height: int,
+                           decode_scale: Optional[int] = None) -> Dict[str, Any]:
+        """
+        Detect occupancy of one slot given by its coordinates.
         
-        return results
+        Args:
+            image_path: Path to current parking lot image
+            slot_coordinates: Normalized coordinates [[x1, y1], [x2, y2], ...]
+            image_width, image_height: Size of the image the slot was drawn on
+            decode_scale: Reduction factor, defaults to the detector's
+            
+        Returns:
+            Detection result without slot_id/slot_number (see detect_occupancy)
+        """
+        slot = {
+            "coordinates": slot_coordinates,
+            "image_width": image_width,
+            "image_height": image_height
+        }
+        result = self.detect_occupancy(image_path, [slot], decode_scale=decode_scale)[0]
+        result.pop('slot_id', None)
+        result.pop('slot_number', None)
+        return result
+    
+    def learn(self, image_path: str, slots: List[Dict[str, Any]],
+              vacant_slot_ids: Optional[List[str]] = None,
+              decode_scale: Optional[int] = None, calibration=None) -> int:
+        """
+        Teach the engine what vacant slots look like (reference engine).
+        
+        Args:
+            image_path: Image in which the given slots are empty
+            slots: List of slot definitions (see detect_occupancy)
+            vacant_slot_ids: Slots known to be vacant (default: all)
+            decode_scale: Reduction factor, defaults to the detector's
+            calibration: Optional undistort.Calibration of the camera
+            
+        Returns:
+            Number of slots updated
+        """
+        scale = self.decode_scale if decode_scale is None else decode_scale
+        img = load_image(image_path, grayscale=True, scale=scale)
+        if calibration is not None:
+            from undistort import undistort
+            img = undistort(img, calibration, slots, scale)
+        return self.engine.learn(img, slots, scale, vacant_slot_ids)
@@ -0,0 +1,267 @@
+"""
+Preprocess Pipeline - Allocation-free variant of utils.preprocess_image
+
+A PreprocessPipeline is bound to one frame shape and one parameter set. It
+preallocates every intermediate buffer and the dilation kernel once and
+writes each stage into them through OpenCV's dst arguments, so steady-state
+detection does not allocate full-frame arrays.
+
+Pipelines are not thread-safe (they own mutable buffers). Use
+checkout_pipeline(), which lends a pipeline from a pool shared by all
+threads, keyed by frame shape and parameters, for the duration of a with
+block. The HTTP server starts a thread per request, so a per-thread cache
+would build a new pipeline for every request.
+"""
+import itertools
+import threading
+import weakref
+from collections import OrderedDict
+from contextlib import contextmanager
+from typing import List, Tuple, Dict, Any, Iterator
+
+import cv2
+import numpy as np
+from utils import build_region_mask
+from memory_budget import accountant
+
+# Idle pipelines kept in the shared pool (different cameras / resolutions
+# and concurrent requests for the same one)
+MAX_IDLE_PIPELINES = 8
+
+# Slot region masks shared by all threads
+MAX_CACHED_REGIONS = 4096
+
+
+class PreprocessPipeline:
+    """Preprocessing pipeline with preallocated, reusable buffers"""
+
+    def __init__(self, shape: Tuple[int, ...],
+                 adaptive_thresh_block_size: int = 25,
+                 adaptive_thresh_c: int = 16,
+                 median_blur_size: int = 5,
+                 dilate_kernel_size: int = 3):
+        """
+        Initialize the pipeline and allocate its buffers.
+
+        Args:
+            shape: Frame shape (height, width) or (height, width, channels)
+            adaptive_thresh_block_size: Block size for adaptive thresholding (must be odd)
+            adaptive_thresh_c: Constant subtracted from mean for adaptive thresholding
+            median_blur_size: Kernel size for median blur (must be odd)
+            dilate_kernel_size: Kernel size for dilation
+        """
+        height, width = shape[:2]
+        self.shape = (height, width)
+        self.adaptive_thresh_block_size = adaptive_thresh_block_size if adaptive_thresh_block_size % 2 == 1 else adaptive_thresh_block_size + 1
+        self.adaptive_thresh_c = adaptive_thresh_c
+        self.median_blur_size = median_blur_size if median_blur_size % 2 == 1 else median_blur_size + 1
+        self.kernel = np.ones((dilate_kernel_size, dilate_kernel_size), np.uint8)
+
+        # Only allocated for color input; grayscale frames are used as-is
+        self._gray = np.empty(self.shape, np.uint8) if len(shape) == 3 else None
+        # Two ping-pong buffers: blur -> A, threshold -> B, median -> A, dilate -> B
+        self._buf_a = np.empty(self.shape, np.uint8)
+        self._buf_b = np.empty(self.shape, np.uint8)
+        # Flat scratch for per-slot masked crops (reshaped into contiguous views)
+        self._scratch = np.empty(height * width, np.uint8)
+
+    @property
+    def nbytes(self) -> int:
+        """Memory held by the pipeline's buffers"""
+        total = self._buf_a.nbytes + self._buf_b.nbytes + self._scratch.nbytes + self.kernel.nbytes
+        if self._gray is not None:
+            total += self._gray.nbytes
+        return total
+
+    def run(self, img: np.ndarray) -> np.ndarray:
+        """
+        Run the preprocessing stages (same as utils.preprocess_image).
+
+        Args:
+            img: BGR or grayscale frame matching the pipeline's shape
+
+        Returns:
+            Binary image. This is a buffer owned by the pipeline and is
+            overwritten by the next call; copy it to keep it.
+        """
+        if img.shape[:2] != self.shape:
+            raise ValueError(f"Frame shape {img.shape[:2]} does not match pipeline shape {self.shape}")
+
+        if img.ndim == 3:
+            gray = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY, dst=self._gray)
+        else:
+            gray = img
+
+        cv2.GaussianBlur(gray, (3, 3), 1, dst=self._buf_a)
+        cv2.adaptiveThreshold(
+            self._buf_a,
+            255,
+            cv2.ADAPTIVE_THRESH_GAUSSIAN_C,
+            cv2.THRESH_BINARY_INV,
+            self.adaptive_thresh_block_size,
+            self.adaptive_thresh_c,
+            dst=self._buf_b
+        )
+        cv2.medianBlur(self._buf_b, self.median_blur_size, dst=self._buf_a)
+        cv2.dilate(self._buf_a, self.kernel, dst=self._buf_b, iterations=1)
+        return self._buf_b
+
+    def count_pixels(self, binary_img: np.ndarray, coordinates: List[Tuple[int, int]]) -> int:
+        """
+        Count white pixels inside a slot polygon without full-frame temporaries.
+
+        Args:
+            binary_img: Output of run()
+            coordinates: List of (x, y) tuples defining polygon region
+
+        Returns:
+            Number of white pixels in the region
+        """
+        bbox, mask = get_slot_region(coordinates, self.shape)
+        if mask is None:
+            return 0
+        x0, y0, x1, y1 = bbox
+        crop = binary_img[y0:y1, x0:x1]
+        dst = self._scratch[:mask.size].reshape(mask.shape)
+        cv2.bitwise_and(crop, mask, dst=dst)
+        return int(cv2.countNonZero(dst))
+
+
+# (shape, params) -> idle pipelines, least recently returned key first
+_idle: "OrderedDict[Tuple, List[PreprocessPipeline]]" = OrderedDict()
+_idle_lock = threading.Lock()
+
+
+@contextmanager
+def checkout_pipeline(shape: Tuple[int, ...], **params: Any) -> Iterator[PreprocessPipeline]:
+    """
+    Borrow a pipeline for a frame shape and parameter set from the shared pool.
+
+    The pipeline belongs to the caller until the with block exits and is then
+    returned to the pool for other threads. Concurrent callers with the same
+    key get different pipelines.
+
+    Args:
+        shape: Frame shape
+        **params: PreprocessPipeline keyword arguments
+
+    Yields:
+        Pooled (or newly created) PreprocessPipeline
+    """
+    key = (tuple(shape), tuple(sorted(params.items())))
+    pipeline = None
+    with _idle_lock:
+        idle = _idle.get(key)
+        if idle:
+            pipeline = idle.pop()
+            if not idle:
+                del _idle[key]
+    if pipeline is None:
+        pipeline = PreprocessPipeline(shape, **params)
+        _track_pipeline(key, pipeline)
+    else:
+        accountant.touch('pipelines', pipeline.token)
+    try:
+        yield pipeline
+    finally:
+        _return_pipeline(key, pipeline)
+
+
+def _return_pipeline(key: Tuple, pipeline: PreprocessPipeline):
+    """Put a pipeline back into the pool, dropping the least recently used over the limit"""
+    dropped = []
+    with _idle_lock:
+        if pipeline.evicted:
+            return  # Evicted by the memory accountant while checked out
+        _idle.setdefault(key, []).append(pipeline)
+        _idle.move_to_end(key)
+        idle_count = sum(len(idle) for idle in _idle.values())
+        while idle_count > MAX_IDLE_PIPELINES:
+            oldest_key, idle = next(iter(_idle.items()))
+            dropped.append(idle.pop(0))
+            if not idle:
+                del _idle[oldest_key]
+            idle_count -= 1
+    # Dropped pipelines are untracked when garbage collected, outside the lock
+    del dropped
+
+
+_tokens = itertools.count()
+
+
+def _track_pipeline(key: Tuple, pipeline: PreprocessPipeline):
+    """
+    Account a pipeline's buffers. The memory accountant may drop it from the
+    pool (or keep it from returning there); it is untracked once garbage
+    collected.
+    """
+    pipeline.token = next(_tokens)
+    pipeline.evicted = False
+    pipeline_ref = weakref.ref(pipeline)
+
+    def evict():
+        evicted = pipeline_ref()
+        if evicted is None:
+            return
+        with _idle_lock:
+            evicted.evicted = True
+            idle = _idle.get(key)
+            if idle and evicted in idle:
+                idle.remove(evicted)
+                if not idle:
+                    del _idle[key]
+
+    weakref.finalize(pipeline, accountant.untrack, 'pipelines', pipeline.token)
+    accountant.track('pipelines', pipeline.token, pipeline.nbytes, evict)
+
+
+_regions: "OrderedDict[Tuple, Tuple]" = OrderedDict()
+_regions_lock = threading.Lock()
+
+
+def get_slot_region(coordinates: List[Tuple[int, int]], shape: Tuple[int, ...]):
+    """
+    Get the cached bounding box and mask of a slot polygon for a frame shape.
+
+    Args:
+        coordinates: List of (x, y) pixel tuples
+        shape: Frame shape
+
+    Returns:
+        ((x0, y0, x1, y1), mask) - mask is None if the polygon lies outside the frame
+    """
+    key = (tuple(shape[:2]), tuple((int(x), int(y)) for x, y in coordinates))
+    with _regions_lock:
+        region = _regions.get(key)
+        if region is not None:
+            _regions.move_to_end(key)
+    if region is not None:
+        accountant.touch('slot_masks', key)
+        return region
+
+    region = build_region_mask(coordinates, shape)
+    with _regions_lock:
+        _regions[key] = region
+        if region[1] is not None:
+            accountant.track('slot_masks', key, region[1].nbytes, lambda: _drop_region(key), enforce=False)
+        while len(_regions) > MAX_CACHED_REGIONS:
+            evicted, _ = _regions.popitem(last=False)
+            accountant.untrack('slot_masks', evicted)
+    accountant.enforce()
+    return region
+
+
+def _drop_region(key: Tuple):
+    with _regions_lock:
+        _regions.pop(key, None)
+
+
+def cache_info() -> Dict[str, int]:
+    """Sizes of the region cache and the pool's idle pipelines"""
+    with _idle_lock:
+        pipelines = [p for idle in _idle.values() for p in idle]
+    return {
+        "idle_pipelines": len(pipelines),
+        "idle_pipeline_bytes": sum(p.nbytes for p in pipelines),
+        "regions": len(_regions)
+    }
@@ -0,0 +1,218 @@
+"""
+Preview Stream - Shared MJPEG live preview of running captures
+
+Live views of a lot (drawing slots, watching occupancy) need a moving
+picture, not detections, and must not open the camera once per viewer.
+One PreviewStream per capture serves every viewer of it:
+
+    - a single thread takes the newest frame of the capture's ring at the
+      preview rate, downsizes it, undistorts it when the capture is
+      calibrated, and JPEG-encodes it once
+    - the encoded multipart part (boundary, headers and JPEG) is shared by
+      all viewers, so adding viewers adds no resizing or encoding
+    - a viewer is handed the newest part whenever its previous write has
+      finished; slow clients skip frames instead of queueing them
+    - the thread runs only while somebody watches and stops IDLE_TIMEOUT
+      seconds after the last viewer left
+
+Served as multipart/x-mixed-replace, which browsers show in an <img> tag.
+"""
+import socket
+import threading
+import time
+import weakref
+from typing import Dict, Any, Iterator, List, Optional, Tuple
+
+import cv2
+
+BOUNDARY = 'frame'
+MIMETYPE = f'multipart/x-mixed-replace; boundary={BOUNDARY}'
+
+# Seconds the encoder keeps running after the last viewer left
+IDLE_TIMEOUT = 5.0
+
+# Kernel send buffer of a viewer's connection: about one preview frame, so
+# a slow viewer blocks (and skips frames) instead of queueing seconds of video
+SEND_BUFFER = 64 * 1024
+
+
+def limit_send_buffer(connection: Optional[socket.socket]):
+    """Shrink a viewer connection's send buffer (see SEND_BUFFER)"""
+    if connection is None:
+        return
+    try:
+        connection.setsockopt(socket.SOL_SOCKET, socket.SO_SNDBUF, SEND_BUFFER)
+    except OSError:
+        pass
+
+
+class PreviewStream:
+    """Encode-once MJPEG fan-out of one capture"""
+
+    def __init__(self, source_id: str, captures, fps: float = 5.0, width: int = 640,
+                 quality: int = 70):
+        """
+        Initialize the stream.
+
+        Args:
+            source_id: Capture to preview (see frame_ring.CaptureRegistry)
+            captures: Capture registry
+            fps: Preview frames per second
+            width: Preview width in pixels (frames are never enlarged)
+            quality: JPEG quality
+        """
+        self.source_id = source_id
+        self.captures = captures
+        self.fps = fps
+        self.width = width
+        self.quality = quality
+
+        self._cond = threading.Condition()
+        self._part: Optional[bytes] = None
+        self._version = 0
+        self._closed = False
+        self._viewers = 0
+        self._idle_since = time.time()
+        self._thread: Optional[threading.Thread] = None
+
+        self.frames_encoded = 0
+        self.frames_sent = 0
+        self.frames_skipped = 0  # newer parts replaced ones a slow viewer never got
+        self.encode_ms = 0.0
+
+    # Encoding
+
+    def _encode(self, frame) -> bytes:
+        """Multipart part of a frame: downsized, undistorted, JPEG-encoded"""
+        height, width = frame.shape[:2]
+        if width > self.width:
+            frame = cv2.resize(frame, (self.width, max(1, int(round(height * self.width / width)))),
+                               interpolation=cv2.INTER_AREA)
+        calibration = self.captures.get_calibration(self.source_id)
+        if calibration is not None:
+            from undistort import undistort
+            frame = undistort(frame, calibration)
+        ok, buffer = cv2.imencode('.jpg', frame, [cv2.IMWRITE_JPEG_QUALITY, int(self.quality)])
+        if not ok:
+            raise ValueError("Could not encode preview frame")
+        jpeg = buffer.tobytes()
+        return (f"--{BOUNDARY}\r\nContent-Type: image/jpeg\r\n"
+                f"Content-Length: {len(jpeg)}\r\n\r\n").encode() + jpeg + b"\r\n"
+
+    def _run(self):
+        interval = 1.0 / self.fps if self.fps > 0 else 0.0
+        last_seq = -1
+        next_tick = time.monotonic()
+        try:
+            while True:
+                with self._cond:
+                    if self._viewers == 0 and time.time() - self._idle_since >= IDLE_TIMEOUT:
+                        self._thread = None
+                        return
+                ring = self.captures.get_ring(self.source_id)
+                if ring is None:
+                    break  # capture stopped
+                if ring.latest_seq != last_seq:
+                    latest = ring.read_latest(copy=False)
+                    if latest is not None:
+                        started = time.perf_counter()
+                        part = self._encode(latest[2])
+                        # A frame overwritten while it was read is dropped
+                        if ring.is_current(latest[0]):
+                            last_seq = latest[0]
+                            self.encode_ms += (time.perf_counter() - started) * 1000
+                            self.frames_encoded += 1
+                            with self._cond:
+                                self._part = part
+                                self._version += 1
+                                self._cond.notify_all()
+                next_tick = max(next_tick + interval, time.monotonic())
+                time.sleep(max(next_tick - time.monotonic(), 0.0))
+        except Exception as e:
+            print(f"Preview of {self.source_id} stopped: {e}")
+        with self._cond:
+            self._closed = True
+            self._thread = None
+            self._cond.notify_all()
+
+    # Viewers
+
+    @property
+    def closed(self) -> bool:
+        return self._closed
+
+    def frames(self) -> Iterator[bytes]:
+        """
+        Multipart parts for one viewer, until the capture stops or the
+        viewer disconnects (the generator is closed).
+        """
+        with self._cond:
+            self._viewers += 1
+            if self._thread is None and not self._closed:
+                self._thread = threading.Thread(target=self._run, name=f"preview-{self.source_id}",
+                                                daemon=True)
+                self._thread.start()
+        try:
+            version = 0
+            while True:
+                with self._cond:
+                    while self._version == version and not self._closed:
+                        self._cond.wait()
+                    if self._version == version:
+                        return
+                    if version:
+                        self.frames_skipped += self._version - version - 1
+                    version, part = self._version, self._part
+                # Blocks while the client is slow; parts encoded meanwhile are skipped
+                yield part
+                self.frames_sent += 1
+        finally:
+            with self._cond:
+                self._viewers -= 1
+                if self._viewers == 0:
+                    self._idle_since = time.time()
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "source_id": self.source_id,
+            "viewers": self._viewers,
+            "running": self._thread is not None,
+            "fps": self.fps,
+            "width": self.width,
+            "quality": self.quality,
+            "frames_encoded": self.frames_encoded,
+            "frames_sent": self.frames_sent,
+            "frames_skipped": self.frames_skipped,
+            "avg_encode_ms": round(self.encode_ms / self.frames_encoded, 2) if self.frames_encoded else None
+        }
+
+
+class PreviewRegistry:
+    """One PreviewStream per capture, created with the first viewer"""
+
+    def __init__(self, captures, fps: float = 5.0, width: int = 640, quality: int = 70):
+        self.captures = captures
+        self.fps = fps
+        self.width = width
+        self.quality = quality
+        # source_id -> (weak reference to the ring, stream); a stopped
+        # capture's ring is not kept alive (see FrameRing.unlink)
+        self._streams: Dict[str, Tuple[Any, PreviewStream]] = {}
+        self._lock = threading.Lock()
+
+    def stream(self, source_id: str) -> Optional[PreviewStream]:
+        """Preview of a running capture (None if it is not running)"""
+        ring = self.captures.get_ring(source_id)
+        if ring is None:
+            return None
+        with self._lock:
+            current = self._streams.get(source_id)
+            # A restarted capture has a new ring and gets a new stream
+            if current is None or current[0]() is not ring or current[1].closed:
+                current = self._streams[source_id] = (weakref.ref(ring), PreviewStream(
+                    source_id, self.captures, self.fps, self.width, self.quality))
+            return current[1]
+
+    def list(self) -> List[Dict[str, Any]]:
+        with self._lock:
+            return [stream.to_dict() for _, stream in self._streams.values()]
@@ -0,0 +1,115 @@
+"""
+Result Versions - Version tokens and deltas for per-lot detection results
+
+Every lot's result set gets a version token that only changes when some
+slot's status (or, for gate-counted lots, the running count) changes, or
+the slot layout does. Clients send back the token
+they last saw and receive only the slots whose status changed since then,
+or nothing at all when the lot is unchanged.
+
+Tokens look like "<epoch>.<n>": the epoch is random per process, so tokens
+issued before a restart are recognized as unknown and answered with the
+full result set.
+"""
+import threading
+import uuid
+from typing import Dict, Any, List, Optional, Tuple
+
+
+class LotVersion:
+    """Slot statuses of one lot and the version at which each last changed"""
+
+    def __init__(self):
+        self.version = 0
+        self.layout_version = 0
+        self.statuses: Dict[str, Tuple[str, Optional[int]]] = {}
+        self.changed_at: Dict[str, int] = {}
+
+
+class ResultVersions:
+    """Tracks result versions for every lot"""
+
+    def __init__(self, max_lots: int = 10000):
+        self.epoch = uuid.uuid4().hex[:8]
+        self.max_lots = max_lots
+        self._lots: Dict[str, LotVersion] = {}
+        self._lock = threading.Lock()
+
+    def token(self, version: int) -> str:
+        return f"{self.epoch}.{version}"
+
+    def _parse(self, token: Optional[str]) -> Optional[int]:
+        """Version number of a token from this process, else None"""
+        if not token:
+            return None
+        epoch, _, number = str(token).strip('"').partition('.')
+        if epoch != self.epoch or not number.isdigit():
+            return None
+        return int(number)
+
+    def update(self, lot_id: str, results: List[Dict[str, Any]],
+               since: Optional[str] = None) -> Dict[str, Any]:
+        """
+        Record a lot's latest results and build the response for a client.
+
+        Args:
+            lot_id: Lot identifier
+            results: Detection results (slot_id, status and count used)
+            since: Version token the client last saw (optional)
+
+        Returns:
+            Response fields (see _delta_fields)
+        """
+        statuses = {r.get('slot_id'): (r.get('status'), r.get('count')) for r in results}
+        with self._lock:
+            state = self._lots.get(lot_id)
+            if state is None:
+                if len(self._lots) >= self.max_lots:
+                    self._lots.pop(next(iter(self._lots)))
+                state = self._lots[lot_id] = LotVersion()
+
+            if statuses.keys() != state.statuses.keys():
+                # New lot or different slots: everything counts as changed
+                state.version += 1
+                state.layout_version = state.version
+                state.changed_at = dict.fromkeys(statuses, state.version)
+            else:
+                changed = [slot_id for slot_id, status in statuses.items()
+                           if state.statuses[slot_id] != status]
+                if changed:
+                    state.version += 1
+                    for slot_id in changed:
+                        state.changed_at[slot_id] = state.version
+            state.statuses = statuses
+            return self._delta_fields(state, results, since)
+
+    def delta(self, lot_id: str, results: List[Dict[str, Any]],
+              since: Optional[str] = None) -> Dict[str, Any]:
+        """Response fields for results already recorded with update"""
+        with self._lock:
+            state = self._lots.get(lot_id)
+            if state is None:
+                return {"version": None, "delta": False, "changed": True, "results": results}
+            return self._delta_fields(state, results, since)
+
+    def _delta_fields(self, state: LotVersion, results: List[Dict[str, Any]],
+                      since: Optional[str]) -> Dict[str, Any]:
+        """
+        Results relative to the client's version (lock held).
+
+        Returns:
+            {"version", "delta", "changed", "results"} - with a usable since
+            token results only contains the slots that changed after it;
+            unknown tokens or a layout change since then give the full set
+        """
+        version = self._parse(since)
+        token = self.token(state.version)
+        if version is None or version > state.version or version < state.layout_version:
+            return {"version": token, "delta": False, "changed": True, "results": results}
+        changed = {slot_id for slot_id, at in state.changed_at.items() if at > version}
+        return {
+            "version": token,
+            "delta": True,
+            "changed": bool(changed),
+            "results": [r for r in results if r.get('slot_id') in changed]
+        }
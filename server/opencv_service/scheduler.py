@@ -0,0 +1,568 @@
+"""
+Scheduler - Adaptive per-camera sampling of registered lots
+
+Instead of detecting only when a client calls /detect-occupancy, the service
+monitors registered sources itself and adapts how often each one is
+analyzed:
+    - every probe, a small thumbnail of the newest frame is compared with
+      the previous one (cheap frame differencing)
+    - motion brings the source back to its minimum interval; idle scenes
+      back off towards the maximum interval, stretched further at night
+    - unchanged inputs (same ring sequence / same file mtime) cost nothing
+    - all work is charged against a global CPU budget (token bucket); when
+      it runs short, the source that has been due the longest goes first
+    - with a quality gate, unusable frames (dark, blurred, frozen, ...) are
+      not analyzed and the lot's latest result is marked stale instead
+    - calibrated sources are undistorted (cached remap tables, slots' region
+      only) right before detection
+
+Gate-only lots (camera on the entrance, no slot view) are counted instead:
+a thread per gate follows every frame of the source's capture ring through
+a line_counter.LineCounter, which reads only a thin band of pixels, and
+publishes the running count as the lot's latest result.
+
+The latest result of every lot is kept in memory for O(1) reads.
+
+Sources:
+    ring://<source_id>   frames from a running capture (frame_ring.py)
+    camera://N, URLs,    a capture is started for the source
+    video files          (video files loop)
+    file path            re-read whenever the file changes
+"""
+import os
+import threading
+import time
+from typing import Callable, Dict, Any, List, Optional, Tuple
+
+import cv2
+import numpy as np
+from utils import load_image, to_grayscale, VIDEO_EXTENSIONS
+from undistort import undistort
+
+THUMBNAIL_SIZE = (64, 36)
+PIXEL_DIFF = 25  # Gray levels a thumbnail pixel must change by to count as motion
+GATE_POLL = 0.02  # Seconds between checks of a gate's ring for new frames
+
+
+def motion_score(previous: Optional[np.ndarray], thumbnail: np.ndarray) -> float:
+    """Fraction of thumbnail pixels that changed noticeably"""
+    if previous is None or previous.shape != thumbnail.shape:
+        return 1.0
+    changed = cv2.compare(cv2.absdiff(previous, thumbnail), PIXEL_DIFF, cv2.CMP_GT)
+    return cv2.countNonZero(changed) / changed.size
+
+
+def parse_hours(value: str) -> Optional[Tuple[int, int]]:
+    """Parse "22-6" into (22, 6); empty disables"""
+    if not value:
+        return None
+    start, end = value.split('-')
+    return int(start) % 24, int(end) % 24
+
+
+class ScheduledSource:
+    """Sampling state of one registered lot"""
+
+    def __init__(self, lot_id: str, source: str, slots: List[Dict[str, Any]],
+                 min_interval: float, max_interval: float, decode_scale: int,
+                 detector=None, calibration=None):
+        self.lot_id = lot_id
+        self.source = source
+        self.slots = slots
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.decode_scale = decode_scale
+        self.detector = detector
+        self.calibration = calibration
+        self.interval = min_interval
+        self.next_probe = 0.0
+        self.last_detection = 0.0
+        self.thumbnail: Optional[np.ndarray] = None
+        self.frame_key: Any = None
+        self.motion = 0.0
+        self.probes = 0
+        self.detections = 0
+        self.rejected = 0  # frames that failed the quality gate
+        self.quality: Optional[Dict[str, Any]] = None
+        self.cpu_seconds = 0.0
+        self.error: Optional[str] = None
+        self.failures = 0  # consecutive failed probes
+        self.busy = False
+        self.capture_id: Optional[str] = None
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "lot_id": self.lot_id,
+            "source": self.source,
+            "slots": len(self.slots),
+            "interval": round(self.interval, 3),
+            "min_interval": self.min_interval,
+            "max_interval": self.max_interval,
+            "motion": round(self.motion, 4),
+            "last_detection": self.last_detection or None,
+            "probes": self.probes,
+            "detections": self.detections,
+            "rejected_frames": self.rejected,
+            "quality": self.quality,
+            "calibrated": self.calibration is not None,
+            "cpu_seconds": round(self.cpu_seconds, 3),
+            "error": self.error
+        }
+
+
+class GateSource:
+    """Streaming line-crossing count of one gate-only lot"""
+
+    def __init__(self, lot_id: str, source: str, counter):
+        self.lot_id = lot_id
+        self.source = source
+        self.counter = counter
+        self.capture_id: Optional[str] = None
+        self.seq = -1  # last ring frame processed
+        self.dropped = 0  # frames overwritten before they were read
+        self.pending_count: Optional[int] = None  # reset requested by reset_gate
+        self.published = False
+        self.cpu_seconds = 0.0
+        self.error: Optional[str] = None
+        self.stop_event = threading.Event()
+        self.thread: Optional[threading.Thread] = None
+
+    @property
+    def ring_id(self) -> str:
+        return self.capture_id or self.source[len("ring://"):]
+
+    def to_dict(self) -> Dict[str, Any]:
+        snapshot = self.counter.snapshot()
+        return {
+            "lot_id": self.lot_id,
+            "source": self.source,
+            "mode": "gate",
+            "count": snapshot["count"],
+            "capacity": snapshot["capacity"],
+            "entries": snapshot["entries"],
+            "exits": snapshot["exits"],
+            "frames": snapshot["frames"],
+            "dropped_frames": self.dropped,
+            "cpu_seconds": round(self.cpu_seconds, 3),
+            "error": self.error
+        }
+
+
+class Scheduler:
+    """Runs adaptive detection for registered sources on background threads"""
+
+    def __init__(self, detector, captures=None, history=None,
+                 cpu_budget: float = 1.0, workers: int = 1,
+                 motion_threshold: float = 0.02, backoff: float = 1.5,
+                 night_hours: Optional[Tuple[int, int]] = None, night_factor: float = 4.0,
+                 on_result: Optional[Callable[[str, Dict[str, Any]], None]] = None,
+                 quality_gate=None, archive=None):
+        """
+        Initialize the scheduler.
+
+        Args:
+            detector: Detector used for sources without their own
+            captures: CaptureRegistry used to read ring:// sources and to
+                start captures for camera/stream sources
+            history: Optional HistoryStore every detection is appended to
+            cpu_budget: Average CPU cores the scheduler may use
+            workers: Threads running probes/detections
+            motion_threshold: Motion score that resets a source to min_interval
+            backoff: Interval growth factor per idle detection
+            night_hours: (start_hour, end_hour) local time of slower sampling
+            night_factor: Interval multiplier at night
+            on_result: Called as on_result(lot_id, entry) after each detection
+            quality_gate: Optional frame_quality.QualityGate checked before
+                each detection
+            archive: Optional frame_archive.FrameArchive receiving the
+                frames of status changes
+        """
+        self.detector = detector
+        self.captures = captures
+        self.history = history
+        self.cpu_budget = cpu_budget
+        self.workers = max(int(workers), 1)
+        self.motion_threshold = motion_threshold
+        self.backoff = backoff
+        self.night_hours = night_hours
+        self.night_factor = night_factor
+        self.on_result = on_result
+        self.quality_gate = quality_gate
+        self.archive = archive
+
+        self._sources: Dict[str, ScheduledSource] = {}
+        self._gates: Dict[str, GateSource] = {}
+        self._latest: Dict[str, Dict[str, Any]] = {}
+        self._cond = threading.Condition()
+        self._threads: List[threading.Thread] = []
+        self._stopping = False
+        # CPU token bucket, in CPU-seconds
+        self._burst = max(cpu_budget * 2.0, 0.5)
+        self._tokens = self._burst
+        self._refilled_at = time.monotonic()
+
+    # Registration
+
+    def register(self, lot_id: str, source: str, slots: List[Dict[str, Any]],
+                 min_interval: float = 2.0, max_interval: float = 60.0,
+                 decode_scale: int = 1, detector=None, calibration=None) -> Dict[str, Any]:
+        """
+        Start monitoring a lot (replaces an existing registration).
+
+        Args:
+            lot_id: Lot identifier (key of the latest result)
+            source: ring://<id>, camera/stream source or image file path
+            slots: Slot definitions
+            min_interval: Seconds between detections while there is activity
+            max_interval: Upper bound for idle scenes (before the night factor)
+            decode_scale: Reduced-size decode factor
+            detector: Detector for this lot (defaults to the shared one)
+            calibration: Optional undistort.Calibration applied to the
+                frames that are analyzed (ring:// sources default to their
+                capture's calibration)
+
+        Returns:
+            Source description
+        """
+        if min_interval <= 0 or max_interval < min_interval:
+            raise ValueError("Expected 0 < min_interval <= max_interval")
+        entry = ScheduledSource(lot_id, source, slots, float(min_interval), float(max_interval),
+                                int(decode_scale), detector, calibration)
+        if self._is_stream(source) and not source.startswith("ring://"):
+            if self.captures is None:
+                raise ValueError(f"No capture registry for source: {source}")
+            entry.capture_id = f"sched-{lot_id}"
+            self.captures.stop(entry.capture_id)
+            self.captures.start(entry.capture_id, source, max_fps=max(1.0 / min_interval, 1.0))
+        elif source.startswith("ring://") and calibration is None and self.captures is not None:
+            entry.calibration = self.captures.get_calibration(source[len("ring://"):])
+        elif not self._is_stream(source) and not os.path.exists(source):
+            raise ValueError(f"Image file not found: {source}")
+
+        self._remove_gate(lot_id)
+        with self._cond:
+            previous = self._sources.get(lot_id)
+            self._sources[lot_id] = entry
+            self._cond.notify_all()
+        if previous is not None and previous.capture_id and previous.capture_id != entry.capture_id:
+            self.captures.stop(previous.capture_id)
+        self._start_threads()
+        return entry.to_dict()
+
+    def register_gate(self, lot_id: str, source: str, counter,
+                      max_fps: Optional[float] = None) -> Dict[str, Any]:
+        """
+        Start counting a gate-only lot (replaces an existing registration).
+
+        Args:
+            lot_id: Lot identifier (key of the latest result)
+            source: ring://<id>, camera/stream source or video file (looped)
+            counter: line_counter.LineCounter of the entrance
+            max_fps: Optional cap on the capture rate of a started capture
+
+        Returns:
+            Source description
+        """
+        if not self._is_stream(source):
+            raise ValueError(f"Gate counting needs a live source or video: {source}")
+        if self.captures is None:
+            raise ValueError(f"No capture registry for source: {source}")
+        self.unregister(lot_id)
+        gate = GateSource(lot_id, source, counter)
+        if not source.startswith("ring://"):
+            gate.capture_id = f"gate-{lot_id}"
+            self.captures.stop(gate.capture_id)
+            self.captures.start(gate.capture_id, source, max_fps=max_fps)
+        gate.thread = threading.Thread(target=self._run_gate, args=(gate,), name=f"gate-{lot_id}",
+                                       daemon=True)
+        with self._cond:
+            self._gates[lot_id] = gate
+        gate.thread.start()
+        return gate.to_dict()
+
+    def reset_gate(self, lot_id: str, count: int) -> bool:
+        """Restart a gate's count from a known number of vehicles (e.g. after a manual check)"""
+        gate = self._gates.get(lot_id)
+        if gate is None:
+            return False
+        gate.pending_count = int(count)
+        return True
+
+    def _remove_gate(self, lot_id: str) -> Optional[GateSource]:
+        with self._cond:
+            gate = self._gates.pop(lot_id, None)
+        if gate is None:
+            return None
+        gate.stop_event.set()
+        if gate.thread is not None and gate.thread is not threading.current_thread():
+            gate.thread.join(timeout=2)
+        if gate.capture_id:
+            self.captures.stop(gate.capture_id)
+        return gate
+
+    def unregister(self, lot_id: str) -> bool:
+        gate = self._remove_gate(lot_id)
+        with self._cond:
+            entry = self._sources.pop(lot_id, None)
+            self._latest.pop(lot_id, None)
+        if entry is None:
+            return gate is not None
+        if entry.capture_id:
+            self.captures.stop(entry.capture_id)
+        return True
+
+    def sources(self) -> List[Dict[str, Any]]:
+        return [entry.to_dict() for entry in list(self._sources.values())] + \
+            [gate.to_dict() for gate in list(self._gates.values())]
+
+    def latest(self, lot_id: str) -> Optional[Dict[str, Any]]:
+        """Latest detection of a lot (None before the first one)"""
+        return self._latest.get(lot_id)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "sources": len(self._sources),
+            "gates": len(self._gates),
+            "cpu_budget": self.cpu_budget,
+            "tokens": round(self._tokens, 3),
+            "night": self._is_night()
+        }
+
+    def shutdown(self):
+        with self._cond:
+            self._stopping = True
+            self._cond.notify_all()
+        for lot_id in list(self._sources) + list(self._gates):
+            self.unregister(lot_id)
+
+    # Scheduling
+
+    @staticmethod
+    def _is_stream(source: str) -> bool:
+        return "://" in source or source.isdigit() or os.path.splitext(source.lower())[1] in VIDEO_EXTENSIONS
+
+    def _is_night(self) -> bool:
+        if not self.night_hours:
+            return False
+        start, end = self.night_hours
+        hour = time.localtime().tm_hour
+        return start <= hour < end if start < end else hour >= start or hour < end
+
+    def _start_threads(self):
+        with self._cond:
+            while len(self._threads) < self.workers:
+                thread = threading.Thread(target=self._worker, name=f"scheduler-{len(self._threads)}",
+                                          daemon=True)
+                self._threads.append(thread)
+                thread.start()
+
+    def _refill(self):
+        now = time.monotonic()
+        self._tokens = min(self._burst, self._tokens + (now - self._refilled_at) * self.cpu_budget)
+        self._refilled_at = now
+
+    def _next_task(self) -> Optional[ScheduledSource]:
+        """Wait for the earliest due source and a positive CPU balance (lock held)"""
+        while not self._stopping:
+            now = time.monotonic()
+            idle = [entry for entry in self._sources.values() if not entry.busy]
+            if not idle:
+                self._cond.wait(1.0)
+                continue
+            entry = min(idle, key=lambda e: e.next_probe)
+            if entry.next_probe > now:
+                self._cond.wait(entry.next_probe - now)
+                continue
+            self._refill()
+            if self._tokens <= 0:
+                self._cond.wait(-self._tokens / self.cpu_budget if self.cpu_budget > 0 else 1.0)
+                continue
+            entry.busy = True
+            return entry
+        return None
+
+    def _worker(self):
+        while True:
+            with self._cond:
+                entry = self._next_task()
+            if entry is None:
+                return
+            started = time.thread_time()
+            try:
+                self._probe(entry)
+                entry.error = None
+                entry.failures = 0
+            except Exception as e:
+                entry.error = str(e)
+                entry.interval = entry.max_interval
+                # Failing sources are retried with backoff, up to max_interval apart
+                entry.next_probe = time.monotonic() + min(
+                    entry.min_interval * self.backoff ** entry.failures, entry.max_interval)
+                entry.failures += 1
+            cost = time.thread_time() - started
+            with self._cond:
+                entry.cpu_seconds += cost
+                self._tokens -= cost
+                entry.busy = False
+                self._cond.notify_all()
+
+    def _read_frame(self, entry: ScheduledSource) -> Tuple[Any, Optional[np.ndarray]]:
+        """
+        Newest frame of a source as grayscale at the source's decode scale.
+
+        Returns:
+            (frame_key, frame) - frame is None when the input is unchanged
+        """
+        if entry.source.startswith("ring://") or entry.capture_id:
+            ring = self.captures.get_ring(entry.capture_id or entry.source[len("ring://"):])
+            if ring is None:
+                raise ValueError(f"No capture running for {entry.source}")
+            if ring.latest_seq == entry.frame_key:
+                return entry.frame_key, None
+            latest = ring.read_latest(copy=True)
+            if latest is None:
+                return entry.frame_key, None
+            seq, _, frame = latest
+            return seq, to_grayscale(frame, entry.decode_scale)
+
+        stat = os.stat(entry.source)
+        key = (stat.st_mtime_ns, stat.st_size)
+        if key == entry.frame_key:
+            return key, None
+        return key, load_image(entry.source, grayscale=True, scale=entry.decode_scale)
+
+    @staticmethod
+    def _undistort(entry: ScheduledSource, frame: np.ndarray) -> np.ndarray:
+        """Correct lens distortion inside the slots' region (cached remap tables)"""
+        if entry.calibration is None:
+            return frame
+        return undistort(frame, entry.calibration, entry.slots, entry.decode_scale)
+
+    def _usable(self, entry: ScheduledSource, frame: np.ndarray) -> bool:
+        """Run the quality gate; on failure mark the lot's latest result stale"""
+        if self.quality_gate is None:
+            return True
+        entry.quality = self.quality_gate.check(entry.lot_id, frame, live=self._is_stream(entry.source))
+        if entry.quality["ok"]:
+            return True
+        entry.rejected += 1
+        with self._cond:
+            latest = self._latest.get(entry.lot_id)
+            if latest is not None and self._sources.get(entry.lot_id) is entry:
+                self._latest[entry.lot_id] = dict(latest, stale=True, quality=entry.quality)
+        return False
+
+    def _probe(self, entry: ScheduledSource):
+        """Check a source for motion and detect when it is active or due"""
+        now_wall = time.time()
+        entry.probes += 1
+        key, frame = self._read_frame(entry)
+
+        if frame is not None:
+            thumbnail = cv2.resize(frame, THUMBNAIL_SIZE, interpolation=cv2.INTER_AREA)
+            entry.motion = motion_score(entry.thumbnail, thumbnail)
+            entry.thumbnail = thumbnail
+            entry.frame_key = key
+        else:
+            entry.motion = 0.0
+
+        factor = self.night_factor if self._is_night() else 1.0
+        active = entry.motion >= self.motion_threshold
+        due = now_wall - entry.last_detection >= entry.interval * factor
+        if frame is not None and (active or due) and self._usable(entry, frame):
+            detector = entry.detector or self.detector
+            frame = self._undistort(entry, frame)
+            results = detector.detect_occupancy_frame(frame, entry.slots, scale=entry.decode_scale)
+            entry.last_detection = now_wall
+            entry.detections += 1
+            result = {
+                "lot_id": entry.lot_id,
+                "timestamp": now_wall,
+                "source": entry.source,
+                "motion": round(entry.motion, 4),
+                "results": results
+            }
+            if entry.quality is not None:
+                result["quality"] = entry.quality
+            with self._cond:
+                if self._sources.get(entry.lot_id) is not entry:
+                    return  # unregistered or replaced meanwhile
+                self._latest[entry.lot_id] = result
+            if self.history is not None:
+                self.history.append(entry.lot_id, results, now_wall)
+            if self.archive is not None:
+                self.archive.record(entry.lot_id, entry.slots, results, frame, entry.decode_scale, now_wall)
+            if self.on_result is not None:
+                self.on_result(entry.lot_id, result)
+
+        # Adapt: activity resets the interval, idle detections back off
+        if active:
+            entry.interval = entry.min_interval
+        elif due:
+            entry.interval = min(entry.interval * self.backoff, entry.max_interval)
+        # Probe for motion at the minimum interval, detect at the adapted one
+        entry.next_probe = time.monotonic() + entry.min_interval * factor
+
+    # Gate counting
+
+    def _run_gate(self, gate: GateSource):
+        """Feed every new frame of a gate's ring through its counter"""
+        counter = gate.counter
+        while not gate.stop_event.is_set():
+            ring = self.captures.get_ring(gate.ring_id)
+            if ring is None:
+                gate.error = f"No capture running for {gate.source}"
+                gate.stop_event.wait(1.0)
+                continue
+            gate.error = None
+            changed = not gate.published
+            if gate.pending_count is not None:
+                counter.reset(gate.pending_count)
+                gate.pending_count = None
+                changed = True
+            latest = ring.latest_seq
+            if latest <= gate.seq:
+                if changed:
+                    self._publish_gate(gate)
+                gate.stop_event.wait(GATE_POLL)
+                continue
+
+            started = time.thread_time()
+            # Frames older than the ring holds are lost; follow the newest ones
+            first = max(gate.seq + 1, latest - ring.capacity + 2)
+            if gate.seq >= 0:
+                gate.dropped += first - gate.seq - 1
+            for seq in range(first, latest + 1):
+                frame = ring.read(seq)
+                band = counter.extract(frame[2]) if frame is not None else None
+                if band is None or not ring.is_current(seq):
+                    gate.dropped += 1
+                    continue
+                if counter.update_band(band, frame[1]):
+                    changed = True
+            gate.seq = latest
+            cost = time.thread_time() - started
+            gate.cpu_seconds += cost
+            with self._cond:
+                self._tokens -= cost
+            if changed:
+                self._publish_gate(gate)
+
+    def _publish_gate(self, gate: GateSource):
+        """Make a gate's running count the lot's latest result"""
+        gate.published = True
+        snapshot = gate.counter.snapshot()
+        result = {
+            "lot_id": gate.lot_id,
+            "timestamp": time.time(),
+            "source": gate.source,
+            "mode": "gate",
+            "gate": snapshot,
+            "results": [gate.counter.lot_result()]
+        }
+        with self._cond:
+            if self._gates.get(gate.lot_id) is not gate:
+                return
+            self._latest[gate.lot_id] = result
+        if self.on_result is not None:
+            self.on_result(gate.lot_id, result)
@@ -4,32 +4,261 @@ Flask API Service for OpenCV Parking Occupancy Detection
 This service exposes the OpenCV detection functionality via HTTP API
 for integration with the Node.js backend.
 """
-from flask import Flask, request, jsonify
+from flask import Flask, request, jsonify, Response
 from flask_cors import CORS
 import os
+import sys
 import json
-import tempfile
-from typing import Dict, Any, List
-from occupancy_detector import OccupancyDetector
-from slot_selector import SlotSelector
-from camera_manager import CameraManager
-import cv2
+from typing import Dict, Any, List, Tuple
+from jobs import JobManager, JobQueueFull, SUCCEEDED, FAILED, CANCELLED
+from startup import LazyObject, Warmup
+from result_versions import ResultVersions
+from memory_budget import MemoryBudgetExceeded
+import atexit
+import hashlib
+import time
+import uuid
+
+# OpenCV and the detection modules are imported lazily (on first use or by
+# the background warm-up) so the service answers /live immediately.
 
 app = Flask(__name__)
 CORS(app)  # Enable CORS for Node.js backend
 
-# Global detector instance
-detector = OccupancyDetector(threshold=0.15)
 
+def create_detectors():
+    from detector_registry import DetectorRegistry
+    # OPENCV_DECODE_SCALE (1, 2, 4 or 8) enables reduced-size JPEG decoding
+    return DetectorRegistry(
+        threshold=0.15,
+        decode_scale=int(os.environ.get('OPENCV_DECODE_SCALE', 1))
+    )
 
-@app.route('/health', methods=['GET'])
-def health():
-    """Health check endpoint"""
-    return jsonify({
+
+def create_captures():
+    from frame_ring import CaptureRegistry
+    registry = CaptureRegistry()
+    atexit.register(registry.stop_all)
+    return registry
+
+
+def create_history():
+    from history_store import HistoryStore
+    return HistoryStore(os.environ.get('OPENCV_HISTORY_DIR', os.path.join(DATA_DIR, 'history')))
+
+
+def create_scheduler():
+    from scheduler import Scheduler, parse_hours
+    instance = Scheduler(
+        detector, captures, history,
+        cpu_budget=float(os.environ.get('OPENCV_SCHEDULER_CPU_BUDGET', 1.0)),
+        workers=int(os.environ.get('OPENCV_SCHEDULER_WORKERS', 1)),
+        night_hours=parse_hours(os.environ.get('OPENCV_SCHEDULER_NIGHT_HOURS', '')),
+        night_factor=float(os.environ.get('OPENCV_SCHEDULER_NIGHT_FACTOR', 4.0)),
+        on_result=lambda lot_id, entry: entry.update(version=versions.update(lot_id, entry["results"])["version"]),
+        quality_gate=create_quality_gate(),
+        archive=archive.get()
+    )
+    atexit.register(instance.shutdown)
+    return instance
+
+
+def create_archive():
+    from frame_archive import create_archive as create
+    return create(os.environ.get('OPENCV_ARCHIVE_DIR', os.path.join(DATA_DIR, 'archive')))
+
+
+def create_quality_gate():
+    from frame_quality import create_gate
+    return create_gate()
+
+
+def create_calibrations():
+    from undistort import CalibrationStore
+    return CalibrationStore(os.environ.get('OPENCV_CALIBRATIONS', os.path.join(DATA_DIR, 'calibrations.json')))
+
+
+def create_previews():
+    from preview_stream import PreviewRegistry
+    return PreviewRegistry(
+        captures,
+        fps=float(os.environ.get('OPENCV_PREVIEW_FPS', 5)),
+        width=int(os.environ.get('OPENCV_PREVIEW_WIDTH', 640)),
+        quality=int(os.environ.get('OPENCV_PREVIEW_QUALITY', 70))
+    )
+
+
+def create_cache(**kwargs):
+    from annotated_frames import RenderCache
+    return RenderCache(**kwargs)
+
+
+# Immutable detectors shared across request threads, one per configuration
+detectors = LazyObject(create_detectors)
+
+# Detector with the default configuration
+detector = LazyObject(lambda: detectors.lookup())
+
+
+def detector_for(lot_id: str = None, engine: str = None, threshold: float = None,
+                 engine_options: Dict[str, Any] = None):
+    """
+    Detector for a request's threshold and a lot's engine. Detectors are
+    never modified per request; the default adaptive engine is stateless
+    and shared between lots, other engines (e.g. reference) keep per-lot state.
+    
+    Raises:
+        ValueError: For an unknown engine, invalid threshold or engine
+            options, or a stateful engine without lot_id
+    """
+    return detectors.lookup(threshold=threshold, engine=engine, lot_id=lot_id,
+                            engine_options=engine_options)
+
+
+# Capture processes writing frames into shared-memory rings (ring://<source_id>)
+captures = LazyObject(create_captures)
+
+# Per-lot occupancy history (appended when a request carries lot_id)
+DATA_DIR = os.environ.get('OPENCV_DATA_DIR', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data'))
+history = LazyObject(create_history)
+
+# Stream recordings (record-source jobs, replay:// sources)
+RECORDINGS_DIR = os.environ.get('OPENCV_RECORDINGS_DIR', os.path.join(DATA_DIR, 'recordings'))
+
+# Evidence frames of slot status changes (OPENCV_ARCHIVE=crops|frame, see frame_archive.py)
+archive = LazyObject(create_archive)
+
+# Version tokens of each lot's result set (delta responses)
+versions = ResultVersions()
+
+# Adaptive background detection of registered lots (latest result per lot)
+scheduler = LazyObject(create_scheduler)
+
+# Long-running operations run here, never on request workers
+jobs = JobManager(
+    max_workers=int(os.environ.get('OPENCV_JOB_WORKERS', 2)),
+    max_queued=int(os.environ.get('OPENCV_JOB_QUEUE', 100))
+)
+atexit.register(jobs.shutdown)
+
+# Encoded annotated views, and the detections behind them, keyed by frame id
+render_cache = LazyObject(lambda: create_cache(
+    max_bytes=int(os.environ.get('OPENCV_RENDER_CACHE_MB', 64)) * 1024 * 1024, component='render_cache'))
+detection_cache = LazyObject(lambda: create_cache(max_entries=512, component='detection_cache'))
+
+# Lens calibrations per source (undistort.py)
+calibrations = LazyObject(create_calibrations)
+
+# Shared MJPEG previews of running captures (OPENCV_PREVIEW_* variables, see preview_stream.py)
+previews = LazyObject(create_previews)
+
+# Frame quality checks of lot requests (OPENCV_QUALITY_* variables, see frame_quality.py)
+quality_gate = LazyObject(create_quality_gate)
+
+# Background warm-up (OPENCV_WARMUP* variables, see startup.py)
+warmup = Warmup()
+
+# Binary detection protocol for co-located clients (see socket_server.py)
+SOCKET_PATH = os.environ.get('OPENCV_SOCKET_PATH')
+detection_socket = None
+
+
+def start_socket_server():
+    """Serve run_detection on the Unix socket at OPENCV_SOCKET_PATH"""
+    global detection_socket
+    from socket_server import SocketServer
+    detection_socket = SocketServer(SOCKET_PATH, run_detection, health_status,
+                                    workers=int(os.environ.get('OPENCV_SOCKET_WORKERS', 4)))
+    detection_socket.start()
+    atexit.register(detection_socket.stop)
+
+
+def calibration_for(source: str, data: Dict[str, Any] = None):
+    """
+    Calibration of a request: sent with it, stored for the source, or the
+    one the capture behind a ring:// source was started with.
+    
+    Raises:
+        ValueError: If the calibration sent is malformed
+    """
+    from undistort import Calibration
+    if data and data.get('calibration'):
+        return Calibration(data['calibration'])
+    calibration = calibrations.lookup(source)
+    if calibration is None and source.startswith("ring://") and captures.loaded:
+        calibration = captures.get_calibration(source[len("ring://"):])
+    return calibration
+
+
+@app.before_request
+def start_warmup():
+    """Start warm-up with the first request when not started by __main__"""
+    warmup.start(detector, captures)
+
+
+VIDEO_EXTENSIONS = ['.mp4', '.avi', '.mov', '.mkv', '.flv', '.wmv', '.webm']
+
+
+def health_status() -> Dict[str, Any]:
+    """Body of /health, also sent by the detection socket"""
+    cv2 = sys.modules.get('cv2')
+    return {
         "status": "healthy",
         "service": "opencv-parking-detection",
-        "opencv_version": cv2.__version__
-    }), 200
+        "opencv_version": cv2.__version__ if cv2 else None,
+        "ready": warmup.ready,
+        "state": warmup.state
+    }
+
+
+@app.route('/health', methods=['GET'])
+def health():
+    """Health check endpoint (never waits for OpenCV to load)"""
+    return jsonify(health_status()), 200
+
+
+@app.route('/live', methods=['GET'])
+def live():
+    """Liveness check: the process is up and serving requests"""
+    return jsonify({"status": "alive"}), 200
+
+
+@app.route('/ready', methods=['GET'])
+def ready():
+    """
+    Readiness check: 503 until warm-up has finished
+    
+    Returns:
+    {
+        "state": "warming" | "ready" | "degraded",
+        "ready": true,
+        "startup_seconds": 1.42,
+        "steps": [{"step": "import", "ok": true, "ms": 410.2, ...}, ...]
+    }
+    """
+    return jsonify(warmup.to_dict()), 200 if warmup.ready else 503
+
+
+@app.route('/memory', methods=['GET'])
+def memory_report():
+    """
+    Memory accounted against the budget (OPENCV_MEMORY_BUDGET_MB), by component
+    
+    Returns:
+    {
+        "success": true,
+        "budget_bytes": 2147483648,
+        "total_bytes": 812000000,
+        "pinned_bytes": 600000000,
+        "components": {
+            "capture_rings": {"entries": 4, "bytes": 600000000, "pinned_bytes": 600000000},
+            "render_cache": {"entries": 40, "bytes": 4000000, "pinned_bytes": 0, "evictions": 12},
+            ...
+        }
+    }
+    """
+    from memory_budget import accountant
+    return jsonify({"success": True, **accountant.report()}), 200
 
 
 @app.route('/cameras', methods=['GET'])
@@ -66,6 +295,7 @@ def list_cameras():
     }
     """
     try:
+        from camera_manager import CameraManager
         cameras = CameraManager.list_available_cameras()
         source_types = CameraManager.get_camera_source_types()
         
@@ -108,6 +338,7 @@ def test_camera():
         if not source:
             return jsonify({"success": False, "error": "source is required"}), 400
         
+        from camera_manager import CameraManager
         result = CameraManager.test_camera_connection(source)
         status_code = 200 if result["success"] else 400
         
@@ -119,6 +350,206 @@ def test_camera():
         }), 500
 
 
+def run_slot_selector(image_path: str, output_path: str = None):
+    """Run the interactive slot selector and optionally save its output"""
+    from slot_selector import SlotSelector
+    selector = SlotSelector(image_path)
+    slots = selector.run()
+    
+    # Save to file if output_path provided
+    if slots and output_path:
+        with open(output_path, 'w') as f:
+            json.dump({
+                "image_path": image_path,
+                "slots": slots
+            }, f, indent=2)
+    return slots
+
+
+def define_slots_job(job, image_path: str, output_path: str = None):
+    job.report(message="Waiting for slot definition")
+    slots = run_slot_selector(image_path, output_path)
+    if not slots:
+        raise ValueError("No slots defined")
+    return {"slots": slots}
+
+
+def detect_video_job(job, video_path: str, slots: list, frame_stride: int = 1,
+                     start_frame: int = 0, max_frames: int = None, threshold: float = None,
+                     decode_scale: int = None):
+    video_detector = detector_for(threshold=threshold)
+    frames = []
+    for entry in video_detector.detect_video(
+            video_path, slots,
+            frame_stride=frame_stride,
+            start_frame=start_frame,
+            max_frames=max_frames,
+            decode_scale=decode_scale,
+            progress=lambda done, total: job.report(done / total if total else None,
+                                                    f"Frame {done}/{total}"),
+            should_stop=lambda: job.cancel_requested):
+        frames.append(entry)
+    return {"frames": frames}
+
+
+def count_video_job(job, video_path: str, gate: dict, max_frames: int = None):
+    from line_counter import create_counter, count_video
+    counter = create_counter(gate)
+    crossings = list(count_video(
+        video_path, counter,
+        max_frames=max_frames,
+        progress=lambda done, total: job.report(done / total if total else None,
+                                                f"Frame {done}/{total}"),
+        should_stop=lambda: job.cancel_requested))
+    return {"crossings": crossings, **counter.snapshot()}
+
+
+def record_source_job(job, source: str, output_path: str = None, duration: float = None,
+                      max_frames: int = None):
+    from frame_recording import record_source
+    if not output_path:
+        name = ''.join(c if c.isalnum() else '-' for c in source.split('://')[-1]).strip('-')[-40:]
+        output_path = os.path.join(RECORDINGS_DIR, f"{name or 'source'}-{int(time.time())}.rec")
+    os.makedirs(os.path.dirname(os.path.abspath(output_path)), exist_ok=True)
+    # Record a running capture from its ring: a camera cannot be opened twice
+    ring = captures.get_ring(source[len("ring://"):]) if source.startswith("ring://") else \
+        captures.find_by_source(source) if captures.loaded else None
+    if source.startswith("ring://") and ring is None:
+        raise ValueError(f"No capture running for {source}")
+    return record_source(
+        source, output_path,
+        duration=float(duration) if duration else None,
+        max_frames=int(max_frames) if max_frames else None,
+        ring=ring,
+        progress=lambda done, total: job.report(done / total if total else None, f"Frame {done}"),
+        should_stop=lambda: job.cancel_requested)
+
+
+# Job types accepted by POST /jobs: name -> (function, required params)
+JOB_TYPES = {
+    "define-slots": (define_slots_job, ["image_path"]),
+    "detect-video": (detect_video_job, ["video_path", "slots"]),
+    "count-video": (count_video_job, ["video_path", "gate"]),
+    "record-source": (record_source_job, ["source"])
+}
+
+
+def submit_job(kind: str, params: dict):
+    """Queue a job and build the 202 response"""
+    function, required = JOB_TYPES[kind]
+    missing = [name for name in required if not params.get(name)]
+    if missing:
+        return jsonify({"success": False, "error": f"Missing required params: {', '.join(missing)}"}), 400
+    try:
+        job = jobs.submit(kind, function, params)
+    except JobQueueFull as e:
+        return jsonify({"success": False, "error": str(e)}), 503
+    return jsonify({
+        "success": True,
+        "job_id": job.id,
+        "status": job.status,
+        "status_url": f"/jobs/{job.id}"
+    }), 202
+
+
+@app.route('/jobs', methods=['POST'])
+def create_job():
+    """
+    Submit a long-running operation
+    
+    Expected JSON:
+    {
+        "type": "define-slots" | "detect-video" | "count-video",
+        "params": {
+            // define-slots: image_path, output_path (optional)
+            // detect-video: video_path, slots, frame_stride, start_frame,
+            //               max_frames, threshold, decode_scale (optional)
+            // count-video:  video_path, gate (see /scheduler/sources), max_frames (optional)
+            // record-source: source (camera, stream, video or ring://<id>), output_path,
+            //                duration, max_frames (optional; without a limit it runs until
+            //                cancelled). Replay with "replay://<output_path>".
+        }
+    }
+    
+    Returns (202):
+    {
+        "success": true,
+        "job_id": "...",
+        "status": "queued",
+        "status_url": "/jobs/<job_id>"
+    }
+    """
+    data = request.json or {}
+    kind = data.get('type')
+    if kind not in JOB_TYPES:
+        return jsonify({"success": False, "error": f"Unknown job type: {kind}. Expected one of {sorted(JOB_TYPES)}"}), 400
+    return submit_job(kind, dict(data.get('params') or {}))
+
+
+@app.route('/jobs', methods=['GET'])
+def list_jobs():
+    """List known jobs (without results) and executor statistics"""
+    return jsonify({
+        "success": True,
+        "jobs": [job.to_dict() for job in jobs.list()],
+        "stats": jobs.stats()
+    }), 200
+
+
+@app.route('/jobs/<job_id>', methods=['GET'])
+def get_job(job_id):
+    """Job status and progress"""
+    job = jobs.get(job_id)
+    if job is None:
+        return jsonify({"success": False, "error": f"Job not found: {job_id}"}), 404
+    return jsonify({"success": True, **job.to_dict()}), 200
+
+
+@app.route('/jobs/<job_id>/result', methods=['GET'])
+def get_job_result(job_id):
+    """Result of a finished job (409 while it is still queued or running)"""
+    job = jobs.get(job_id)
+    if job is None:
+        return jsonify({"success": False, "error": f"Job not found: {job_id}"}), 404
+    if job.status == SUCCEEDED:
+        return jsonify({"success": True, "job_id": job.id, "result": job.result}), 200
+    if job.status in (FAILED, CANCELLED):
+        return jsonify({"success": False, "job_id": job.id, "status": job.status, "error": job.error}), 410
+    return jsonify({"success": False, "job_id": job.id, "status": job.status, "error": "Job not finished"}), 409
+
+
+@app.route('/jobs/<job_id>/events', methods=['GET'])
+def stream_job(job_id):
+    """Stream job status updates as Server-Sent Events until the job finishes"""
+    job = jobs.get(job_id)
+    if job is None:
+        return jsonify({"success": False, "error": f"Job not found: {job_id}"}), 404
+    
+    def events():
+        version = -1
+        while True:
+            current = job.wait_for_change(version, timeout=15)
+            if current == version and not job.finished:
+                yield ": keep-alive\n\n"
+                continue
+            version = current
+            yield f"data: {json.dumps(job.to_dict())}\n\n"
+            if job.finished:
+                return
+    
+    return Response(events(), mimetype='text/event-stream',
+                    headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+
+@app.route('/jobs/<job_id>', methods=['DELETE'])
+def cancel_job(job_id):
+    """Cancel a queued job or ask a running job to stop"""
+    job = jobs.cancel(job_id)
+    if job is None:
+        return jsonify({"success": False, "error": f"Job not found: {job_id}"}), 404
+    return jsonify({"success": True, **job.to_dict()}), 200
+
+
 @app.route('/define-slots', methods=['POST'])
 def define_slots():
     """
@@ -127,7 +558,8 @@ def define_slots():
     Expected JSON:
     {
         "image_path": "path/to/image.jpg",
-        "output_path": "path/to/save/slots.json" (optional)
+        "output_path": "path/to/save/slots.json" (optional),
+        "async": false (optional, run as a job and return 202 with job_id)
     }
     
     Returns:
@@ -155,22 +587,16 @@ def define_slots():
         if not os.path.exists(image_path):
             return jsonify({"success": False, "error": f"Image file not found: {image_path}"}), 404
         
+        output_path = data.get('output_path')
+        if data.get('async'):
+            return submit_job('define-slots', {"image_path": image_path, "output_path": output_path})
+        
         # Run slot selector
-        selector = SlotSelector(image_path)
-        slots = selector.run()
+        slots = run_slot_selector(image_path, output_path)
         
         if not slots:
             return jsonify({"success": False, "error": "No slots defined"}), 400
         
-        # Save to file if output_path provided
-        output_path = data.get('output_path')
-        if output_path:
-            with open(output_path, 'w') as f:
-                json.dump({
-                    "image_path": image_path,
-                    "slots": slots
-                }, f, indent=2)
-        
         return jsonify({
             "success": True,
             "slots": slots
@@ -190,7 +616,9 @@ def detect_occupancy():
     
     Expected JSON:
     {
-        "image_path": "path/to/current/image.jpg" or "path/to/video.mp4",
+        "image_path": "path/to/current/image.jpg" or "path/to/video.mp4"
+                      or "ring://<source_id>" (frame from a running capture)
+                      or "replay://<recording>" (frame of a recording, see video_frame),
         "slots": [
             {
                 "slot_id": "S1",
@@ -202,12 +630,35 @@ def detect_occupancy():
             ...
         ],
         "threshold": 0.15 (optional, overrides default),
-        "video_frame": 0 (optional, for videos: frame number, -1 for last frame)
+        "video_frame": 0 (optional, for videos and recordings: frame number, -1 for last frame),
+        "decode_scale": 1 (optional, 1/2/4/8 reduced-size decode),
+        "lot_id": "lot-1" (optional, appends the results to the lot's history),
+        "engine": "adaptive" | "reference" | "cascade" (optional, detection method;
+                  the reference engine keeps per-lot state and requires lot_id),
+        "engine_options": {"margin": 0.5} (optional, engine parameters, see engines.py),
+        "calibration": {"camera_matrix": [[...]], "dist_coeffs": [...],
+                        "image_width": 1920, "image_height": 1080} (optional, lens
+                       calibration; defaults to the one stored for image_path,
+                       see POST /calibrations),
+        "since": "<version>" (optional, with lot_id: only return slots whose
+                 status changed since that version; alias "if_version"),
+        "layout": "records" | "columnar" (optional, see encoding.py)
     }
     
+    Send Accept: application/msgpack for a MessagePack response.
+    
     Returns:
     {
         "success": true,
+        "version": "<version>" (with lot_id, changes only when a status changes),
+        "delta": true (results only contain changed slots),
+        "changed": true,
+        "quality": {"ok": true, "reasons": [], "brightness": 115.6, "contrast": 21.8,
+                    "sharpness": 2190.8, "frame_diff": null} (with lot_id),
+        "stale": true (with lot_id: the frame failed the quality checks and
+                       results are the lot's last good results, from "stale_since";
+                       without earlier good results "stale_since" is null and
+                       "results" is empty - keep the statuses you have),
         "results": [
             {
                 "slot_id": "S1",
@@ -216,75 +667,793 @@ def detect_occupancy():
                 "occupancy_ratio": 0.25,
                 "white_pixel_count": 1234,
                 "total_area": 5000,
-                "confidence": 0.8
+                "confidence": 0.8,
+                "stage": "coarse" | "fine" (cascade engine: stage that decided the slot)
             },
             ...
-        ]
+        ],
+        "decode": {"source": "file", "color": "grayscale", "scale": 1, "direct": true}
     }
     """
     try:
-        data = request.json
+        response, code = run_detection(request.json, request.headers.get('If-None-Match'))
+    except Exception as e:
+        return jsonify({
+            "success": False,
+            "error": str(e)
+        }), 500
+    if not response["success"]:
+        return jsonify(response), code
+    headers = {"ETag": f'"{response["version"]}"'} if "version" in response else None
+    if code == 304:
+        return Response(status=304, headers=headers)
+    return detection_response(response, headers)
+
+
+def run_detection(data: Dict[str, Any], if_none_match: str = None) -> Tuple[Dict[str, Any], int]:
+    """
+    Detection behind POST /detect-occupancy, independent of the transport
+    (also served over the Unix socket, see socket_server.py).
+    
+    Args:
+        data: Request fields (see detect_occupancy)
+        if_none_match: Version the client already has (If-None-Match)
+        
+    Returns:
+        (response, status): errors are {"success": False, "error"} with
+        400/404/503, 304 when the lot is unchanged since if_none_match
+    """
+    image_path = data.get('image_path')
+    slots = data.get('slots')
+    threshold = data.get('threshold')
+    
+    if not image_path:
+        return {"success": False, "error": "image_path is required"}, 400
+    
+    if not slots:
+        return {"success": False, "error": "slots array is required"}, 400
+    
+    if (data.get('since') or data.get('if_version')) and not data.get('lot_id'):
+        return {"success": False, "error": "since/if_version requires lot_id"}, 400
+    
+    is_stream = image_path.startswith(("camera://", "ring://", "replay://")) or \
+        (len(image_path) == 1 and image_path.isdigit())
+    if not is_stream and not os.path.exists(image_path):
+        return {"success": False, "error": f"Image/Video file not found: {image_path}"}, 404
+    
+    from utils import to_grayscale, load_image, get_decode_flags
+    
+    try:
+        active = detector_for(data.get('lot_id'), data.get('engine'), threshold,
+                              data.get('engine_options'))
+        calibration = calibration_for(image_path, data)
+        decode_scale = int(data.get('decode_scale', active.decode_scale))
+        get_decode_flags(True, decode_scale)  # rejects unsupported scales
+    except ValueError as e:
+        return {"success": False, "error": str(e)}, 400
+    
+    # Handle video frame extraction if needed
+    video_frame = data.get('video_frame', 0)
+    
+    from undistort import undistort
+    
+    # Requests for a lot are quality-checked before analysis (frame_quality.py)
+    lot_id = data.get('lot_id')
+    gate = quality_gate.get() if lot_id else None
+    quality = None
+    img = None
+    results = None
+    
+    # Frame from a running capture process (shared-memory ring)
+    if image_path.startswith("ring://"):
+        ring = captures.get_ring(image_path[len("ring://"):])
+        if ring is None:
+            return {"success": False, "error": f"No capture running for {image_path}"}, 404
+        latest = ring.read_latest(copy=False) if gate is not None else None
+        if latest is not None:
+            quality = gate.check(str(lot_id), latest[2], live=True)
+        if quality is None or quality["ok"]:
+            # The archive gets the analyzed frame, not whatever is newest later
+            keep_frame = bool(lot_id) and archive.get() is not None
+            results, archive_frame = detect_from_ring(ring, slots, decode_scale, active, calibration,
+                                                      keep_frame=keep_frame)
+            archive_scale = decode_scale
+            if results is None:
+                return {"success": False, "error": f"No frame captured yet for {image_path}"}, 503
+        decode = active.decode_info(decode_scale, source="ring")
+    # Check if it's a camera source
+    elif image_path.startswith("camera://") or (len(image_path) == 1 and image_path.isdigit()):
+        # Capture frame from camera
+        from camera_manager import CameraManager
+        frame = CameraManager.capture_frame_from_camera(image_path)
+        if frame is None:
+            return {"success": False, "error": f"Could not capture frame from camera: {image_path}"}, 400
+        
+        # Detect on the captured frame directly (no JPEG round trip)
+        img = to_grayscale(frame, decode_scale)
+        decode = active.decode_info(decode_scale, source="frame")
+    # Frame of a stream recording (frame_recording.py), video_frame selects it
+    elif image_path.startswith("replay://"):
+        from camera_manager import CameraManager
+        frame = CameraManager.capture_frame_from_replay(image_path, video_frame)
+        if frame is None:
+            return {"success": False, "error": f"Recording not found or empty: {image_path}"}, 404
+        img = to_grayscale(frame, decode_scale)
+        decode = active.decode_info(decode_scale, source="frame")
+    # Check if it's a video file
+    elif os.path.splitext(image_path.lower())[1] in VIDEO_EXTENSIONS:
+        # Extract frame from video
+        from utils import extract_frame_from_video
+        frame = extract_frame_from_video(image_path, video_frame)
+        img = to_grayscale(frame, decode_scale)
+        decode = active.decode_info(decode_scale, source="frame")
+    else:
+        # Regular image file, decoded straight to grayscale
+        img = load_image(image_path, grayscale=True, scale=decode_scale)
+        decode = active.decode_info(decode_scale, source="file")
+    
+    if img is not None:
+        if gate is not None:
+            quality = gate.check(str(lot_id), img, live=is_stream)
+        # Lens correction after the quality checks (it blanks pixels outside the slots)
+        img = undistort(img, calibration, slots, decode_scale)
+        archive_frame, archive_scale = img, decode_scale
+        if quality is None or quality["ok"]:
+            results = active.detect_occupancy_frame(img, slots, scale=decode_scale)
+    
+    response = {"success": True, "results": results, "decode": decode}
+    stale = quality is not None and not quality["ok"]
+    if quality is not None:
+        response["quality"] = quality
+    if stale:
+        # Unusable frame: serve the lot's last good results instead
+        last = gate.last_good(str(lot_id))
+        if last is None:
+            # Nothing to serve: no per-slot statuses rather than placeholder ones
+            response.update(stale=True, stale_since=None, results=[])
+            return response, 200
+        response.update(stale=True, stale_since=last["timestamp"], results=last["results"])
+        results = last["results"]
+    elif gate is not None:
+        gate.remember(str(lot_id), results)
+    
+    if lot_id:
+        if not stale:
+            history.append(str(lot_id), results)
+            if archive.get() is not None:
+                archive.record(str(lot_id), slots, results, archive_frame, archive_scale)
+        since = data.get('since') or data.get('if_version') or if_none_match
+        response.update(versions.update(str(lot_id), results, since))
+        if response["delta"] and not response["changed"] and if_none_match:
+            return response, 304
+    
+    return response, 200
+
+
+def detection_response(response: Dict[str, Any], headers: Dict[str, str] = None):
+    """
+    Encode a successful detection response as negotiated by the client:
+    "layout": "columnar" (body field or query parameter) for parallel
+    arrays, Accept: application/msgpack for MessagePack.
+    """
+    from encoding import encode_results, negotiate
+    
+    data = request.get_json(silent=True) or {}
+    layout = data.get('layout') or request.args.get('layout', 'records')
+    if layout not in ('records', 'columnar'):
+        return jsonify({"success": False, "error": f"Unknown layout: {layout}"}), 400
+    body, mimetype = encode_results(response, layout, negotiate(request.headers.get('Accept')))
+    return Response(body, status=200, mimetype=mimetype, headers=headers)
+
+
+@app.route('/history/<lot_id>', methods=['GET'])
+def lot_history(lot_id):
+    """
+    Occupancy history of a lot over a time range
+    
+    Query parameters (all optional):
+        start, end: Unix timestamps (end exclusive)
+        slot: Slot number
+        tz_offset_minutes: Offset from UTC for the hourly histogram
+        records: "1" to include the raw records (columnar)
+        limit: Maximum number of raw records returned (default 10000, newest kept)
+    
+    Returns:
+    {
+        "success": true,
+        "summary": {
+            "records": 1200,
+            "occupancy_percent": 61.5,
+            "slots": [{"slot_number": 1, "occupancy_percent": 72.0}, ...],
+            "dwell": {"count": 14, "open": 2, "mean": 5400.0, "median": ..., "p90": ..., "max": ...},
+            "hourly_occupancy_percent": [null, ..., 80.2, ...]
+        },
+        "records": {"ts": [...], "slot": [...], "ratio": [...], "status": [...]}
+    }
+    """
+    try:
+        args = request.args
+        start = args.get('start', type=float)
+        end = args.get('end', type=float)
+        slot = args.get('slot', type=int)
+        
+        summary = history.aggregate(lot_id, start, end, slot,
+                                    tz_offset_minutes=args.get('tz_offset_minutes', 0, type=int))
+        response = {"success": True, "summary": summary}
+        
+        if args.get('records') in ('1', 'true'):
+            limit = args.get('limit', 10000, type=int)
+            records = history.query(lot_id, start, end, slot)
+            response["records"] = {name: column[-limit:].tolist() for name, column in records.items()}
+        
+        return jsonify(response), 200
+    except ValueError as e:
+        return jsonify({"success": False, "error": str(e)}), 400
+    except Exception as e:
+        return jsonify({
+            "success": False,
+            "error": str(e)
+        }), 500
+
+
+class FrameUnavailable(Exception):
+    """A capture ring no longer holds a readable frame (served as 503)"""
+
+
+def frame_source(image_path: str, video_frame: int = 0):
+    """
+    Identify a frame without decoding it.
+    
+    Returns:
+        (frame_id, loader) - loader(grayscale, scale) decodes the frame,
+        reduced by scale whatever the source. Camera frames have no stable
+        identity and get a unique id.
+        
+    Raises:
+        FileNotFoundError: If the source does not exist or has no frame
+    """
+    from utils import load_image, extract_frame_from_video, to_grayscale, downscale
+    
+    def convert(frame, grayscale, scale):
+        return to_grayscale(frame, scale) if grayscale else downscale(frame, scale)
+    
+    if image_path.startswith("ring://"):
+        ring = captures.get_ring(image_path[len("ring://"):])
+        if ring is None:
+            raise FileNotFoundError(f"No capture running for {image_path}")
+        seq = ring.latest_seq
+        if seq < 0:
+            raise FileNotFoundError(f"No frame captured yet for {image_path}")
+        
+        def load_ring(grayscale, scale):
+            frame = ring.read(seq, copy=True) or ring.read_latest(copy=True)
+            if frame is None:
+                raise FrameUnavailable(f"No frame available for {image_path}")
+            return convert(frame[2], grayscale, scale)
+        return f"ring:{ring.name}:{seq}", load_ring
+    
+    if image_path.startswith("camera://") or (len(image_path) == 1 and image_path.isdigit()):
+        from camera_manager import CameraManager
+        frame = CameraManager.capture_frame_from_camera(image_path)
+        if frame is None:
+            raise FileNotFoundError(f"Could not capture frame from camera: {image_path}")
+        return f"camera:{uuid.uuid4().hex}", lambda grayscale, scale: convert(frame, grayscale, scale)
+    
+    if image_path.startswith("replay://"):
+        from camera_manager import CameraManager
+        from frame_recording import parse_replay_source
+        path = parse_replay_source(image_path)["path"]
+        frame = CameraManager.capture_frame_from_replay(image_path, video_frame)
+        if frame is None:
+            raise FileNotFoundError(f"Recording not found or empty: {image_path}")
+        stat = os.stat(path)
+        return (f"replay:{os.path.abspath(path)}:{stat.st_mtime_ns}:{video_frame}",
+                lambda grayscale, scale: convert(frame, grayscale, scale))
+    
+    if not os.path.exists(image_path):
+        raise FileNotFoundError(f"Image/Video file not found: {image_path}")
+    stat = os.stat(image_path)
+    if os.path.splitext(image_path.lower())[1] in VIDEO_EXTENSIONS:
+        def load_video(grayscale, scale):
+            return convert(extract_frame_from_video(image_path, video_frame), grayscale, scale)
+        return f"video:{os.path.abspath(image_path)}:{stat.st_mtime_ns}:{video_frame}", load_video
+    
+    return (f"file:{os.path.abspath(image_path)}:{stat.st_mtime_ns}:{stat.st_size}",
+            lambda grayscale, scale: load_image(image_path, grayscale=grayscale, scale=scale))
+
+
+@app.route('/annotated-frame', methods=['POST'])
+def annotated_frame():
+    """
+    Render the lot image with slot polygons, IDs and status colors as JPEG
+    
+    Expected JSON:
+    {
+        "image_path": image/video path, "camera://0", "ring://<source_id>" or "replay://<recording>",
+        "slots": [...],
+        "results": [...] (optional, detection results to draw; detected if omitted),
+        "threshold": 0.15 (optional),
+        "video_frame": 0 (optional),
+        "calibration": {...} (optional, see /detect-occupancy; defaults to the stored one),
+        "width": 960 (optional, output width),
+        "quality": 80 (optional, JPEG quality)
+    }
+    
+    Returns:
+        image/jpeg. Renders are cached by frame id + result hash, so repeated
+        requests for the same view are served without re-rendering.
+        Honors If-None-Match with the returned ETag.
+    """
+    try:
+        from annotated_frames import render_annotated, encode_jpeg, result_hash, layout_hash
+        
+        data = request.json or {}
         image_path = data.get('image_path')
         slots = data.get('slots')
+        if not image_path or not slots:
+            return jsonify({"success": False, "error": "image_path and slots are required"}), 400
+        
+        width = data.get('width')
+        width = int(width) if width else None
+        quality = min(max(int(data.get('quality', 80)), 1), 100)
         threshold = data.get('threshold')
         
-        if not image_path:
-            return jsonify({"success": False, "error": "image_path is required"}), 400
+        try:
+            frame_id, load_frame = frame_source(image_path, data.get('video_frame', 0))
+        except FileNotFoundError as e:
+            return jsonify({"success": False, "error": str(e)}), 404
+        try:
+            calibration = calibration_for(image_path, data)
+        except ValueError as e:
+            return jsonify({"success": False, "error": str(e)}), 400
+        if calibration is not None:
+            from undistort import undistort
+            load_raw = load_frame
+            frame_id = f"{frame_id}:{calibration.key}"
+            
+            def load_frame(grayscale, scale):
+                # Full frame: the view shows the whole lot, not only the slots
+                return undistort(load_raw(grayscale, scale), calibration)
+        layout = layout_hash(slots)
         
-        if not slots:
-            return jsonify({"success": False, "error": "slots array is required"}), 400
+        results = data.get('results')
+        if results is None:
+            view_detector = detector_for(threshold=threshold)
+            
+            def detect():
+                return view_detector.detect_occupancy_frame(load_frame(True, 1), slots)
+            results, _ = detection_cache.get_or_create(
+                (frame_id, layout, threshold), detect, size=lambda r: 256 * len(r))
         
-        if not os.path.exists(image_path):
-            return jsonify({"success": False, "error": f"Image/Video file not found: {image_path}"}), 404
+        # Decode at reduced size when the output is much smaller than the frame
+        scale = 1
+        source_width = slots[0].get('image_width')
+        if width and source_width:
+            while scale < 8 and source_width / (scale * 2) >= width:
+                scale *= 2
         
-        # Override threshold if provided
-        if threshold is not None:
-            detector.threshold = float(threshold)
+        key = (frame_id, layout, result_hash(results), width, quality)
+        etag = '"' + hashlib.sha1(repr(key).encode()).hexdigest()[:20] + '"'
+        if request.headers.get('If-None-Match') == etag:
+            return Response(status=304, headers={"ETag": etag})
         
-        # Handle video frame extraction if needed
-        video_frame = data.get('video_frame', 0)
+        jpeg, hit = render_cache.get_or_create(
+            key,
+            lambda: encode_jpeg(render_annotated(load_frame(False, scale), slots, results, width, scale), quality)
+        )
+        return Response(jpeg, mimetype='image/jpeg', headers={
+            "ETag": etag,
+            "X-Cache": "HIT" if hit else "MISS",
+            "Cache-Control": "no-cache"
+        })
+    except FrameUnavailable as e:
+        return jsonify({"success": False, "error": str(e)}), 503
+    except Exception as e:
+        return jsonify({
+            "success": False,
+            "error": str(e)
+        }), 500
+
+
+def detect_from_ring(ring, slots, decode_scale: int = 1, ring_detector=None, calibration=None,
+                     keep_frame: bool = False):
+    """
+    Run detection on the newest frame of a capture ring, reading it in place.
+    
+    If the capture process overwrites the frame while it is being analyzed,
+    detection is repeated on a private copy of a newer frame.
+    
+    Args:
+        keep_frame: Also return the analyzed (reduced, undistorted) frame as
+            a private array, e.g. for the frame archive
+    
+    Returns:
+        (results, frame) - frame is None unless keep_frame is set; results
+        is None if no frame has been captured yet
+    """
+    import numpy as np
+    from utils import to_grayscale
+    from undistort import undistort
+    ring_detector = ring_detector or detector
+    for copy in (False, False, True):
+        latest = ring.read_latest(copy=copy)
+        if latest is None:
+            return None, None
+        seq, _, frame = latest
+        img = to_grayscale(frame, decode_scale) if decode_scale > 1 else frame
+        img = undistort(img, calibration, slots, decode_scale)
+        results = ring_detector.detect_occupancy_frame(img, slots, scale=decode_scale)
+        kept = None
+        if keep_frame:
+            # Copied before the is_current check, which then vouches for the copy
+            kept = img.copy() if not copy and np.shares_memory(img, frame) else img
+        if copy or ring.is_current(seq):
+            return results, kept
+    return results, kept
+
+
+@app.route('/captures', methods=['GET'])
+def list_captures():
+    """List running capture processes and their frame rings"""
+    return jsonify({"success": True, "captures": captures.list()}), 200
+
+
+@app.route('/captures', methods=['POST'])
+def start_capture():
+    """
+    Start a capture process that writes frames into a shared-memory ring
+    
+    Expected JSON:
+    {
+        "source": "camera://0" or stream URL or video file path,
+        "source_id": "lot-1-cam" (optional, defaults to a generated id),
+        "width": 1920, "height": 1080 (optional, probed from the source),
+        "grayscale": false (optional, store single-channel frames),
+        "capacity": 4 (optional, frames kept in the ring),
+        "max_fps": 10 (optional, cap on capture rate),
+        "calibration": {...} (optional, lens calibration of the camera, see
+                       /detect-occupancy; defaults to the one stored for source)
+    }
+    
+    Detection reads from it with "image_path": "ring://<source_id>".
+    """
+    try:
+        data = request.json or {}
+        source = data.get('source')
+        if not source:
+            return jsonify({"success": False, "error": "source is required"}), 400
         
-        # Check if it's a camera source
-        if image_path.startswith("camera://") or (len(image_path) == 1 and image_path.isdigit()):
-            # Capture frame from camera
-            frame = CameraManager.capture_frame_from_camera(image_path)
-            if frame is None:
-                return jsonify({"success": False, "error": f"Could not capture frame from camera: {image_path}"}), 400
-            
-            # Save as temp file for detection
-            temp_file = tempfile.NamedTemporaryFile(suffix='.jpg', delete=False)
-            temp_path = temp_file.name
-            temp_file.close()
-            cv2.imwrite(temp_path, frame)
-            try:
-                results = detector.detect_occupancy(temp_path, slots)
-            finally:
-                if os.path.exists(temp_path):
-                    os.remove(temp_path)
-        # Check if it's a video file
-        elif os.path.splitext(image_path.lower())[1] in ['.mp4', '.avi', '.mov', '.mkv', '.flv', '.wmv', '.webm']:
-            # Extract frame from video
-            from utils import extract_frame_from_video
-            frame = extract_frame_from_video(image_path, video_frame)
-            # Save as temp file for detection
-            temp_file = tempfile.NamedTemporaryFile(suffix='.jpg', delete=False)
-            temp_path = temp_file.name
-            temp_file.close()
-            cv2.imwrite(temp_path, frame)
+        source_id = data.get('source_id') or uuid.uuid4().hex[:8]
+        capture = captures.start(
+            source_id,
+            source,
+            width=data.get('width'),
+            height=data.get('height'),
+            grayscale=bool(data.get('grayscale', False)),
+            capacity=int(data.get('capacity', 4)),
+            max_fps=data.get('max_fps'),
+            calibration=calibration_for(source, data)
+        )
+        return jsonify({"success": True, "capture": capture}), 201
+    except MemoryBudgetExceeded as e:
+        return jsonify({"success": False, "error": str(e)}), 503
+    except ValueError as e:
+        return jsonify({"success": False, "error": str(e)}), 400
+    except Exception as e:
+        return jsonify({
+            "success": False,
+            "error": str(e)
+        }), 500
+
+
+@app.route('/captures/<source_id>', methods=['DELETE'])
+def stop_capture(source_id):
+    """Stop a capture process and release its ring"""
+    if not captures.stop(source_id):
+        return jsonify({"success": False, "error": f"No capture running for {source_id}"}), 404
+    return jsonify({"success": True}), 200
+
+
+@app.route('/captures/<source_id>/preview', methods=['GET'])
+def preview_capture(source_id):
+    """
+    Live MJPEG preview of a running capture (multipart/x-mixed-replace,
+    usable as an <img> source). Frames are downsized and encoded once at
+    OPENCV_PREVIEW_FPS and shared by all viewers; slow viewers skip frames.
+    """
+    from preview_stream import MIMETYPE, limit_send_buffer
+    stream = previews.stream(source_id)
+    if stream is None:
+        return jsonify({"success": False, "error": f"No capture running for {source_id}"}), 404
+    limit_send_buffer(request.environ.get('werkzeug.socket'))
+    return Response(stream.frames(), mimetype=MIMETYPE,
+                    headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+
+@app.route('/previews', methods=['GET'])
+def list_previews():
+    """Preview streams with their viewers and frames encoded, sent and skipped"""
+    return jsonify({"success": True, "previews": previews.list()}), 200
+
+
+@app.route('/recordings', methods=['GET'])
+def list_recordings():
+    """Recordings in OPENCV_RECORDINGS_DIR with their geometry and duration"""
+    from frame_recording import Recording
+    recordings = []
+    if os.path.isdir(RECORDINGS_DIR):
+        for name in sorted(os.listdir(RECORDINGS_DIR)):
+            path = os.path.join(RECORDINGS_DIR, name)
             try:
-                results = detector.detect_occupancy(temp_path, slots)
-            finally:
-                if os.path.exists(temp_path):
-                    os.remove(temp_path)
-        else:
-            # Regular image file
-            results = detector.detect_occupancy(image_path, slots)
+                recordings.append({**Recording(path).info(), "source": f"replay://{os.path.abspath(path)}"})
+            except ValueError:
+                continue
+    return jsonify({"success": True, "recordings": recordings}), 200
+
+
+@app.route('/calibrations', methods=['GET'])
+def list_calibrations():
+    """Stored lens calibrations by source"""
+    return jsonify({"success": True, "calibrations": calibrations.list()}), 200
+
+
+@app.route('/calibrations', methods=['POST'])
+def set_calibration():
+    """
+    Store the lens calibration of a source (replaces an existing one)
+    
+    Expected JSON:
+    {
+        "source": "camera://0", stream URL, "ring://<source_id>" or image/video path,
+        "camera_matrix": [[fx, 0, cx], [0, fy, cy], [0, 0, 1]],
+        "dist_coeffs": [k1, k2, p1, p2, k3],
+        "image_width": 1920, "image_height": 1080 (size the calibration was made at)
+    }
+    
+    Requests for the source are undistorted before detection; slots of a
+    calibrated source must be defined on undistorted frames.
+    """
+    try:
+        data = request.json or {}
+        source = data.get('source')
+        if not source:
+            return jsonify({"success": False, "error": "source is required"}), 400
+        calibration = calibrations.set(source, data)
+        return jsonify({"success": True, "source": source, "calibration": calibration.to_dict()}), 201
+    except ValueError as e:
+        return jsonify({"success": False, "error": str(e)}), 400
+    except Exception as e:
+        return jsonify({
+            "success": False,
+            "error": str(e)
+        }), 500
+
+
+@app.route('/calibrations', methods=['DELETE'])
+def delete_calibration():
+    """Remove the calibration of a source (?source=...)"""
+    source = request.args.get('source') or (request.get_json(silent=True) or {}).get('source')
+    if not source:
+        return jsonify({"success": False, "error": "source is required"}), 400
+    if not calibrations.delete(source):
+        return jsonify({"success": False, "error": f"No calibration stored for {source}"}), 404
+    return jsonify({"success": True}), 200
+
+
+@app.route('/scheduler/sources', methods=['POST'])
+def register_scheduled_source():
+    """
+    Register a lot for adaptive background detection
+    
+    Expected JSON:
+    {
+        "lot_id": "lot-1",
+        "source": "ring://<source_id>", "camera://0", stream URL or image file path,
+        "mode": "slots" | "gate" (optional, default "slots"),
+        "slots": [...] (slots mode),
+        "gate": {                                   (gate mode: count entrance crossings)
+            "line": [[0.2, 0.6], [0.8, 0.6]], "image_width": 1920, "image_height": 1080,
+            "capacity": 120, "initial_count": 0, "entry_side": "right",
+            "band": 16, "lanes": 1 (optional, see line_counter.py)
+        },
+        "max_fps": 15 (optional, gate mode: capture rate of a started capture),
+        "min_interval": 2 (optional, seconds between detections while there is motion),
+        "max_interval": 60 (optional, upper bound for idle scenes),
+        "decode_scale": 1 (optional),
+        "threshold": 0.15 (optional),
+        "engine": "adaptive" (optional, see /detect-occupancy),
+        "engine_options": {} (optional, see /detect-occupancy),
+        "calibration": {...} (optional, see /detect-occupancy; defaults to the stored one)
+    }
+    
+    The newest result is served by GET /lots/<lot_id>/latest. Gate-mode lots
+    follow every frame of a live source or video but only read a thin band
+    across the line; their result is one "gate" entry with the running count.
+    """
+    try:
+        data = request.json or {}
+        lot_id, source, slots = data.get('lot_id'), data.get('source'), data.get('slots')
+        if data.get('mode', 'slots') == 'gate':
+            from line_counter import create_counter
+            if not lot_id or not source or not data.get('gate'):
+                return jsonify({"success": False, "error": "lot_id, source and gate are required"}), 400
+            max_fps = data.get('max_fps')
+            entry = scheduler.register_gate(str(lot_id), source, create_counter(data['gate']),
+                                            max_fps=float(max_fps) if max_fps else None)
+            return jsonify({"success": True, "source": entry}), 201
+        if not lot_id or not source or not slots:
+            return jsonify({"success": False, "error": "lot_id, source and slots are required"}), 400
         
+        threshold = data.get('threshold')
+        engine = data.get('engine')
+        source_detector = detector_for(lot_id, engine, threshold, data.get('engine_options'))
+        decode_scale = int(data.get('decode_scale', detector.decode_scale))
+        from utils import get_decode_flags
+        get_decode_flags(True, decode_scale)  # rejects unsupported scales
+        entry = scheduler.register(
+            str(lot_id), source, slots,
+            min_interval=float(data.get('min_interval', 2.0)),
+            max_interval=float(data.get('max_interval', 60.0)),
+            decode_scale=decode_scale,
+            detector=source_detector,
+            calibration=calibration_for(source, data)
+        )
+        return jsonify({"success": True, "source": entry}), 201
+    except ValueError as e:
+        return jsonify({"success": False, "error": str(e)}), 400
+    except Exception as e:
         return jsonify({
-            "success": True,
-            "results": results
-        }), 200
+            "success": False,
+            "error": str(e)
+        }), 500
+
+
+@app.route('/scheduler/sources', methods=['GET'])
+def list_scheduled_sources():
+    """Registered lots with their current interval, motion and CPU use"""
+    if not scheduler.loaded:
+        return jsonify({"success": True, "sources": [], "stats": None}), 200
+    return jsonify({"success": True, "sources": scheduler.sources(), "stats": scheduler.stats()}), 200
+
+
+@app.route('/scheduler/sources/<lot_id>', methods=['DELETE'])
+def unregister_scheduled_source(lot_id):
+    """Stop background detection for a lot"""
+    if not scheduler.loaded or not scheduler.unregister(lot_id):
+        return jsonify({"success": False, "error": f"Lot not scheduled: {lot_id}"}), 404
+    return jsonify({"success": True}), 200
+
+
+@app.route('/lots/<lot_id>/count', methods=['POST'])
+def reset_lot_count(lot_id):
+    """
+    Set the vehicle count of a gate-counted lot (e.g. after a manual check)
+    
+    Expected JSON:
+    {"count": 42}
+    """
+    data = request.json or {}
+    try:
+        count = int(data['count'])
+    except (KeyError, TypeError, ValueError):
+        return jsonify({"success": False, "error": "count (integer) is required"}), 400
+    if not scheduler.loaded or not scheduler.reset_gate(lot_id, count):
+        return jsonify({"success": False, "error": f"Lot not gate-counted: {lot_id}"}), 404
+    return jsonify({"success": True}), 200
+
+
+@app.route('/lots/<lot_id>/latest', methods=['GET'])
+def latest_lot_result(lot_id):
+    """
+    Latest scheduled detection of a lot (404 before the first one). It is
+    marked "stale" while the source's frames fail the quality checks.
+    Gate-counted lots return "mode": "gate", the counter totals in "gate"
+    and a single "gate" result whose version changes with the count.
+    
+    Query parameters:
+        since: Version token; only slots changed since then are returned
+               (304 when unchanged and sent as If-None-Match)
+    """
+    latest = scheduler.latest(lot_id) if scheduler.loaded else None
+    if latest is None:
+        return jsonify({"success": False, "error": f"No result for lot: {lot_id}"}), 404
+    if_none_match = request.headers.get('If-None-Match')
+    response = {"success": True, **latest}
+    response.update(versions.delta(lot_id, latest["results"], request.args.get('since') or if_none_match))
+    etag = f'"{response["version"]}"'
+    if response["delta"] and not response["changed"] and if_none_match:
+        return Response(status=304, headers={"ETag": etag})
+    return detection_response(response, {"ETag": etag})
+
+
+@app.route('/lots/<lot_id>/archive', methods=['GET'])
+def lot_archive(lot_id):
+    """
+    Archived status changes of a lot (requires OPENCV_ARCHIVE)
+    
+    Query parameters (all optional):
+        start, end: Unix timestamps (end exclusive)
+        slot: Slot number
+    
+    Returns:
+    {
+        "success": true,
+        "mode": "crops",
+        "records": [
+            {"ts": 1700000000.5, "slot_number": 3, "status": "occupied", "previous": "vacant",
+             "kind": "crop", "offset": 18342, "length": 5121, "x": 410, "y": 220},
+            ...
+        ]
+    }
+    
+    Fetch an image with GET /lots/<lot_id>/archive/<offset>.
+    """
+    try:
+        if archive.get() is None:
+            return jsonify({"success": False, "error": "Frame archive is disabled (OPENCV_ARCHIVE)"}), 404
+        args = request.args
+        records = archive.query(lot_id, args.get('start', type=float), args.get('end', type=float),
+                                args.get('slot', type=int))
+        return jsonify({"success": True, "mode": archive.mode, "records": records}), 200
+    except ValueError as e:
+        return jsonify({"success": False, "error": str(e)}), 400
+    except Exception as e:
+        return jsonify({
+            "success": False,
+            "error": str(e)
+        }), 500
+
+
+@app.route('/lots/<lot_id>/archive/<int:offset>', methods=['GET'])
+def lot_archive_image(lot_id, offset):
+    """Archived JPEG at an offset listed by GET /lots/<lot_id>/archive"""
+    try:
+        if archive.get() is None:
+            return jsonify({"success": False, "error": "Frame archive is disabled (OPENCV_ARCHIVE)"}), 404
+        data = archive.read(lot_id, offset)
+        if data is None:
+            return jsonify({"success": False, "error": f"No archived image at offset {offset}"}), 404
+        return Response(data, mimetype='image/jpeg', headers={"Cache-Control": "max-age=31536000, immutable"})
+    except ValueError as e:
+        return jsonify({"success": False, "error": str(e)}), 400
+    except Exception as e:
+        return jsonify({
+            "success": False,
+            "error": str(e)
+        }), 500
+
+
+@app.route('/lots/<lot_id>/learn', methods=['POST'])
+def learn_lot_reference(lot_id):
+    """
+    Teach a lot's engine what its vacant slots look like
+    
+    Expected JSON:
+    {
+        "image_path": "path/to/image.jpg" (slots listed in "vacant" are empty in it),
+        "slots": [...],
+        "vacant": ["S1", "S4"] (optional, default: all slots),
+        "engine": "reference" (optional),
+        "calibration": {...} (optional, see /detect-occupancy; defaults to the stored one)
+    }
+    
+    Repeated calls blend new frames into the reference (running average).
+    """
+    try:
+        data = request.json or {}
+        image_path, slots = data.get('image_path'), data.get('slots')
+        if not image_path or not slots:
+            return jsonify({"success": False, "error": "image_path and slots are required"}), 400
+        if not os.path.exists(image_path):
+            return jsonify({"success": False, "error": f"Image file not found: {image_path}"}), 404
         
+        lot_detector = detector_for(lot_id, data.get('engine', 'reference'))
+        updated = lot_detector.learn(image_path, slots, data.get('vacant'),
+                                     decode_scale=int(data.get('decode_scale', lot_detector.decode_scale)),
+                                     calibration=calibration_for(image_path, data))
+        return jsonify({"success": True, "updated_slots": updated, "engine": lot_detector.engine.info()}), 200
+    except ValueError as e:
+        return jsonify({"success": False, "error": str(e)}), 400
     except Exception as e:
         return jsonify({
             "success": False,
@@ -327,10 +1496,7 @@ def detect_single_slot():
         if not all([image_path, slot_coordinates, image_width, image_height]):
             return jsonify({"success": False, "error": "Missing required fields"}), 400
         
-        if threshold is not None:
-            detector.threshold = float(threshold)
-        
-        result = detector.detect_single_slot(
+        result = detector_for(threshold=threshold).detect_single_slot(
             image_path,
             slot_coordinates,
             image_width,
@@ -352,6 +1518,12 @@ def detect_single_slot():
 if __name__ == "__main__":
     # Run Flask service
     port = int(os.environ.get('OPENCV_SERVICE_PORT', 5001))
-    app.run(host='0.0.0.0', port=port, debug=True)
+    debug = os.environ.get('OPENCV_SERVICE_DEBUG', '1') != '0'
+    # With the debug reloader only the serving child process warms up
+    if not debug or os.environ.get('WERKZEUG_RUN_MAIN') == 'true':
+        warmup.start(detector, captures)
+        if SOCKET_PATH:
+            start_socket_server()
+    app.run(host='0.0.0.0', port=port, debug=debug)
 
 
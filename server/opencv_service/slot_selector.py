@@ -10,50 +10,170 @@ Usage:
 Interactive Controls:
     - Left Click: Add a point to current slot region
     - Right Click: Remove last point from current slot
+    - Mouse Wheel / '+' '-': Zoom in / out around the cursor
+    - Middle Drag / 'i' 'j' 'k' 'l': Pan the view
+    - '0' Key: Fit the whole image in the window
     - 'n' Key: Finish current slot and start new one
+    - 'u' Key: Remove the last completed slot
     - 's' Key: Save all slots and exit
     - 'q' Key: Quit without saving
+
+Completed slots are composited once into a cached layer (redrawn only when
+a slot is added or removed) and only the visible part of that layer is
+rendered, so interaction stays responsive with hundreds of slots on 4K
+reference images.
 """
 import cv2
 import json
 import sys
-from typing import List, Tuple, Dict, Any
+from typing import List, Tuple, Dict, Any, Optional
 import numpy as np
+from utils import draw_slot_polygon
+
+# Largest window shown; bigger images start zoomed out to fit
+MAX_VIEW_SIZE = (1600, 900)
+MAX_ZOOM = 8.0
+PAN_STEP = 0.2  # fraction of the visible region per pan key press
 
 
 class SlotSelector:
     """Interactive slot region selector"""
     
-    def __init__(self, image_path: str):
+    def __init__(self, image_path: str, max_view_size: Tuple[int, int] = MAX_VIEW_SIZE):
         """
         Initialize slot selector
         
         Args:
             image_path: Path to reference parking lot image
+            max_view_size: Maximum (width, height) of the window
         """
         self.image_path = image_path
         self.image = cv2.imread(image_path)
         if self.image is None:
             raise ValueError(f"Could not load image from {image_path}")
         
-        self.display_image = self.image.copy()
         self.slots = []  # List of slot regions
         self.current_slot = []  # Current slot being defined
         self.window_name = "Parking Slot Selector - Left click to add, Right click to remove, 'n' for next, 's' to save"
         
+        # Completed slots composited onto the image; changes only when a slot is added/removed
+        self.slots_layer = self.image.copy()
+        self.layer_version = 0
+        
+        # Viewport: image region [offset, offset + view_size / zoom) shown at view_size
+        img_height, img_width = self.image.shape[:2]
+        self.view_width = min(img_width, max_view_size[0])
+        self.view_height = min(img_height, max_view_size[1])
+        self.min_zoom = min(self.view_width / img_width, self.view_height / img_height, 1.0)
+        self.zoom = self.min_zoom
+        self.offset = (0.0, 0.0)
+        self._base_view = None
+        self._base_key = None
+        self._pan_anchor = None
+        
+        self.display_image = None
+        self.update_display()
+    
+    # ---- viewport ----------------------------------------------------
+    
+    def to_image_coords(self, x: int, y: int) -> Tuple[int, int]:
+        """Convert window coordinates to reference image coordinates"""
+        img_height, img_width = self.image.shape[:2]
+        ix = int(self.offset[0] + x / self.zoom)
+        iy = int(self.offset[1] + y / self.zoom)
+        return min(max(ix, 0), img_width - 1), min(max(iy, 0), img_height - 1)
+    
+    def to_view_coords(self, point: Tuple[int, int]) -> Tuple[int, int]:
+        """Convert reference image coordinates to window coordinates"""
+        return (int(round((point[0] - self.offset[0]) * self.zoom)),
+                int(round((point[1] - self.offset[1]) * self.zoom)))
+    
+    def _clamp_offset(self, ox: float, oy: float) -> Tuple[float, float]:
+        img_height, img_width = self.image.shape[:2]
+        max_x = max(img_width - self.view_width / self.zoom, 0)
+        max_y = max(img_height - self.view_height / self.zoom, 0)
+        return min(max(ox, 0.0), max_x), min(max(oy, 0.0), max_y)
+    
+    def set_zoom(self, zoom: float, anchor: Optional[Tuple[int, int]] = None):
+        """
+        Change zoom, keeping the image point under anchor (window coords) fixed
+        
+        Args:
+            zoom: New zoom factor (clamped to [fit, MAX_ZOOM])
+            anchor: Window point to zoom around (defaults to the center)
+        """
+        if anchor is None:
+            anchor = (self.view_width // 2, self.view_height // 2)
+        image_x = self.offset[0] + anchor[0] / self.zoom
+        image_y = self.offset[1] + anchor[1] / self.zoom
+        self.zoom = min(max(zoom, self.min_zoom), MAX_ZOOM)
+        self.offset = self._clamp_offset(image_x - anchor[0] / self.zoom, image_y - anchor[1] / self.zoom)
+        self.update_display()
+    
+    def pan(self, dx: float, dy: float):
+        """Pan by (dx, dy) window pixels"""
+        self.offset = self._clamp_offset(self.offset[0] + dx / self.zoom, self.offset[1] + dy / self.zoom)
+        self.update_display()
+    
+    def _render_base(self) -> np.ndarray:
+        """Visible part of the slots layer at the current zoom (cached)"""
+        key = (self.layer_version, self.zoom, self.offset)
+        if self._base_key == key:
+            return self._base_view
+        
+        img_height, img_width = self.image.shape[:2]
+        x0, y0 = int(self.offset[0]), int(self.offset[1])
+        x1 = min(img_width, int(np.ceil(self.offset[0] + self.view_width / self.zoom)))
+        y1 = min(img_height, int(np.ceil(self.offset[1] + self.view_height / self.zoom)))
+        crop = self.slots_layer[y0:y1, x0:x1]
+        if self.zoom == 1.0:
+            base = crop.copy()
+        else:
+            size = (max(1, int(round((x1 - x0) * self.zoom))), max(1, int(round((y1 - y0) * self.zoom))))
+            interpolation = cv2.INTER_AREA if self.zoom < 1.0 else cv2.INTER_NEAREST
+            base = cv2.resize(crop, size, interpolation=interpolation)
+        
+        self._base_view, self._base_key = base, key
+        return base
+    
+    # ---- slots layer -------------------------------------------------
+    
+    def _draw_slot(self, img: np.ndarray, index: int, slot: List[Tuple[int, int]]):
+        if len(slot) >= 3:  # Need at least 3 points for a polygon
+            draw_slot_polygon(img, slot, f"S{index + 1}", (0, 255, 0))
+    
+    def add_slot(self, points: List[Tuple[int, int]]):
+        """Complete a slot and composite it onto the cached layer"""
+        self.slots.append(list(points))
+        self._draw_slot(self.slots_layer, len(self.slots) - 1, self.slots[-1])
+        self.layer_version += 1
+    
+    def remove_last_slot(self) -> bool:
+        """Remove the last completed slot (rebuilds the cached layer)"""
+        if not self.slots:
+            return False
+        self.slots.pop()
+        self.slots_layer = self.image.copy()
+        for i, slot in enumerate(self.slots):
+            self._draw_slot(self.slots_layer, i, slot)
+        self.layer_version += 1
+        return True
+    
+    # ---- interaction -------------------------------------------------
+    
     def mouse_callback(self, event, x, y, flags, param):
         """
         Mouse callback for interactive region selection
         
         Args:
             event: OpenCV mouse event
-            x, y: Mouse coordinates
+            x, y: Mouse coordinates (window)
             flags: Event flags
             param: User data
         """
         if event == cv2.EVENT_LBUTTONDOWN:
             # Left click: Add point to current slot
-            self.current_slot.append((x, y))
+            self.current_slot.append(self.to_image_coords(x, y))
             self.update_display()
             
         elif event == cv2.EVENT_RBUTTONDOWN:
@@ -61,32 +181,35 @@ class SlotSelector:
             if self.current_slot:
                 self.current_slot.pop()
                 self.update_display()
+        
+        elif event == cv2.EVENT_MOUSEWHEEL:
+            factor = 1.25 if cv2.getMouseWheelDelta(flags) > 0 else 0.8
+            self.set_zoom(self.zoom * factor, (x, y))
+        
+        elif event == cv2.EVENT_MBUTTONDOWN:
+            self._pan_anchor = (x, y)
+        
+        elif event == cv2.EVENT_MOUSEMOVE and self._pan_anchor is not None:
+            self.pan(self._pan_anchor[0] - x, self._pan_anchor[1] - y)
+            self._pan_anchor = (x, y)
+        
+        elif event == cv2.EVENT_MBUTTONUP:
+            self._pan_anchor = None
     
     def update_display(self):
         """Update the display image with current slots and current selection"""
-        self.display_image = self.image.copy()
+        # Cached view of the completed slots; only the in-progress slot is drawn per event
+        self.display_image = self._render_base().copy()
         
-        # Draw all completed slots
-        for i, slot in enumerate(self.slots):
-            if len(slot) >= 3:  # Need at least 3 points for a polygon
-                pts = np.array(slot, np.int32)
-                cv2.polylines(self.display_image, [pts], True, (0, 255, 0), 2)
-                # Draw slot number
-                if slot:
-                    center = np.mean(slot, axis=0, dtype=np.int32)
-                    cv2.putText(self.display_image, f"S{i+1}", 
-                              (center[0]-10, center[1]), 
-                              cv2.FONT_HERSHEY_SIMPLEX, 0.5, (0, 255, 0), 2)
+        points = [self.to_view_coords(p) for p in self.current_slot]
         
         # Draw current slot being defined
-        if len(self.current_slot) > 1:
-            pts = np.array(self.current_slot, np.int32)
+        if len(points) > 1:
+            pts = np.array(points, np.int32)
             cv2.polylines(self.display_image, [pts], False, (0, 0, 255), 2)
-        elif len(self.current_slot) == 1:
-            cv2.circle(self.display_image, self.current_slot[0], 5, (0, 0, 255), -1)
         
         # Draw points
-        for point in self.current_slot:
+        for point in points:
             cv2.circle(self.display_image, point, 5, (0, 0, 255), -1)
     
     def run(self) -> List[Dict[str, Any]]:
@@ -100,6 +223,8 @@ class SlotSelector:
         cv2.setMouseCallback(self.window_name, self.mouse_callback)
         
         self.update_display()
+        pan_x = self.view_width * PAN_STEP
+        pan_y = self.view_height * PAN_STEP
         
         while True:
             cv2.imshow(self.window_name, self.display_image)
@@ -108,17 +233,38 @@ class SlotSelector:
             if key == ord('n'):
                 # Finish current slot and start new one
                 if len(self.current_slot) >= 3:  # Minimum 3 points for a polygon
-                    self.slots.append(self.current_slot.copy())
+                    self.add_slot(self.current_slot)
                     self.current_slot = []
                     self.update_display()
                     print(f"Slot {len(self.slots)} completed. Start defining next slot.")
                 else:
                     print("Need at least 3 points to complete a slot region.")
             
+            elif key == ord('u'):
+                # Remove last completed slot
+                if self.remove_last_slot():
+                    self.update_display()
+                    print(f"Removed slot {len(self.slots) + 1}.")
+            
+            elif key in (ord('+'), ord('=')):
+                self.set_zoom(self.zoom * 1.25)
+            elif key == ord('-'):
+                self.set_zoom(self.zoom * 0.8)
+            elif key == ord('0'):
+                self.set_zoom(self.min_zoom)
+            elif key == ord('i'):
+                self.pan(0, -pan_y)
+            elif key == ord('k'):
+                self.pan(0, pan_y)
+            elif key == ord('j'):
+                self.pan(-pan_x, 0)
+            elif key == ord('l'):
+                self.pan(pan_x, 0)
+            
             elif key == ord('s'):
                 # Save and exit
                 if self.current_slot and len(self.current_slot) >= 3:
-                    self.slots.append(self.current_slot)
+                    self.add_slot(self.current_slot)
                     self.current_slot = []
                 
                 if self.slots:
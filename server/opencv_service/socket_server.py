@@ -0,0 +1,492 @@
+"""
+Socket Server - Binary detection protocol on a local Unix domain socket
+
+For a backend running on the same host, each HTTP detection costs a health
+check round trip, HTTP parsing on both sides and the slot list encoded as
+JSON both ways. This server offers the same detection over a Unix socket:
+
+    - persistent connections; requests are pipelined (sent without waiting)
+      and answered as they finish, matched by request id
+    - slots and results are fixed binary records, other options JSON
+    - a slot layout sent once with a "layout" key is remembered by the
+      connection; later requests send the key and no slots
+    - every response carries the service's health flags, so no separate
+      health check is needed
+
+Detection goes through the same function as POST /detect-occupancy
+(service.run_detection), so results, errors and versions are identical.
+
+Wire format (big-endian). Every message is a frame: u32 length + body.
+
+Request body:
+    u8 version (1), u8 op, u32 request_id, then for OP_DETECT:
+    u32 length + options JSON (every /detect-occupancy field except slots,
+    plus "if_none_match" and "layout"), then the slots:
+    u32 count, per slot: u16 length + slot_id (UTF-8), i32 slot_number,
+    u32 image_width, u32 image_height, u16 points, points x (f64 x, f64 y)
+
+Response body:
+    u8 version, u16 status (HTTP equivalent: 200, 304, 400, 404, 409, 500,
+    503), u32 request_id, u8 health (HEALTH_* bits), u32 length + JSON
+    (the response without "results", or {"success": false, "error"}), then
+    u32 count, per result: u16 length + slot_id, i32 slot_number, u8 status
+    (STATUS_CODES), f64 occupancy_ratio, u32 white_pixel_count, u32
+    total_area, f64 confidence. Result fields that do not fit these records
+    are sent in the JSON as "extras": {index: {field: value}}.
+
+A 409 answers a "layout" key the connection does not know (the client
+resends the slots).
+"""
+import json
+import os
+import socket
+import socketserver
+import stat
+import struct
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, Any, List, Optional, Tuple
+
+from occupancy_detector import STATUS_CODES
+
+PROTOCOL_VERSION = 1
+
+OP_PING = 0
+OP_DETECT = 1
+
+HEALTH_READY = 1      # warm-up finished
+HEALTH_DEGRADED = 2   # warm-up finished with errors
+
+MAX_FRAME = 64 * 2**20
+MAX_LAYOUTS = 256     # slot layouts remembered per connection
+MAX_IN_FLIGHT = 32    # pipelined requests per connection before reading pauses
+
+_FRAME = struct.Struct('!I')
+_REQUEST = struct.Struct('!BBI')
+_RESPONSE = struct.Struct('!BHIB')
+_SLOT = struct.Struct('!iIIH')
+_RESULT = struct.Struct('!iBdIId')
+_ID = struct.Struct('!H')
+
+RESULT_FIELDS = ('slot_id', 'slot_number', 'status', 'occupancy_ratio',
+                 'white_pixel_count', 'total_area', 'confidence')
+_STATUS_NAMES = {code: name for name, code in STATUS_CODES.items()}
+
+
+# Encoding
+
+def _json(payload: Any) -> bytes:
+    return json.dumps(payload, separators=(',', ':')).encode()
+
+
+def _string(value: str) -> bytes:
+    data = value.encode()
+    return _ID.pack(len(data)) + data
+
+
+def _read_string(data: memoryview, offset: int) -> Tuple[str, int]:
+    (length,) = _ID.unpack_from(data, offset)
+    offset += _ID.size
+    return bytes(data[offset:offset + length]).decode(), offset + length
+
+
+def encode_slots(slots: List[Dict[str, Any]]) -> bytes:
+    """Binary slot records (slot_id, slot_number, image size and coordinates)"""
+    parts = [_FRAME.pack(len(slots))]
+    for slot in slots:
+        points = slot.get('coordinates') or []
+        parts.append(_string(str(slot.get('slot_id', ''))))
+        parts.append(_SLOT.pack(int(slot.get('slot_number') or 0), int(slot.get('image_width') or 0),
+                                int(slot.get('image_height') or 0), len(points)))
+        parts.append(struct.pack(f'!{2 * len(points)}d', *(float(v) for point in points for v in point)))
+    return b''.join(parts)
+
+
+def decode_slots(data: memoryview, offset: int) -> Tuple[List[Dict[str, Any]], int]:
+    (count,) = _FRAME.unpack_from(data, offset)
+    offset += _FRAME.size
+    slots = []
+    for _ in range(count):
+        slot_id, offset = _read_string(data, offset)
+        slot_number, width, height, points = _SLOT.unpack_from(data, offset)
+        offset += _SLOT.size
+        values = struct.unpack_from(f'!{2 * points}d', data, offset)
+        offset += 16 * points
+        slots.append({
+            'slot_id': slot_id,
+            'slot_number': slot_number,
+            'coordinates': [[values[i], values[i + 1]] for i in range(0, len(values), 2)],
+            'image_width': width,
+            'image_height': height
+        })
+    return slots, offset
+
+
+def encode_request(request_id: int, op: int, options: Optional[Dict[str, Any]] = None,
+                   slots: Optional[List[Dict[str, Any]]] = None) -> bytes:
+    """Framed request (options and slots only for OP_DETECT)"""
+    body = _REQUEST.pack(PROTOCOL_VERSION, op, request_id)
+    if op == OP_DETECT:
+        options_json = _json(options or {})
+        body += _FRAME.pack(len(options_json)) + options_json + encode_slots(slots or [])
+    return _FRAME.pack(len(body)) + body
+
+
+def decode_request(body: bytes) -> Tuple[int, int, Dict[str, Any], List[Dict[str, Any]]]:
+    """(request_id, op, options, slots) of a request body"""
+    data = memoryview(body)
+    version, op, request_id = _REQUEST.unpack_from(data, 0)
+    if version != PROTOCOL_VERSION:
+        raise ValueError(f"Unsupported protocol version: {version}")
+    options, slots = {}, []
+    if op == OP_DETECT:
+        offset = _REQUEST.size
+        (length,) = _FRAME.unpack_from(data, offset)
+        offset += _FRAME.size
+        options = json.loads(bytes(data[offset:offset + length]))
+        slots, _ = decode_slots(data, offset + length)
+    return request_id, op, options, slots
+
+
+def _pack_result(result: Dict[str, Any]) -> Tuple[bytes, Dict[str, Any]]:
+    """Binary record of a result, plus the fields it cannot hold"""
+    extra = {k: v for k, v in result.items() if k not in RESULT_FIELDS}
+    values = []
+    for field, kind, default in (('slot_number', int, 0), ('occupancy_ratio', float, 0.0),
+                                 ('white_pixel_count', int, 0), ('total_area', int, 0),
+                                 ('confidence', float, 0.0)):
+        value = result.get(field, default)
+        if not isinstance(value, (int, float)) or isinstance(value, bool) or \
+                (kind is int and (value != int(value) or not (field == 'slot_number' or value >= 0))):
+            extra[field] = value
+            value = default
+        values.append(kind(value))
+    status = STATUS_CODES.get(result.get('status'))
+    if status is None:
+        extra['status'] = result.get('status')
+        status = 255
+    slot_id = result.get('slot_id', '')
+    if not isinstance(slot_id, str):
+        extra['slot_id'] = slot_id
+        slot_id = ''
+    slot_number, ratio, white, total, confidence = values
+    return _string(slot_id) + _RESULT.pack(slot_number, status, ratio, white, total, confidence), extra
+
+
+def encode_response(request_id: int, status: int, health: int, response: Dict[str, Any]) -> bytes:
+    """Framed response (see module docstring)"""
+    results = response.get('results') or []
+    meta = {k: v for k, v in response.items() if k != 'results'}
+    records, extras = [_FRAME.pack(len(results))], {}
+    for index, result in enumerate(results):
+        record, extra = _pack_result(result)
+        records.append(record)
+        if extra:
+            extras[str(index)] = extra
+    if extras:
+        meta['extras'] = extras
+    meta_json = _json(meta)
+    body = b''.join([_RESPONSE.pack(PROTOCOL_VERSION, status, request_id, health),
+                     _FRAME.pack(len(meta_json)), meta_json] + records)
+    return _FRAME.pack(len(body)) + body
+
+
+def decode_response(body: bytes) -> Tuple[int, int, int, Dict[str, Any]]:
+    """(request_id, status, health, response) of a response body"""
+    data = memoryview(body)
+    _, status, request_id, health = _RESPONSE.unpack_from(data, 0)
+    offset = _RESPONSE.size
+    (length,) = _FRAME.unpack_from(data, offset)
+    offset += _FRAME.size
+    response = json.loads(bytes(data[offset:offset + length]))
+    offset += length
+    (count,) = _FRAME.unpack_from(data, offset)
+    offset += _FRAME.size
+    extras = response.pop('extras', {})
+    results = []
+    for index in range(count):
+        slot_id, offset = _read_string(data, offset)
+        slot_number, code, ratio, white, total, confidence = _RESULT.unpack_from(data, offset)
+        offset += _RESULT.size
+        result = {
+            'slot_id': slot_id,
+            'slot_number': slot_number,
+            'status': _STATUS_NAMES.get(code),
+            'occupancy_ratio': ratio,
+            'white_pixel_count': white,
+            'total_area': total,
+            'confidence': confidence
+        }
+        result.update(extras.get(str(index), {}))
+        results.append(result)
+    if status == 200 and response.get('success'):
+        response['results'] = results
+    return request_id, status, health, response
+
+
+def read_frame(sock: socket.socket) -> Optional[bytes]:
+    """Body of the next frame (None when the peer closed the connection)"""
+    header = _recv_exact(sock, _FRAME.size)
+    if header is None:
+        return None
+    (length,) = _FRAME.unpack(header)
+    if length > MAX_FRAME:
+        raise ValueError(f"Frame of {length} bytes exceeds {MAX_FRAME}")
+    return _recv_exact(sock, length)
+
+
+def _recv_exact(sock: socket.socket, size: int) -> Optional[bytes]:
+    buffer = bytearray(size)
+    view = memoryview(buffer)
+    received = 0
+    while received < size:
+        count = sock.recv_into(view[received:])
+        if count == 0:
+            return None
+        received += count
+    return bytes(buffer)
+
+
+# Server
+
+def health_flags(health: Dict[str, Any]) -> int:
+    """HEALTH_* bits of a /health-style dict ("ready", "state")"""
+    flags = HEALTH_READY if health.get('ready') else 0
+    if health.get('state') == 'degraded':
+        flags |= HEALTH_DEGRADED
+    return flags
+
+
+class _Connection(socketserver.BaseRequestHandler):
+    """One client connection: reads requests, answers them from the worker pool"""
+
+    def handle(self):
+        server: SocketServer = self.server.owner
+        self._write_lock = threading.Lock()
+        self._layout_lock = threading.Lock()
+        self._in_flight = threading.BoundedSemaphore(MAX_IN_FLIGHT)
+        self._layouts: "OrderedDict[str, List[Dict[str, Any]]]" = OrderedDict()
+        while True:
+            try:
+                body = read_frame(self.request)
+            except (OSError, ValueError) as e:
+                print(f"Socket connection closed: {e}")
+                break
+            if body is None:
+                break
+            self._in_flight.acquire()
+            server.pool.submit(self._answer, server, body)
+        # Let pipelined requests still running finish writing
+        for _ in range(MAX_IN_FLIGHT):
+            self._in_flight.acquire()
+
+    def _answer(self, server: "SocketServer", body: bytes):
+        request_id = 0
+        try:
+            request_id, op, options, slots = decode_request(body)
+            response, status = self._dispatch(server, op, options, slots)
+        except (ValueError, struct.error) as e:
+            response, status = {"success": False, "error": f"Malformed request: {e}"}, 400
+        except Exception as e:
+            response, status = {"success": False, "error": str(e)}, 500
+        try:
+            health = health_flags(server.health())
+            try:
+                message = encode_response(request_id, status, health, response)
+            except Exception as e:
+                message = encode_response(request_id, 500, health, {"success": False, "error": str(e)})
+            with self._write_lock:
+                self.request.sendall(message)
+        except OSError:
+            pass  # client went away
+        finally:
+            self._in_flight.release()
+
+    def _dispatch(self, server: "SocketServer", op: int, options: Dict[str, Any],
+                  slots: List[Dict[str, Any]]) -> Tuple[Dict[str, Any], int]:
+        if op == OP_PING:
+            return server.health(), 200
+        if op != OP_DETECT:
+            return {"success": False, "error": f"Unknown op: {op}"}, 400
+        layout = options.pop('layout', None)
+        if layout is not None:
+            with self._layout_lock:
+                if slots:
+                    self._layouts[layout] = slots
+                    while len(self._layouts) > MAX_LAYOUTS:
+                        self._layouts.popitem(last=False)
+                else:
+                    slots = self._layouts.get(layout)
+                    if slots is None:
+                        return {"success": False, "error": f"Unknown layout: {layout}"}, 409
+                    self._layouts.move_to_end(layout)
+        if_none_match = options.pop('if_none_match', None)
+        options['slots'] = slots
+        return server.detect(options, if_none_match)
+
+
+class _UnixServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+
+class SocketServer:
+    """Unix socket front end of the detection service"""
+
+    def __init__(self, path: str,
+                 detect: Callable[[Dict[str, Any], Optional[str]], Tuple[Dict[str, Any], int]],
+                 health: Callable[[], Dict[str, Any]], workers: int = 4):
+        """
+        Args:
+            path: Socket file (a stale socket file there is replaced)
+            detect: Detection function (service.run_detection)
+            health: Returns the /health response
+            workers: Requests processed at the same time across connections
+        """
+        self.path = path
+        self.detect = detect
+        self.health = health
+        self.pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='socket-detect')
+        self._server: Optional[_UnixServer] = None
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self):
+        if os.path.exists(self.path):
+            # Left behind by a previous run that did not exit cleanly
+            if not stat.S_ISSOCK(os.stat(self.path).st_mode):
+                raise ValueError(f"{self.path} exists and is not a socket")
+            os.unlink(self.path)
+        os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+        self._server = _UnixServer(self.path, _Connection)
+        self._server.owner = self
+        self._thread = threading.Thread(target=self._server.serve_forever, name='socket-server', daemon=True)
+        self._thread.start()
+        print(f"Detection socket listening on {self.path}")
+
+    def stop(self):
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+            self._server = None
+        self.pool.shutdown(wait=False)
+        if os.path.exists(self.path):
+            os.unlink(self.path)
+
+
+# Client
+
+class SocketClient:
+    """
+    Thread-safe client with pipelining: calls from several threads share
+    one connection and wait only for their own response.
+    """
+
+    def __init__(self, path: str, timeout: float = 60.0):
+        self.path = path
+        self.timeout = timeout
+        self.health = 0  # flags of the latest response
+        self._sock: Optional[socket.socket] = None
+        self._lock = threading.Lock()       # pending requests
+        self._send_lock = threading.Lock()  # connection and writes
+        self._pending: Dict[int, Dict[str, Any]] = {}
+        self._next_id = 0
+        self._layouts: set = set()
+
+    def _connect(self) -> socket.socket:
+        if self._sock is None:
+            sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            sock.connect(self.path)
+            self._sock = sock
+            self._layouts = set()
+            threading.Thread(target=self._read, args=(sock,), daemon=True).start()
+        return self._sock
+
+    def _read(self, sock: socket.socket):
+        try:
+            while True:
+                body = read_frame(sock)
+                if body is None:
+                    break
+                request_id, status, health, response = decode_response(body)
+                self.health = health
+                with self._lock:
+                    waiter = self._pending.pop(request_id, None)
+                if waiter is not None:
+                    waiter["reply"] = (status, response)
+                    waiter["done"].set()
+        except (OSError, ValueError):
+            pass
+        with self._lock:
+            if self._sock is sock:
+                self._sock = None
+            pending, self._pending = self._pending, {}
+        sock.close()
+        for waiter in pending.values():
+            waiter["done"].set()
+
+    def request(self, op: int, options: Optional[Dict[str, Any]] = None,
+                slots: Optional[List[Dict[str, Any]]] = None) -> Tuple[int, Dict[str, Any]]:
+        """
+        Send a request and wait for its response.
+
+        Returns:
+            (status, response)
+
+        Raises:
+            ConnectionError: If the connection closes or the response times out
+        """
+        waiter = {"done": threading.Event(), "reply": None}
+        with self._send_lock:
+            sock = self._connect()
+            with self._lock:
+                self._next_id = (self._next_id + 1) & 0xFFFFFFFF
+                request_id = self._next_id
+                self._pending[request_id] = waiter
+            try:
+                sock.sendall(encode_request(request_id, op, options, slots))
+            except OSError as e:
+                with self._lock:
+                    self._pending.pop(request_id, None)
+                raise ConnectionError(f"Send failed: {e}")
+        if not waiter["done"].wait(self.timeout):
+            with self._lock:
+                self._pending.pop(request_id, None)
+            raise ConnectionError(f"No response within {self.timeout} s")
+        if waiter["reply"] is None:
+            raise ConnectionError("Connection closed")
+        return waiter["reply"]
+
+    def ping(self) -> Dict[str, Any]:
+        return self.request(OP_PING)[1]
+
+    def detect(self, payload: Dict[str, Any], layout: Optional[str] = None,
+               if_none_match: Optional[str] = None) -> Tuple[int, Dict[str, Any]]:
+        """
+        Detection with a /detect-occupancy request body.
+
+        Args:
+            payload: Request fields including "slots"
+            layout: Key of the slot layout; the slots are sent only the first time
+            if_none_match: Version the client already has
+
+        Returns:
+            (status, response) as the HTTP endpoint would answer
+        """
+        options = {k: v for k, v in payload.items() if k != 'slots'}
+        if if_none_match is not None:
+            options['if_none_match'] = if_none_match
+        slots = payload.get('slots') or []
+        if layout is not None:
+            options['layout'] = layout
+            if layout in self._layouts:
+                status, response = self.request(OP_DETECT, options, [])
+                if status != 409:
+                    return status, response
+            self._layouts.add(layout)
+        return self.request(OP_DETECT, options, slots)
+
+    def close(self):
+        with self._send_lock:
+            sock, self._sock = self._sock, None
+        if sock is not None:
+            sock.close()
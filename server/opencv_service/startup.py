@@ -0,0 +1,188 @@
+"""
+Startup - Lazy service objects, warm-up and readiness for the detection service
+
+Importing this module is cheap (no OpenCV/NumPy). The service creates its
+heavy objects through LazyObject, so the Flask app can answer liveness checks
+as soon as it starts, while a background warm-up imports OpenCV, runs
+synthetic frames through the preprocessing pipeline, preloads slot layouts
+and opens configured cameras. Readiness is reported separately.
+
+Warm-up configuration (environment):
+    OPENCV_WARMUP              - "0" disables warm-up (default: enabled)
+    OPENCV_WARMUP_RESOLUTIONS  - e.g. "1920x1080,1280x720" (default: 1920x1080)
+    OPENCV_WARMUP_LAYOUTS      - comma-separated slots JSON files (slot_selector.py format)
+    OPENCV_WARMUP_CAMERAS      - comma-separated source_id=source pairs started as captures
+"""
+import json
+import os
+import threading
+import time
+from typing import Callable, Dict, Any, List, Optional, Tuple
+
+STARTING = 'starting'
+WARMING = 'warming'
+READY = 'ready'
+DEGRADED = 'degraded'  # warm-up finished with errors; service still serves
+
+
+class LazyObject:
+    """Proxy that creates the wrapped object on first attribute access"""
+
+    def __init__(self, factory: Callable[[], Any]):
+        self._factory = factory
+        self._value = None
+        self._lock = threading.Lock()
+
+    def get(self) -> Any:
+        value = self._value
+        if value is None:
+            with self._lock:
+                if self._value is None:
+                    self._value = self._factory()
+                value = self._value
+        return value
+
+    @property
+    def loaded(self) -> bool:
+        return self._value is not None
+
+    def __getattr__(self, name: str) -> Any:
+        return getattr(self.get(), name)
+
+
+def parse_resolutions(value: str) -> List[Tuple[int, int]]:
+    """Parse "1920x1080,1280x720" into [(1920, 1080), (1280, 720)]"""
+    resolutions = []
+    for item in value.split(','):
+        item = item.strip().lower()
+        if item:
+            width, height = item.split('x')
+            resolutions.append((int(width), int(height)))
+    return resolutions
+
+
+def parse_cameras(value: str) -> List[Tuple[str, str]]:
+    """Parse "lot1=camera://0,gate=rtsp://..." into [(source_id, source), ...]"""
+    cameras = []
+    for item in value.split(','):
+        item = item.strip()
+        if item:
+            source_id, _, source = item.partition('=')
+            cameras.append((source_id, source) if source else (f"cam{len(cameras) + 1}", source_id))
+    return cameras
+
+
+class Warmup:
+    """Runs the warm-up steps in a background thread and tracks readiness"""
+
+    def __init__(self, environ: Optional[Dict[str, str]] = None):
+        environ = os.environ if environ is None else environ
+        self.enabled = environ.get('OPENCV_WARMUP', '1') != '0'
+        self.resolutions = parse_resolutions(environ.get('OPENCV_WARMUP_RESOLUTIONS', '1920x1080'))
+        self.layouts = [p.strip() for p in environ.get('OPENCV_WARMUP_LAYOUTS', '').split(',') if p.strip()]
+        self.cameras = parse_cameras(environ.get('OPENCV_WARMUP_CAMERAS', ''))
+
+        self.state = STARTING
+        self.started_at = time.time()
+        self.ready_at: Optional[float] = None
+        self.steps: List[Dict[str, Any]] = []
+        self._thread: Optional[threading.Thread] = None
+        self._lock = threading.Lock()
+
+    def start(self, detector, captures):
+        """
+        Start warm-up once (later calls are no-ops).
+
+        Args:
+            detector: Service detector (LazyObject or OccupancyDetector)
+            captures: Service CaptureRegistry (LazyObject or instance)
+        """
+        with self._lock:
+            if self._thread is not None:
+                return
+            self._thread = threading.Thread(target=self._run, args=(detector, captures),
+                                            name='warmup', daemon=True)
+            self.state = WARMING
+            self._thread.start()
+
+    def _step(self, name: str, fn: Callable[[], Any]):
+        started = time.perf_counter()
+        entry: Dict[str, Any] = {"step": name}
+        try:
+            detail = fn()
+            entry["ok"] = True
+            if detail is not None:
+                entry["detail"] = detail
+        except Exception as e:
+            entry["ok"] = False
+            entry["error"] = str(e)
+        entry["ms"] = round((time.perf_counter() - started) * 1000, 1)
+        self.steps.append(entry)
+
+    def _run(self, detector, captures):
+        if self.enabled:
+            self._step("import", lambda: _import_heavy_modules())
+            self._step("detector", lambda: detector.pipeline_params())
+            for width, height in self.resolutions:
+                self._step(f"pipeline {width}x{height}",
+                           lambda w=width, h=height: _warm_pipeline(detector, w, h))
+            for path in self.layouts:
+                self._step(f"layout {path}", lambda p=path: _preload_layout(detector, p))
+            for source_id, source in self.cameras:
+                self._step(f"camera {source_id}",
+                           lambda i=source_id, s=source: captures.start(i, s)["frame_shape"])
+        self.state = READY if all(step["ok"] for step in self.steps) else DEGRADED
+        self.ready_at = time.time()
+
+    @property
+    def ready(self) -> bool:
+        return self.state in (READY, DEGRADED)
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "state": self.state,
+            "ready": self.ready,
+            "startup_seconds": round(self.ready_at - self.started_at, 3) if self.ready_at else None,
+            "steps": list(self.steps)
+        }
+
+
+def _import_heavy_modules():
+    import cv2
+    import numpy  # noqa: F401
+    import occupancy_detector  # noqa: F401
+    import preprocess_pipeline  # noqa: F401
+    return {"opencv_version": cv2.__version__, "threads": cv2.getNumThreads()}
+
+
+def _warm_pipeline(detector, width: int, height: int):
+    """Run synthetic frames through the full detection path at one resolution"""
+    import numpy as np
+    from utils import preprocess_image
+
+    rng = np.random.default_rng(0)
+    frame = rng.integers(0, 256, (height, width), dtype=np.uint8)
+    preprocess_image(frame)
+    slot = {
+        "slot_id": "warmup",
+        "slot_number": 0,
+        "coordinates": [[0.1, 0.1], [0.3, 0.1], [0.3, 0.3], [0.1, 0.3]],
+        "image_width": width,
+        "image_height": height
+    }
+    for _ in range(2):
+        detector.detect_occupancy_frame(frame, [slot])
+
+
+def _preload_layout(detector, path: str):
+    """Build the cached slot masks of a layout at its own resolution"""
+    import numpy as np
+
+    with open(path) as f:
+        slots = json.load(f)['slots']
+    if not slots:
+        return {"slots": 0}
+    width = int(slots[0].get('image_width', 1920))
+    height = int(slots[0].get('image_height', 1080))
+    detector.detect_occupancy_frame(np.zeros((height, width), np.uint8), slots)
+    return {"slots": len(slots), "resolution": f"{width}x{height}"}
@@ -0,0 +1,101 @@
+"""
+Tests for frame_archive.py
+"""
+import cv2
+import numpy as np
+import pytest
+
+from frame_archive import FrameArchive
+
+SLOTS = [
+    {"id": "S1", "coordinates": [[0.0, 0.0], [0.5, 0.0], [0.5, 1.0], [0.0, 1.0]]},
+    {"id": "S2", "coordinates": [[0.5, 0.0], [1.0, 0.0], [1.0, 1.0], [0.5, 1.0]]},
+]
+
+
+def detection(*statuses):
+    return [{"slot_id": f"S{i + 1}", "slot_number": i + 1, "status": s} for i, s in enumerate(statuses)]
+
+
+@pytest.fixture
+def frame():
+    image = np.zeros((60, 80, 3), np.uint8)
+    image[:, 40:] = 255
+    return image
+
+
+@pytest.mark.parametrize("mode", ["crops", "frame"])
+def test_record_and_query_round_trip(tmp_path, frame, mode):
+    archive = FrameArchive(str(tmp_path), mode=mode)
+    assert archive.record('lot-1', SLOTS, detection('vacant', 'vacant'), frame, timestamp=100.0) == 0
+    assert archive.record('lot-1', SLOTS, detection('occupied', 'vacant'), frame, timestamp=200.0) == 1
+    assert archive.record('lot-1', SLOTS, detection('occupied', 'vacant'), frame, timestamp=300.0) == 0
+    assert archive.record('lot-1', SLOTS, detection('vacant', 'occupied'), frame, timestamp=400.0) == 2
+
+    records = archive.query('lot-1')
+    assert [(r["ts"], r["slot_number"], r["previous"], r["status"]) for r in records] == [
+        (200.0, 1, 'vacant', 'occupied'),
+        (400.0, 1, 'occupied', 'vacant'),
+        (400.0, 2, 'vacant', 'occupied'),
+    ]
+    assert [r["ts"] for r in archive.query('lot-1', start=300.0)] == [400.0, 400.0]
+    assert [r["ts"] for r in archive.query('lot-1', end=400.0)] == [200.0]
+    assert [r["status"] for r in archive.query('lot-1', slot=2)] == ['occupied']
+
+    for record in records:
+        assert record["kind"] == ('frame' if mode == 'frame' else 'crop')
+        blob = archive.read('lot-1', record["offset"])
+        assert len(blob) == record["length"]
+        image = cv2.imdecode(np.frombuffer(blob, np.uint8), cv2.IMREAD_COLOR)
+        height, width = image.shape[:2]
+        if mode == 'frame':
+            assert (height, width) == frame.shape[:2]
+        else:
+            assert width < frame.shape[1]
+        # The blob shows the archived region of the analyzed frame
+        region = frame[record["y"]:record["y"] + height, record["x"]:record["x"] + width]
+        assert np.abs(image.astype(int) - region).mean() < 8
+    assert archive.read('lot-1', 1) is None
+
+
+def test_records_survive_reopening(tmp_path, frame):
+    archive = FrameArchive(str(tmp_path))
+    archive.record('lot-1', SLOTS, detection('vacant', 'vacant'), frame, timestamp=100.0)
+    archive.record('lot-1', SLOTS, detection('occupied', 'vacant'), frame, timestamp=200.0)
+
+    reopened = FrameArchive(str(tmp_path))
+    records = reopened.query('lot-1')
+    assert [(r["ts"], r["slot_number"], r["status"]) for r in records] == [(200.0, 1, 'occupied')]
+    assert reopened.read('lot-1', records[0]["offset"]) == archive.read('lot-1', records[0]["offset"])
+
+
+def test_older_changes_are_stamped_with_the_last_time(tmp_path, frame):
+    archive = FrameArchive(str(tmp_path))
+    archive.record('lot-1', SLOTS, detection('vacant', 'vacant'), frame, timestamp=100.0)
+    archive.record('lot-1', SLOTS, detection('occupied', 'vacant'), frame, timestamp=200.0)
+    archive.record('lot-1', SLOTS, detection('vacant', 'vacant'), frame, timestamp=150.0)
+
+    assert [r["ts"] for r in archive.query('lot-1')] == [200.0, 200.0]
+
+
+def test_unknown_statuses_are_not_changes(tmp_path, frame):
+    archive = FrameArchive(str(tmp_path))
+    archive.record('lot-1', SLOTS, detection('occupied', 'vacant'), frame, timestamp=100.0)
+    assert archive.record('lot-1', SLOTS, detection('unknown', 'vacant'), frame, timestamp=200.0) == 0
+    assert archive.record('lot-1', SLOTS, detection('occupied', 'vacant'), frame, timestamp=300.0) == 0
+    assert archive.query('lot-1') == []
+
+
+def test_frame_callable_only_called_on_change(tmp_path, frame):
+    archive = FrameArchive(str(tmp_path))
+    calls = []
+
+    def load():
+        calls.append(1)
+        return frame
+
+    archive.record('lot-1', SLOTS, detection('vacant', 'vacant'), load, timestamp=100.0)
+    archive.record('lot-1', SLOTS, detection('vacant', 'vacant'), load, timestamp=200.0)
+    assert calls == []
+    archive.record('lot-1', SLOTS, detection('occupied', 'vacant'), load, timestamp=300.0)
+    assert calls == [1]
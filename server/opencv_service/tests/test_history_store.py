@@ -0,0 +1,72 @@
+"""
+Tests for history_store.py
+"""
+import numpy as np
+import pytest
+
+from history_store import HistoryStore, _as_grid
+
+
+def detection(*statuses):
+    return [{"slot_id": f"S{i + 1}", "slot_number": i + 1, "occupancy_ratio": 0.5 if s == 'occupied' else 0.0,
+             "status": s} for i, s in enumerate(statuses)]
+
+
+@pytest.fixture
+def store(tmp_path):
+    return HistoryStore(str(tmp_path))
+
+
+def test_append_and_range_query(store):
+    store.append('lot-1', detection('occupied', 'vacant'), 100.0)
+    store.append('lot-1', detection('vacant', 'vacant'), 200.0)
+    store.append('lot-1', detection('vacant', 'occupied'), 300.0)
+
+    records = store.query('lot-1')
+    assert list(records["ts"]) == [100.0, 100.0, 200.0, 200.0, 300.0, 300.0]
+    assert list(records["slot"]) == [1, 2, 1, 2, 1, 2]
+
+    records = store.query('lot-1', start=200.0, end=300.0)
+    assert list(records["ts"]) == [200.0, 200.0]
+    assert list(store.query('lot-1', slot=2)["ts"]) == [100.0, 200.0, 300.0]
+
+
+def test_append_clamps_older_timestamps(store):
+    store.append('lot-1', detection('occupied', 'vacant'), 100.0)
+    store.append('lot-1', detection('vacant', 'vacant'), 90.0)
+
+    ts = store.query('lot-1')["ts"]
+    assert list(ts) == [100.0] * 4
+    assert np.all(np.diff(ts) >= 0)
+
+
+def test_aggregate_grid(store):
+    store.append('lot-1', detection('occupied', 'vacant'), 0.0)
+    store.append('lot-1', detection('vacant', 'vacant'), 100.0)
+    store.append('lot-1', detection('vacant', 'occupied'), 200.0)
+
+    summary = store.aggregate('lot-1')
+    assert summary["records"] == 6
+    assert [s["occupancy_percent"] for s in summary["slots"]] == [50.0, 0.0]
+    assert summary["dwell"]["count"] == 1
+    assert summary["dwell"]["max"] == 100.0
+    assert summary["dwell"]["open"] == 1
+
+
+def test_aggregate_detections_sharing_a_timestamp(store):
+    # Detections finishing out of order are clamped to the previous time, so
+    # pairs of detections share a timestamp: 2 slots, 4 records per time
+    store.append('lot-1', detection('occupied', 'vacant'), 100.0)
+    store.append('lot-1', detection('occupied', 'occupied'), 100.0)
+    store.append('lot-1', detection('vacant', 'occupied'), 200.0)
+    store.append('lot-1', detection('vacant', 'vacant'), 200.0)
+
+    records = store.query('lot-1')
+    assert _as_grid(np.asarray(records["ts"]), np.asarray(records["slot"]), np.asarray(records["status"])) is None
+
+    summary = store.aggregate('lot-1')
+    assert [s["slot_number"] for s in summary["slots"]] == [1, 2]
+    assert [s["occupancy_percent"] for s in summary["slots"]] == [100.0, 100.0]
+    assert summary["occupancy_percent"] == 100.0
+    assert summary["dwell"]["count"] == 2
+    assert summary["dwell"]["open"] == 0
@@ -0,0 +1,98 @@
+"""
+Tests for memory_budget.py
+"""
+import pytest
+
+from memory_budget import MemoryAccountant, MemoryBudgetExceeded
+
+
+def tracker(accountant, evicted):
+    def track(component, key, nbytes, **kwargs):
+        accountant.track(component, key, nbytes, lambda: evicted.append((component, key)), **kwargs)
+    return track
+
+
+def test_evicts_least_recently_used_first():
+    accountant = MemoryAccountant(300)
+    evicted = []
+    track = tracker(accountant, evicted)
+    track('cache', 'a', 100)
+    track('cache', 'b', 100)
+    track('cache', 'c', 100)
+    accountant.touch('cache', 'a')
+    track('cache', 'd', 100)
+
+    assert evicted == [('cache', 'b')]
+    assert accountant.total_bytes == 300
+    assert accountant.report()["components"]["cache"]["evictions"] == 1
+
+
+def test_pinned_entries_are_never_evicted():
+    accountant = MemoryAccountant(300)
+    evicted = []
+    track = tracker(accountant, evicted)
+    track('rings', 'ring-1', 200, pinned=True)
+    track('cache', 'a', 50)
+    track('cache', 'b', 50)
+    track('cache', 'c', 50)
+
+    assert evicted == [('cache', 'a')]
+    assert accountant.total_bytes == 300
+    assert accountant.pinned_bytes == 200
+
+    # A pinned allocation evicts everything evictable to fit
+    track('rings', 'ring-2', 100, pinned=True)
+    assert evicted == [('cache', 'a'), ('cache', 'b'), ('cache', 'c')]
+    assert accountant.total_bytes == accountant.pinned_bytes == 300
+    assert evicted.count(('rings', 'ring-1')) == 0
+
+
+def test_pinned_allocation_over_budget_is_refused():
+    accountant = MemoryAccountant(300)
+    evicted = []
+    track = tracker(accountant, evicted)
+    track('rings', 'ring-1', 200, pinned=True)
+    track('cache', 'a', 100)
+
+    with pytest.raises(MemoryBudgetExceeded):
+        track('rings', 'ring-2', 150, pinned=True)
+    assert evicted == []
+    assert accountant.total_bytes == 300
+
+
+def test_rejected_pinned_resize_keeps_the_entry():
+    accountant = MemoryAccountant(300)
+    accountant.track('rings', 'ring-1', 200, pinned=True)
+
+    with pytest.raises(MemoryBudgetExceeded):
+        accountant.track('rings', 'ring-1', 400, pinned=True)
+    assert accountant.report()["components"]["rings"] == {"entries": 1, "bytes": 200, "pinned_bytes": 200}
+
+    # Resizing within the budget replaces the old size
+    accountant.track('rings', 'ring-1', 250, pinned=True)
+    assert accountant.total_bytes == accountant.pinned_bytes == 250
+
+
+def test_untracked_entries_are_not_evicted():
+    accountant = MemoryAccountant(200)
+    evicted = []
+    track = tracker(accountant, evicted)
+    track('cache', 'a', 100)
+    track('cache', 'b', 100)
+    accountant.untrack('cache', 'a')
+    track('cache', 'c', 100)
+
+    assert evicted == []
+    assert accountant.total_bytes == 200
+
+
+def test_no_budget_only_accounts():
+    accountant = MemoryAccountant()
+    evicted = []
+    track = tracker(accountant, evicted)
+    track('rings', 'ring-1', 10 ** 9, pinned=True)
+    track('cache', 'a', 10 ** 9)
+
+    assert evicted == []
+    assert accountant.peak_bytes == 2 * 10 ** 9
+    assert accountant.report()["utilization"] is None
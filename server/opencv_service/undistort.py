@@ -0,0 +1,221 @@
+"""
+Undistort - Cached lens-undistortion remap tables per camera
+
+Wide-angle cameras bend straight lines near the image edges, so slots drawn
+there do not match the lot's geometry. With a camera calibration (camera
+matrix + distortion coefficients, e.g. from cv2.calibrateCamera) frames are
+undistorted before detection:
+
+    - the remap tables are built once per calibration, frame size and ROI
+      (cv2.initUndistortRectifyMap, fixed-point maps) and cached, so each
+      frame costs a single cv2.remap instead of a full cv2.undistort
+    - with an ROI (the union of the slots' bounding boxes) only those pixels
+      are remapped; the rest of the frame stays black
+    - calibrations made at another resolution are scaled to the frame size,
+      so reduced-size decodes work unchanged
+
+Slots of a calibrated camera must be defined on undistorted frames (the
+output uses the calibration's own camera matrix).
+
+Calibrations are stored per source (camera://0, stream URL, ring://<id>,
+...) in a JSON file, or sent with a request:
+
+    {
+        "camera_matrix": [[fx, 0, cx], [0, fy, cy], [0, 0, 1]],
+        "dist_coeffs": [k1, k2, p1, p2, k3],
+        "image_width": 1920, "image_height": 1080
+    }
+"""
+import hashlib
+import json
+import os
+import threading
+from collections import OrderedDict
+from typing import Dict, Any, List, Optional, Tuple
+
+import cv2
+import numpy as np
+from memory_budget import accountant
+from occupancy_detector import slot_pixel_coordinates
+
+MAX_CACHED_MAPS = 16
+
+# Pixels remapped around the slots' union: at least the preprocessing
+# kernels' reach (see CascadeEngine.pad), so slot pixels come out exactly as
+# with a full-frame remap
+ROI_MARGIN = 16
+
+
+class Calibration:
+    """Validated camera calibration"""
+
+    def __init__(self, data: Dict[str, Any]):
+        """
+        Args:
+            data: {"camera_matrix", "dist_coeffs", "image_width", "image_height"}
+
+        Raises:
+            ValueError: If the calibration is malformed
+        """
+        try:
+            self.camera_matrix = np.array(data["camera_matrix"], dtype=np.float64).reshape(3, 3)
+            self.dist_coeffs = np.array(data["dist_coeffs"], dtype=np.float64).ravel()
+            self.width = int(data["image_width"])
+            self.height = int(data["image_height"])
+        except (KeyError, TypeError, ValueError) as e:
+            raise ValueError(f"Invalid calibration: {e}")
+        if self.dist_coeffs.size not in (4, 5, 8, 12, 14):
+            raise ValueError("dist_coeffs must have 4, 5, 8, 12 or 14 values")
+        if self.width <= 0 or self.height <= 0:
+            raise ValueError("Calibration image size must be positive")
+        self.key = hashlib.sha1(json.dumps(self.to_dict(), sort_keys=True).encode()).hexdigest()[:16]
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "camera_matrix": self.camera_matrix.tolist(),
+            "dist_coeffs": self.dist_coeffs.tolist(),
+            "image_width": self.width,
+            "image_height": self.height
+        }
+
+    def scaled_matrix(self, width: int, height: int) -> np.ndarray:
+        """Camera matrix for frames of another size"""
+        matrix = self.camera_matrix.copy()
+        matrix[0] *= width / self.width
+        matrix[1] *= height / self.height
+        return matrix
+
+
+_maps: "OrderedDict[Tuple, Tuple[np.ndarray, np.ndarray]]" = OrderedDict()
+_maps_lock = threading.Lock()
+
+
+def _drop_maps(key: Tuple):
+    with _maps_lock:
+        _maps.pop(key, None)
+
+
+def get_maps(calibration: Calibration, width: int, height: int,
+             roi: Optional[Tuple[int, int, int, int]] = None) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Remap tables of a calibration at a frame size (cached).
+
+    Args:
+        calibration: Camera calibration
+        width, height: Frame size
+        roi: Optional (x0, y0, x1, y1) output region; the tables then only cover it
+
+    Returns:
+        (map1, map2) for cv2.remap
+    """
+    key = (calibration.key, width, height, roi)
+    with _maps_lock:
+        maps = _maps.get(key)
+        if maps is not None:
+            _maps.move_to_end(key)
+    if maps is not None:
+        accountant.touch('undistort_maps', key)
+        return maps
+
+    matrix = calibration.scaled_matrix(width, height)
+    map1, map2 = cv2.initUndistortRectifyMap(matrix, calibration.dist_coeffs, None, matrix,
+                                             (width, height), cv2.CV_16SC2)
+    if roi is not None:
+        x0, y0, x1, y1 = roi
+        map1 = np.ascontiguousarray(map1[y0:y1, x0:x1])
+        map2 = np.ascontiguousarray(map2[y0:y1, x0:x1])
+    maps = (map1, map2)
+    with _maps_lock:
+        _maps[key] = maps
+        accountant.track('undistort_maps', key, map1.nbytes + map2.nbytes, lambda: _drop_maps(key), enforce=False)
+        while len(_maps) > MAX_CACHED_MAPS:
+            evicted, _ = _maps.popitem(last=False)
+            accountant.untrack('undistort_maps', evicted)
+    accountant.enforce()
+    return maps
+
+
+def slots_roi(slots: List[Dict[str, Any]], width: int, height: int, scale: int = 1,
+              margin: int = ROI_MARGIN) -> Optional[Tuple[int, int, int, int]]:
+    """Union of the slots' bounding boxes plus a margin, in frame pixels (None without slots)"""
+    points = [point for slot in slots if len(slot.get('coordinates', [])) >= 3
+              for point in slot_pixel_coordinates(slot, width, height, scale)]
+    if not points:
+        return None
+    x, y, w, h = cv2.boundingRect(np.array(points, dtype=np.int32))
+    x0, y0 = max(x - margin, 0), max(y - margin, 0)
+    x1, y1 = min(x + w + margin, width), min(y + h + margin, height)
+    if x1 <= x0 or y1 <= y0:
+        return None
+    return x0, y0, x1, y1
+
+
+def undistort(frame: np.ndarray, calibration: Optional[Calibration],
+              slots: Optional[List[Dict[str, Any]]] = None, scale: int = 1) -> np.ndarray:
+    """
+    Undistort a frame with cached remap tables.
+
+    Args:
+        frame: Grayscale or BGR frame
+        calibration: Camera calibration (None returns the frame unchanged)
+        slots: When given, only the union of their bounding boxes is remapped
+        scale: Factor by which the frame is reduced relative to the slots' image size
+
+    Returns:
+        Undistorted frame of the same size
+    """
+    if calibration is None:
+        return frame
+    height, width = frame.shape[:2]
+    roi = slots_roi(slots, width, height, scale) if slots else None
+    map1, map2 = get_maps(calibration, width, height, roi)
+    if roi is None:
+        return cv2.remap(frame, map1, map2, cv2.INTER_LINEAR)
+    x0, y0, x1, y1 = roi
+    output = np.zeros_like(frame)
+    output[y0:y1, x0:x1] = cv2.remap(frame, map1, map2, cv2.INTER_LINEAR)
+    return output
+
+
+class CalibrationStore:
+    """Calibrations per source, persisted as JSON"""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+        self._calibrations: Dict[str, Calibration] = {}
+        if os.path.exists(path):
+            with open(path) as f:
+                for source, data in json.load(f).items():
+                    try:
+                        self._calibrations[source] = Calibration(data)
+                    except ValueError as e:
+                        print(f"Ignoring calibration of {source}: {e}")
+
+    def _save(self):
+        """Write the file atomically (lock held)"""
+        os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+        temp_path = f"{self.path}.tmp"
+        with open(temp_path, 'w') as f:
+            json.dump({source: c.to_dict() for source, c in self._calibrations.items()}, f, indent=2)
+        os.replace(temp_path, self.path)
+
+    def lookup(self, source: str) -> Optional[Calibration]:
+        return self._calibrations.get(source)
+
+    def set(self, source: str, data: Dict[str, Any]) -> Calibration:
+        calibration = Calibration(data)
+        with self._lock:
+            self._calibrations[source] = calibration
+            self._save()
+        return calibration
+
+    def delete(self, source: str) -> bool:
+        with self._lock:
+            if self._calibrations.pop(source, None) is None:
+                return False
+            self._save()
+        return True
+
+    def list(self) -> Dict[str, Dict[str, Any]]:
+        return {source: c.to_dict() for source, c in list(self._calibrations.items())}
@@ -6,6 +6,9 @@ import numpy as np
 import os
 from typing import List, Tuple, Dict, Any
 
+VIDEO_EXTENSIONS = ['.mp4', '.avi', '.mov', '.mkv', '.flv', '.wmv', '.webm']
+IMAGE_EXTENSIONS = ['.jpg', '.jpeg', '.png', '.bmp', '.tif', '.tiff', '.webp']
+
 
 def extract_frame_from_video(video_path: str, frame_number: int = 0) -> np.ndarray:
     """
@@ -54,13 +57,93 @@ def extract_frame_from_video(video_path: str, frame_number: int = 0) -> np.ndarr
     return frame
 
 
-def load_image(image_path: str, from_camera: bool = False) -> np.ndarray:
+# cv2.imread/imdecode flags per decode scale. The reduced modes let the
+# JPEG decoder use its built-in 1/2, 1/4 and 1/8 DCT scaling, so the
+# full-size image is never materialised; other formats are decoded and
+# then downsampled by OpenCV.
+GRAYSCALE_DECODE_FLAGS = {
+    1: cv2.IMREAD_GRAYSCALE,
+    2: cv2.IMREAD_REDUCED_GRAYSCALE_2,
+    4: cv2.IMREAD_REDUCED_GRAYSCALE_4,
+    8: cv2.IMREAD_REDUCED_GRAYSCALE_8,
+}
+
+COLOR_DECODE_FLAGS = {
+    1: cv2.IMREAD_COLOR,
+    2: cv2.IMREAD_REDUCED_COLOR_2,
+    4: cv2.IMREAD_REDUCED_COLOR_4,
+    8: cv2.IMREAD_REDUCED_COLOR_8,
+}
+
+
+def get_decode_flags(grayscale: bool = False, scale: int = 1) -> int:
+    """
+    Get the OpenCV decode flags for a color mode and reduction factor
+    
+    Args:
+        grayscale: Decode straight to a single-channel image
+        scale: Reduction factor (1, 2, 4 or 8)
+        
+    Returns:
+        Flags for cv2.imread / cv2.imdecode
+    """
+    flags = GRAYSCALE_DECODE_FLAGS if grayscale else COLOR_DECODE_FLAGS
+    if scale not in flags:
+        raise ValueError(f"Unsupported decode scale {scale} (expected one of {sorted(flags)})")
+    return flags[scale]
+
+
+def to_grayscale(img: np.ndarray, scale: int = 1) -> np.ndarray:
+    """
+    Convert an already decoded frame (camera, video) to the detector's
+    input format: single channel, optionally reduced by an integer factor
+    
+    Args:
+        img: BGR or grayscale frame
+        scale: Reduction factor (1, 2, 4 or 8)
+        
+    Returns:
+        Grayscale frame
+    """
+    get_decode_flags(True, scale)  # validate scale
+    gray = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY) if img.ndim == 3 else img
+    if scale > 1:
+        height, width = gray.shape[:2]
+        gray = cv2.resize(gray, (max(1, width // scale), max(1, height // scale)),
+                          interpolation=cv2.INTER_AREA)
+    return gray
+
+
+def load_image_bytes(data: bytes, grayscale: bool = False, scale: int = 1) -> np.ndarray:
+    """
+    Decode an encoded image (JPEG, PNG, ...) from an in-memory buffer
+    
+    Args:
+        data: Encoded image bytes
+        grayscale: Decode straight to grayscale
+        scale: Reduction factor (1, 2, 4 or 8)
+        
+    Returns:
+        Decoded image as numpy array
+    """
+    buffer = np.frombuffer(data, dtype=np.uint8)
+    img = cv2.imdecode(buffer, get_decode_flags(grayscale, scale))
+    if img is None:
+        raise ValueError("Could not decode image from buffer")
+    return img
+
+
+def load_image(image_path: str, from_camera: bool = False,
+               grayscale: bool = False, scale: int = 1) -> np.ndarray:
     """
     Load image from file path, video file, camera source, or URL
     
     Args:
         image_path: Path to image file, video file, camera source (camera://0), or URL
         from_camera: If True, treat as camera source
+        grayscale: Return a single-channel image. Image files are decoded
+            directly to grayscale; camera and video frames are converted.
+        scale: Reduction factor (1, 2, 4 or 8) applied while decoding
         
     Returns:
         Loaded image as numpy array
@@ -73,22 +156,33 @@ def load_image(image_path: str, from_camera: bool = False) -> np.ndarray:
         frame = CameraManager.capture_frame_from_camera(image_path)
         if frame is None:
             raise ValueError(f"Could not capture frame from camera: {image_path}")
-        return frame
+        return to_grayscale(frame, scale) if grayscale else downscale(frame, scale)
     
     # Check if it's a video file
-    video_extensions = ['.mp4', '.avi', '.mov', '.mkv', '.flv', '.wmv', '.webm']
     file_ext = os.path.splitext(image_path.lower())[1]
     
-    if file_ext in video_extensions:
-        return extract_frame_from_video(image_path, 0)  # Extract first frame by default
+    if file_ext in VIDEO_EXTENSIONS:
+        frame = extract_frame_from_video(image_path, 0)  # Extract first frame by default
+        return to_grayscale(frame, scale) if grayscale else downscale(frame, scale)
     
     # Try to load as image
-    img = cv2.imread(image_path)
+    img = cv2.imread(image_path, get_decode_flags(grayscale, scale))
     if img is None:
         raise ValueError(f"Could not load image from {image_path}")
     return img
 
 
+def downscale(img: np.ndarray, scale: int) -> np.ndarray:
+    """Downsample an already decoded frame by an integer factor (camera and video
+    frames' equivalent of a reduced-size decode)"""
+    get_decode_flags(False, scale)  # validate scale
+    if scale == 1:
+        return img
+    height, width = img.shape[:2]
+    return cv2.resize(img, (max(1, width // scale), max(1, height // scale)),
+                      interpolation=cv2.INTER_AREA)
+
+
 def extract_frame_from_video(video_path: str, frame_number: int = 0) -> np.ndarray:
     """
     Extract a frame from a video file
@@ -150,7 +244,7 @@ def preprocess_image(img: np.ndarray,
     - Apply morphological dilation (3x3 kernel)
     
     Args:
-        img: Input BGR image
+        img: Input BGR or grayscale image
         adaptive_thresh_block_size: Block size for adaptive thresholding (must be odd)
         adaptive_thresh_c: Constant subtracted from mean for adaptive thresholding
         median_blur_size: Kernel size for median blur (must be odd)
@@ -159,8 +253,8 @@ def preprocess_image(img: np.ndarray,
     Returns:
         Processed binary image
     """
-    # Convert to grayscale
-    gray = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
+    # Convert to grayscale (skipped when the frame was decoded as grayscale)
+    gray = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY) if img.ndim == 3 else img
     
     # Gaussian blur (3x3 kernel, sigma=1) - matches reference code
     blurred = cv2.GaussianBlur(gray, (3, 3), 1)
@@ -215,11 +309,39 @@ def extract_region(img: np.ndarray, coordinates: List[Tuple[int, int]]) -> np.nd
     return region
 
 
+def build_region_mask(coordinates: List[Tuple[int, int]], shape: Tuple[int, ...]):
+    """
+    Rasterize a polygon into a mask covering only its bounding box
+    (clipped to the image)
+    
+    Args:
+        coordinates: List of (x, y) tuples defining polygon region
+        shape: Shape of the image the polygon lies in
+        
+    Returns:
+        ((x0, y0, x1, y1), mask) - mask is None if the polygon lies outside the image
+    """
+    img_height, img_width = shape[:2]
+    pts = np.array(coordinates, np.int32)
+    x, y, w, h = cv2.boundingRect(pts)
+    x0, y0 = max(x, 0), max(y, 0)
+    x1, y1 = min(x + w, img_width), min(y + h, img_height)
+    if x1 <= x0 or y1 <= y0:
+        return (0, 0, 0, 0), None
+    
+    mask = np.zeros((y1 - y0, x1 - x0), dtype=np.uint8)
+    cv2.fillPoly(mask, [pts - np.array([x0, y0], np.int32)], 255)
+    return (x0, y0, x1, y1), mask
+
+
 def count_pixels_in_region(binary_img: np.ndarray, coordinates: List[Tuple[int, int]]) -> int:
     """
     Count white pixels (occupied area) in a region using cv2.countNonZero
     (matches reference algorithm approach)
     
+    Only the polygon's bounding box is masked, so no full-frame
+    temporaries are allocated per slot.
+    
     Args:
         binary_img: Binary processed image
         coordinates: List of (x, y) tuples defining polygon region
@@ -227,13 +349,12 @@ def count_pixels_in_region(binary_img: np.ndarray, coordinates: List[Tuple[int,
     Returns:
         Number of white pixels in the region
     """
-    # Create mask for the region
-    mask = np.zeros(binary_img.shape[:2], dtype=np.uint8)
-    pts = np.array(coordinates, np.int32)
-    cv2.fillPoly(mask, [pts], 255)
+    (x0, y0, x1, y1), mask = build_region_mask(coordinates, binary_img.shape)
+    if mask is None:
+        return 0
     
     # Extract the region from processed image
-    img_crop = cv2.bitwise_and(binary_img, binary_img, mask=mask)
+    img_crop = cv2.bitwise_and(binary_img[y0:y1, x0:x1], mask)
     
     # Count non-zero (white) pixels using cv2.countNonZero (matches reference code)
     white_pixel_count = cv2.countNonZero(img_crop)
@@ -241,6 +362,28 @@ def count_pixels_in_region(binary_img: np.ndarray, coordinates: List[Tuple[int,
     return int(white_pixel_count)
 
 
+def draw_slot_polygon(img: np.ndarray, coordinates: List[Tuple[int, int]], label: str,
+                      color: Tuple[int, int, int] = (0, 255, 0), thickness: int = 2,
+                      font_scale: float = 0.5):
+    """
+    Draw a closed slot polygon with its label at the centroid
+    (the style used by SlotSelector)
+    
+    Args:
+        img: Image to draw on (modified in place)
+        coordinates: List of (x, y) pixel tuples
+        label: Text drawn at the polygon's center, e.g. "S1"
+        color: BGR color
+        thickness: Line thickness
+        font_scale: Label font scale
+    """
+    pts = np.array(coordinates, np.int32)
+    cv2.polylines(img, [pts], True, color, thickness)
+    center = np.mean(pts, axis=0, dtype=np.int32)
+    cv2.putText(img, label, (int(center[0]) - 10, int(center[1])),
+                cv2.FONT_HERSHEY_SIMPLEX, font_scale, color, 2)
+
+
 def calculate_region_area(coordinates: List[Tuple[int, int]]) -> float:
     """
     Calculate area of a polygon region
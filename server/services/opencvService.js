@@ -4,14 +4,66 @@
  * Communicates with the Python OpenCV service for parking occupancy detection
  */
 const axios = require('axios');
+const OpenCVSocketClient = require('./opencvSocketClient');
 
 const OPENCV_SERVICE_URL = process.env.OPENCV_SERVICE_URL || 'http://localhost:5001';
+// Unix socket of a co-located service (its OPENCV_SOCKET_PATH); detections
+// and health checks use it instead of HTTP when set
+const OPENCV_SERVICE_SOCKET = process.env.OPENCV_SERVICE_SOCKET;
+
+// Socket errors after which a call falls back to HTTP
+const SOCKET_UNAVAILABLE = ['ENOENT', 'ECONNREFUSED', 'ECONNRESET', 'EPIPE'];
 
 class OpenCVService {
+  constructor() {
+    this.socketClient = OPENCV_SERVICE_SOCKET ? new OpenCVSocketClient(OPENCV_SERVICE_SOCKET) : null;
+  }
+
+  /**
+   * Post a /detect-occupancy request over the socket, or HTTP without one
+   *
+   * @param {Object} payload - Request body
+   * @returns {Promise<Object>} Response body
+   */
+  async postDetection(payload) {
+    if (this.socketClient) {
+      try {
+        const { response } = await this.socketClient.detect(payload);
+        return response;
+      } catch (error) {
+        if (!SOCKET_UNAVAILABLE.includes(error.code)) {
+          throw error;
+        }
+        console.error('OpenCV socket unavailable, using HTTP:', error.message);
+      }
+    }
+    try {
+      const response = await axios.post(`${OPENCV_SERVICE_URL}/detect-occupancy`, payload, {
+        timeout: 30000, // 30 seconds
+      });
+      return response.data;
+    } catch (error) {
+      // Error responses carry the same body as successful ones
+      if (error.response?.data) {
+        return error.response.data;
+      }
+      throw error;
+    }
+  }
+
   /**
    * Check if OpenCV service is available
    */
   async healthCheck() {
+    if (this.socketClient) {
+      try {
+        // Recent responses carry the health, so this rarely costs a round trip
+        const { healthy } = await this.socketClient.checkHealth();
+        return healthy;
+      } catch (error) {
+        console.error('OpenCV socket health check failed, using HTTP:', error.message);
+      }
+    }
     try {
       const response = await axios.get(`${OPENCV_SERVICE_URL}/health`, {
         timeout: 5000,
@@ -90,9 +142,10 @@ class OpenCVService {
    * @param {string} imagePath - Path to current parking lot image
    * @param {Array} slots - Array of slot definitions with coordinates
    * @param {number} threshold - Optional detection threshold (0-1)
+   * @param {Object} calibration - Optional lens calibration of the camera
    * @returns {Promise<Array>} Array of slot occupancy results
    */
-  async detectOccupancy(imagePath, slots, threshold = null) {
+  async detectOccupancy(imagePath, slots, threshold = null, calibration = null) {
     try {
       const payload = {
         image_path: imagePath,
@@ -108,19 +161,70 @@ class OpenCVService {
       if (threshold !== null) {
         payload.threshold = threshold;
       }
+      if (calibration) {
+        payload.calibration = calibration;
+      }
 
-      const response = await axios.post(`${OPENCV_SERVICE_URL}/detect-occupancy`, payload, {
-        timeout: 30000, // 30 seconds
-      });
+      const data = await this.postDetection(payload);
 
-      if (!response.data.success) {
-        throw new Error(response.data.error || 'Detection failed');
+      if (!data.success) {
+        throw new Error(data.error || 'Detection failed');
       }
 
-      return response.data.results;
+      return data.results;
     } catch (error) {
       console.error('Detect occupancy error:', error.message);
-      throw new Error(`Failed to detect occupancy: ${error.response?.data?.error || error.message}`);
+      throw new Error(`Failed to detect occupancy: ${error.message}`);
+    }
+  }
+
+  /**
+   * Detect occupancy and return only the slots that changed since a version
+   *
+   * @param {string} imagePath - Path to current parking lot image
+   * @param {Array} slots - Array of slot definitions with coordinates
+   * @param {string} lotId - Parking lot ID (versions are tracked per lot)
+   * @param {string} since - Version returned by the previous call (null for all slots)
+   * @param {number} threshold - Optional detection threshold (0-1)
+   * @param {Object} calibration - Optional lens calibration (see detectOccupancy)
+   * @returns {Promise<Object>} { version, delta, changed, stale, results } - stale
+   *   results come from the lot's last good frame (none if there was none)
+   */
+  async detectOccupancyChanges(imagePath, slots, lotId, since = null, threshold = null, calibration = null) {
+    try {
+      const payload = {
+        image_path: imagePath,
+        lot_id: lotId,
+        slots: slots.map(slot => ({
+          slot_id: slot.slotId || slot.slot_id || `S${slot.slotNumber}`,
+          slot_number: slot.slotNumber,
+          coordinates: slot.coordinates,
+          image_width: slot.imageWidth,
+          image_height: slot.imageHeight,
+        })),
+      };
+
+      if (since) {
+        payload.since = since;
+      }
+      if (threshold !== null) {
+        payload.threshold = threshold;
+      }
+      if (calibration) {
+        payload.calibration = calibration;
+      }
+
+      const data = await this.postDetection(payload);
+
+      if (!data.success) {
+        throw new Error(data.error || 'Detection failed');
+      }
+
+      const { version, delta, changed, stale = false, results } = data;
+      return { version, delta, changed, stale, results };
+    } catch (error) {
+      console.error('Detect occupancy changes error:', error.message);
+      throw new Error(`Failed to detect occupancy: ${error.message}`);
     }
   }
 
@@ -0,0 +1,219 @@
+/**
+ * OpenCV Socket Client
+ *
+ * Talks to the Python OpenCV service over its Unix domain socket
+ * (opencv_service/socket_server.py) instead of HTTP: one persistent
+ * connection, pipelined requests matched by request id, slots and results
+ * as binary records, and the service's health in every response.
+ */
+const crypto = require('crypto');
+const net = require('net');
+
+const PROTOCOL_VERSION = 1;
+const OP_PING = 0;
+const OP_DETECT = 1;
+const HEALTH_READY = 1;
+
+const STATUS_NAMES = ['vacant', 'occupied', 'unknown', 'error'];
+
+class OpenCVSocketClient {
+  /**
+   * @param {string} socketPath - Path of the service's socket (OPENCV_SOCKET_PATH)
+   * @param {number} timeout - Milliseconds to wait for each response
+   */
+  constructor(socketPath, timeout = 30000) {
+    this.socketPath = socketPath;
+    this.timeout = timeout;
+    this.socket = null;
+    this.buffer = Buffer.alloc(0);
+    this.pending = new Map();
+    this.nextId = 0;
+    this.layouts = new Set(); // slot layouts the current connection knows
+    this.health = null; // { ready, at } from the latest response
+  }
+
+  connect() {
+    if (this.socket) {
+      return this.socket;
+    }
+    const socket = net.createConnection(this.socketPath);
+    this.socket = socket;
+    this.buffer = Buffer.alloc(0);
+    this.layouts = new Set();
+    socket.on('data', chunk => this.onData(chunk));
+    const closed = error => {
+      if (this.socket !== socket) {
+        return;
+      }
+      this.socket = null;
+      this.health = null;
+      for (const { reject, timer } of this.pending.values()) {
+        clearTimeout(timer);
+        reject(error || new Error('OpenCV socket closed'));
+      }
+      this.pending.clear();
+    };
+    socket.on('error', closed);
+    socket.on('close', () => closed(null));
+    return socket;
+  }
+
+  onData(chunk) {
+    this.buffer = this.buffer.length ? Buffer.concat([this.buffer, chunk]) : chunk;
+    while (this.buffer.length >= 4) {
+      const length = this.buffer.readUInt32BE(0);
+      if (this.buffer.length < 4 + length) {
+        break;
+      }
+      const body = this.buffer.subarray(4, 4 + length);
+      this.buffer = this.buffer.subarray(4 + length);
+      const { requestId, status, health, response } = decodeResponse(body);
+      this.health = { ready: (health & HEALTH_READY) !== 0, at: Date.now() };
+      const waiter = this.pending.get(requestId);
+      if (waiter) {
+        this.pending.delete(requestId);
+        clearTimeout(waiter.timer);
+        waiter.resolve({ status, response });
+      }
+    }
+  }
+
+  request(op, options = null, slotsBuffer = null) {
+    return new Promise((resolve, reject) => {
+      const socket = this.connect();
+      this.nextId = (this.nextId + 1) >>> 0;
+      const requestId = this.nextId;
+      const timer = setTimeout(() => {
+        this.pending.delete(requestId);
+        reject(new Error(`No response from OpenCV socket within ${this.timeout} ms`));
+      }, this.timeout);
+      this.pending.set(requestId, { resolve, reject, timer });
+      socket.write(encodeRequest(requestId, op, options, slotsBuffer));
+    });
+  }
+
+  /**
+   * Health of the service, from the latest response when it is recent
+   *
+   * @param {number} maxAge - Milliseconds a response's health stays valid
+   * @returns {Promise<Object>} { healthy, ready }
+   */
+  async checkHealth(maxAge = 5000) {
+    if (!this.health || Date.now() - this.health.at > maxAge) {
+      await this.request(OP_PING);
+    }
+    return { healthy: true, ready: this.health.ready };
+  }
+
+  /**
+   * Detect occupancy with a /detect-occupancy request body
+   *
+   * @param {Object} payload - Request fields including slots
+   * @returns {Promise<Object>} { status, response } as the HTTP endpoint would answer
+   */
+  async detect(payload) {
+    const { slots = [], ...options } = payload;
+    const slotsBuffer = encodeSlots(slots);
+    // The connection remembers layouts, so unchanged slots are sent once
+    const layout = crypto.createHash('sha1').update(slotsBuffer).digest('hex');
+    options.layout = layout;
+    if (this.layouts.has(layout)) {
+      const reply = await this.request(OP_DETECT, options, encodeSlots([]));
+      if (reply.status !== 409) {
+        return reply;
+      }
+    }
+    const reply = await this.request(OP_DETECT, options, slotsBuffer);
+    this.layouts.add(layout);
+    return reply;
+  }
+
+  close() {
+    if (this.socket) {
+      this.socket.end();
+    }
+  }
+}
+
+function encodeString(value) {
+  const data = Buffer.from(String(value), 'utf8');
+  const header = Buffer.alloc(2);
+  header.writeUInt16BE(data.length, 0);
+  return [header, data];
+}
+
+function encodeSlots(slots) {
+  const count = Buffer.alloc(4);
+  count.writeUInt32BE(slots.length, 0);
+  const parts = [count];
+  for (const slot of slots) {
+    const points = slot.coordinates || [];
+    parts.push(...encodeString(slot.slot_id || ''));
+    const record = Buffer.alloc(14 + 16 * points.length);
+    record.writeInt32BE(slot.slot_number || 0, 0);
+    record.writeUInt32BE(slot.image_width || 0, 4);
+    record.writeUInt32BE(slot.image_height || 0, 8);
+    record.writeUInt16BE(points.length, 12);
+    points.forEach(([x, y], i) => {
+      record.writeDoubleBE(x, 14 + 16 * i);
+      record.writeDoubleBE(y, 22 + 16 * i);
+    });
+    parts.push(record);
+  }
+  return Buffer.concat(parts);
+}
+
+function encodeRequest(requestId, op, options, slotsBuffer) {
+  const header = Buffer.alloc(10);
+  header.writeUInt8(PROTOCOL_VERSION, 4);
+  header.writeUInt8(op, 5);
+  header.writeUInt32BE(requestId, 6);
+  const parts = [header];
+  if (op === OP_DETECT) {
+    const json = Buffer.from(JSON.stringify(options || {}), 'utf8');
+    const length = Buffer.alloc(4);
+    length.writeUInt32BE(json.length, 0);
+    parts.push(length, json, slotsBuffer || encodeSlots([]));
+  }
+  const message = Buffer.concat(parts);
+  message.writeUInt32BE(message.length - 4, 0);
+  return message;
+}
+
+function decodeResponse(body) {
+  const status = body.readUInt16BE(1);
+  const requestId = body.readUInt32BE(3);
+  const health = body.readUInt8(7);
+  const metaLength = body.readUInt32BE(8);
+  let offset = 12;
+  const response = JSON.parse(body.toString('utf8', offset, offset + metaLength));
+  offset += metaLength;
+  const count = body.readUInt32BE(offset);
+  offset += 4;
+  const extras = response.extras || {};
+  delete response.extras;
+  const results = [];
+  for (let i = 0; i < count; i++) {
+    const idLength = body.readUInt16BE(offset);
+    offset += 2;
+    const slotId = body.toString('utf8', offset, offset + idLength);
+    offset += idLength;
+    results.push({
+      slot_id: slotId,
+      slot_number: body.readInt32BE(offset),
+      status: STATUS_NAMES[body.readUInt8(offset + 4)] ?? null,
+      occupancy_ratio: body.readDoubleBE(offset + 5),
+      white_pixel_count: body.readUInt32BE(offset + 13),
+      total_area: body.readUInt32BE(offset + 17),
+      confidence: body.readDoubleBE(offset + 21),
+      ...extras[i],
+    });
+    offset += 29;
+  }
+  if (status === 200 && response.success) {
+    response.results = results;
+  }
+  return { requestId, status, health, response };
+}
+
+module.exports = OpenCVSocketClient;
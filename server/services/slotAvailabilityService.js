@@ -91,30 +91,50 @@ class SlotAvailabilityService {
       throw new Error('URL-based images not yet supported. Please use local file paths.');
     }
 
-    // Check if file exists
-    try {
-      await fs.access(imagePath);
-    } catch (error) {
-      throw new Error(`Image file not found: ${imagePath}`);
+    // Check if file exists (camera://, ring:// and replay:// sources are
+    // resolved by the OpenCV service)
+    if (!/^[a-z]+:\/\//.test(imagePath)) {
+      try {
+        await fs.access(imagePath);
+      } catch (error) {
+        throw new Error(`Image file not found: ${imagePath}`);
+      }
     }
 
-    // Call OpenCV service
-    const detectionResults = await opencvService.detectOccupancy(
+    // Call OpenCV service. With the version of the last detection only the
+    // slots whose status changed since then come back; slots not all on
+    // camera (e.g. switched to manual) need a full result set.
+    const allOnCamera = slotsWithCoords.every(slot => slot.source === 'camera');
+    const since = allOnCamera ? parkingLot.cameraResultVersion : null;
+    const detection = await opencvService.detectOccupancyChanges(
       imagePath,
       slotsData,
-      parkingLot.cameraThreshold
+      parkingLot._id.toString(),
+      since,
+      parkingLot.cameraThreshold,
+      parkingLot.cameraCalibration
     );
 
     // Map results to slots and update database
     const updatedSlots = [];
     const slotMap = new Map(slots.map(s => [s._id.toString(), s]));
+    const detected = new Set();
 
-    for (const result of detectionResults) {
+    // A stale response (the frame failed the quality checks) is not a new
+    // detection; neither are unknown or error statuses. Those slots keep
+    // their stored status.
+    const results = detection.stale ? [] : detection.results;
+
+    for (const result of results) {
       const slot = slotMap.get(result.slot_id);
       if (!slot) {
         console.warn(`Slot not found for result slot_id: ${result.slot_id}`);
         continue;
       }
+      if (result.status !== 'occupied' && result.status !== 'vacant') {
+        continue;
+      }
+      detected.add(result.slot_id);
 
       const isOccupied = result.status === 'occupied';
       const previousStatus = slot.isOccupied;
@@ -143,6 +163,27 @@ class SlotAvailabilityService {
       });
     }
 
+    // Slots not detected this time (unchanged since the version sent,
+    // stale response, unknown or error status) keep their stored status
+    for (const slot of slotsWithCoords) {
+      if (detected.has(slot._id.toString())) {
+        continue;
+      }
+      updatedSlots.push({
+        slot_id: slot._id.toString(),
+        slot_number: slot.slotNumber,
+        status: slot.isOccupied ? 'occupied' : 'vacant',
+        source: slot.source || 'manual',
+        confidence: slot.detectionMetadata?.confidence,
+        occupancy_ratio: slot.detectionMetadata?.occupancyRatio,
+      });
+    }
+
+    if (!detection.stale && detection.version && detection.version !== parkingLot.cameraResultVersion) {
+      parkingLot.cameraResultVersion = detection.version;
+      await parkingLot.save();
+    }
+
     // Include slots without coordinates (manual only)
     const slotsWithoutCoords = slots.filter(slot => 
       !slot.coordinates || 